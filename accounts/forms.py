@@ -0,0 +1,8 @@
+from django.contrib.auth.forms import UserCreationForm
+
+from accounts.models import UserModel
+
+
+class RegisterForm(UserCreationForm):
+    class Meta(UserCreationForm.Meta):
+        model = UserModel
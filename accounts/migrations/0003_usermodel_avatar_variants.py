@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usermodel',
+            name='avatar_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Копии аватара'),
+        ),
+    ]
@@ -1,14 +1,23 @@
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser, Group, Permission
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Upper
 
 
 class UserModel(AbstractUser):
     class Meta:
         verbose_name = "Пользователь"
         verbose_name_plural = "Пользователи"
+        indexes = [
+            # Поиск в админках по user__username и email (icontains)
+            GinIndex(OpClass(Upper("username"), name="gin_trgm_ops"), name="user_username_trgm_idx"),
+            GinIndex(OpClass(Upper("email"), name="gin_trgm_ops"), name="user_email_trgm_idx"),
+        ]
 
     avatar = models.ImageField(null=True, blank=True, upload_to='-/users', verbose_name="Аватар")
+    # Размеры аватара и его уменьшенные копии (rental/images.py)
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Копии аватара")
     phone = models.CharField(max_length=20, blank=True, null=True, verbose_name="Телефон")
     address = models.TextField(blank=True, null=True, verbose_name="Адрес")
     date_of_birth = models.DateField(blank=True, null=True, verbose_name="Дата рождения")
@@ -1,9 +1,10 @@
 from django.urls import reverse_lazy
 from django.views.generic.edit import CreateView
-from django.contrib.auth.forms import UserCreationForm
+
+from accounts.forms import RegisterForm
 
 
 class RegisterView(CreateView):
-    form_class = UserCreationForm
+    form_class = RegisterForm
     template_name = 'accounts/register.html'
     success_url = reverse_lazy('login')
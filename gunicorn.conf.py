@@ -0,0 +1,59 @@
+"""
+gunicorn для production: gunicorn -c gunicorn.conf.py
+
+SERVER_MODE=wsgi (по умолчанию) — src.wsgi, gthread-воркеры: потоки
+процесса держат постоянные соединения с базой (src/settings_production.py).
+SERVER_MODE=asgi — src.asgi и ASGI-воркеры gunicorn, async-страницы.
+
+Приложение загружается до fork (preload_app): воркеры стартуют быстро и
+делят память импортированного кода.
+
+Метрики Prometheus (/metrics/) с нескольких воркеров собираются через
+каталог PROMETHEUS_MULTIPROC_DIR: без него каждый ответ /metrics/ —
+счётчики одного случайного воркера.
+"""
+import multiprocessing
+import os
+import shutil
+
+SERVER_MODE = os.environ.get("SERVER_MODE", "wsgi")
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+preload_app = True
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = 30
+keepalive = 5
+# Перезапуск воркера после N запросов ограничивает рост памяти
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "5000"))
+max_requests_jitter = max_requests // 10
+
+if SERVER_MODE == "asgi":
+    wsgi_app = "src.asgi:application"
+    worker_class = "asgi"
+    # Django не поддерживает lifespan-протокол ASGI
+    asgi_lifespan = "off"
+else:
+    wsgi_app = "src.wsgi:application"
+    worker_class = "gthread"
+    threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+
+
+def post_fork(server, worker):
+    # Соединение, открытое мастером при preload, не должно делиться между процессами
+    from django.db import connections
+    connections.close_all()
+
+
+def on_starting(server):
+    # Файлы метрик прошлого запуска сервера иначе суммировались бы с новыми
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,31 +1,228 @@
+import csv
+from datetime import timedelta
+
 from django.contrib import admin
 from django import forms
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.contrib.auth import get_permission_codename
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
 from guardian.admin import GuardedModelAdmin
 from django.contrib.auth.admin import UserAdmin
 from .models import (
-    Dealer, Car, CarLocation, TripTracking, Rental, Transaction, CarReview, Fine
+    Dealer, Car, CarLocation, TripTracking, Rental, Transaction, CarReview, Fine, PricingRule,
+    DailyFleetStats, RollupWatermark,
 )
+from . import exports, ledger, reports
+from .pagination import EstimatedCountPaginator
+from .permissions import object_permissions
+from .search import CAR_SEARCH_FIELDS, filter_cars, matching_car_ids
+
+
+class CarSearchAdminMixin:
+    """
+    Поиск по машине через Car.search_vector (rental/search.py) вместо
+    icontains по её полям. car_search_path — путь от модели админки до Car;
+    остальные search_fields ищутся обычным способом, результаты объединяются.
+    """
+    car_search_path = "car"
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        car_fields = {f"{self.car_search_path}__{field}" for field in CAR_SEARCH_FIELDS}
+        other_fields = [field for field in self.get_search_fields(request) if field not in car_fields]
+        condition = Q(**{f"{self.car_search_path}__in": matching_car_ids(search_term)})
+        for field in other_fields:
+            condition |= Q(**{f"{field}__icontains": search_term})
+        return queryset.filter(condition), False
+
+
+class ObjectPermissionAdminMixin:
+    """
+    Права django-guardian на строки списка. Доступ к админке тот же, что у
+    GuardedModelAdmin, — по правам на модель. Сотруднику с просмотром, но
+    без изменения модели колонка «Ваш доступ» показывает права на каждую
+    строку; права всей страницы загружаются одним prefetch и запоминаются
+    на запрос (rental/permissions.py), поэтому проверки по строкам не ходят
+    в базу.
+    """
+    ACCESS_LABELS = (("view", "просмотр"), ("change", "изменение"), ("delete", "удаление"))
+
+    def object_perm(self, action):
+        return f"{self.opts.app_label}.{get_permission_codename(action, self.opts)}"
+
+    def get_list_display(self, request):
+        list_display = super().get_list_display(request)
+        if self.has_change_permission(request):
+            return list_display
+        perms = object_permissions(request)
+        codenames = [(self.object_perm(action), label) for action, label in self.ACCESS_LABELS]
+
+        @admin.display(description="Ваш доступ")
+        def object_access(obj):
+            return ", ".join(label for perm, label in codenames if perms.has_perm(perm, obj)) or "—"
+
+        return [*list_display, object_access]
+
+    def get_changelist_instance(self, request):
+        changelist = super().get_changelist_instance(request)
+        # Права всех строк страницы — одним запросом до рендеринга
+        object_permissions(request).prefetch(changelist.result_list)
+        return changelist
+
+
+CURSOR_VAR = "cursor"
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Страницы списка по -pk продолжаются с последней показанной строки
+    (pk < курсор) вместо OFFSET, который на дальних страницах читает и
+    выбрасывает все предыдущие строки. Работает при сортировке по умолчанию
+    и без list_editable (формсету нужен queryset), иначе — обычные номера
+    страниц.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        cursor = request.GET.get(CURSOR_VAR)
+        try:
+            self.cursor = int(cursor) if cursor else None
+        except ValueError:
+            raise IncorrectLookupParameters
+        self.next_cursor = None
+        super().__init__(request, *args, **kwargs)
+        # Ссылки фильтров и сортировки начинают список сначала
+        self.params.pop(CURSOR_VAR, None)
+        self.filter_params.pop(CURSOR_VAR, None)
+
+    @property
+    def keyset(self):
+        return ORDER_VAR not in self.params and not self.list_editable
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_results(self, request):
+        if not self.keyset:
+            return super().get_results(request)
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        queryset = self.queryset
+        if self.cursor is not None:
+            queryset = queryset.filter(pk__lt=self.cursor)
+        # Лишняя строка — признак следующей страницы
+        rows = list(queryset[:self.list_per_page + 1])
+        if len(rows) > self.list_per_page:
+            rows = rows[:self.list_per_page]
+            self.next_cursor = rows[-1].pk
+        self.result_list = rows
+        self.result_count = paginator.count
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = self.cursor is not None or self.next_cursor is not None
+        self.paginator = paginator
+
+    def first_page_url(self):
+        return self.get_query_string()
+
+    def next_page_url(self):
+        return self.get_query_string({CURSOR_VAR: self.next_cursor})
+
+
+class LargeTableAdminMixin:
+    """
+    Списки таблиц на десятки миллионов строк: связи, нужные строкам,
+    приходят одним JOIN (list_select_related), число строк выше
+    ADMIN_EXACT_COUNT_LIMIT — оценка планировщика вместо COUNT(*), страницы
+    идут по курсору (KeysetChangeList). Связи в форме — raw_id_fields, а не
+    <select> со всеми строками таблицы.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ["-id"]
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
+class ExportAdminMixin:
+    """
+    Выгрузка выбранных строк или, с «Выбрать все», всего отфильтрованного
+    списка в CSV, NDJSON и Parquet. Ответ идёт потоком порциями серверного
+    курсора (rental/exports.py) — память не зависит от числа строк.
+    """
+    actions = ["export_csv", "export_ndjson", "export_parquet"]
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        if "parquet" not in exports.available_formats():
+            actions.pop("export_parquet", None)
+        return actions
+
+    def export(self, queryset, fmt):
+        name = exports.dataset_for(self.model)
+        return exports.streaming_response(queryset, fmt, f"{name}_{timezone.localdate()}")
+
+    @admin.action(description="Выгрузить в CSV", permissions=["view"])
+    def export_csv(self, request, queryset):
+        return self.export(queryset, "csv")
+
+    @admin.action(description="Выгрузить в NDJSON", permissions=["view"])
+    def export_ndjson(self, request, queryset):
+        return self.export(queryset, "ndjson")
+
+    @admin.action(description="Выгрузить в Parquet", permissions=["view"])
+    def export_parquet(self, request, queryset):
+        return self.export(queryset, "parquet")
 
 
 class RentalForm(forms.ModelForm):
+    # Поля объявлены явно: иначе ModelAdmin подставит SplitDateTimeField,
+    # а одиночный datetime-local с ним не валидируется
+    start_time = forms.DateTimeField(
+        label="Начало аренды",
+        widget=forms.DateTimeInput(attrs={"type": "datetime-local"}, format="%Y-%m-%dT%H:%M"),
+    )
+    end_time = forms.DateTimeField(
+        label="Окончание аренды",
+        widget=forms.DateTimeInput(attrs={"type": "datetime-local"}, format="%Y-%m-%dT%H:%M"),
+    )
+
     class Meta:
         model = Rental
         fields = "__all__"
-        widgets = {
-            "start_time": forms.DateTimeInput(attrs={"type": "datetime-local"}),
-            "end_time": forms.DateTimeInput(attrs={"type": "datetime-local"}),
-        }
+
+    def clean(self):
+        cleaned = super().clean()
+        start, end = cleaned.get("start_time"), cleaned.get("end_time")
+        # Ошибка на поле: тогда validate_constraints() пропустит rental_no_overlap
+        # и не отправит в базу перевёрнутый диапазон
+        if start and end and end <= start:
+            self.add_error("end_time", "Окончание аренды должно быть позже начала")
+        return cleaned
 
 
 @admin.register(Rental)
-class RentalAdmin(GuardedModelAdmin):
+class RentalAdmin(CarSearchAdminMixin, ObjectPermissionAdminMixin, ExportAdminMixin, GuardedModelAdmin):
     form = RentalForm
     list_display = ["id", "user", "car", "get_start_time", "get_end_time", "total_price", "is_paid"]
     list_filter = ["is_paid"]
     search_fields = ["user__username", "car__brand", "car__model"]
     autocomplete_fields = ["user", "car"]
-    readonly_fields = ["total_price"]
-    list_editable = ["is_paid"]
+    # Оплата меняется только вместе с журналом (rental/ledger.py): флаг не
+    # редактируется, оплату проводит действие mark_paid
+    readonly_fields = ["total_price", "is_paid"]
+    actions = ["mark_paid", *ExportAdminMixin.actions]
     ordering = ["-id"]  # Сортировка по ID вместо start_time
     date_hierarchy = None  # Убрали, чтобы не вызывало ошибку
 
@@ -50,23 +247,61 @@ class RentalAdmin(GuardedModelAdmin):
 
     def save_model(self, request, obj, form, change):
         """Пересчитываем итоговую сумму перед сохранением"""
+        # В форме только период: дата и время получения и возврата — из него
+        start, end = timezone.localtime(obj.start_time), timezone.localtime(obj.end_time)
+        obj.pickup_date, obj.pickup_time = start.date(), start.time()
+        obj.dropoff_date, obj.dropoff_time = end.date(), end.time()
         obj.save()
 
+    # Оплата каждой аренды проводится в журнал, флаг ставится одним UPDATE:
+    # save() и сигналы аренды от оплаты не зависят. Снять оплату нельзя —
+    # возвратов в журнале нет.
+
+    @admin.action(description="Провести оплату")
+    def mark_paid(self, request, queryset):
+        with transaction.atomic():
+            rentals = list(queryset.filter(is_paid=False).select_for_update(of=("self",)))
+            for rental in rentals:
+                ledger.pay_rental(rental)
+            Rental.objects.filter(pk__in=[rental.pk for rental in rentals]).update(is_paid=True)
+        self.message_user(request, f"Оплачено аренд: {len(rentals)}")
+
 
 class TransactionForm(forms.ModelForm):
     class Meta:
         model = Transaction
         fields = '__all__'
 
+    def clean_amount(self):
+        # Знак задаёт тип операции, журнал принимает только положительные суммы
+        amount = self.cleaned_data["amount"]
+        if amount is not None and amount <= 0:
+            raise forms.ValidationError("Сумма должна быть положительной")
+        return amount
+
 
 @admin.register(Transaction)
-class TransactionAdmin(admin.ModelAdmin):
+class TransactionAdmin(LargeTableAdminMixin, ExportAdminMixin, admin.ModelAdmin):
     form = TransactionForm
     list_display = ['user', 'amount', 'transaction_type', 'timestamp']  # Убрали 'status'
+    list_select_related = ['user']
     list_filter = ['transaction_type']
     search_fields = ['user__username']
+    raw_id_fields = ['user']
     readonly_fields = ['timestamp']  # 'created_at' нет в модели, но есть 'timestamp'
 
+    def save_model(self, request, obj, form, change):
+        """Операция проводится через журнал вместе с изменением баланса"""
+        saved = ledger.post(obj.user_id, obj.transaction_type, obj.amount, allow_negative=True)
+        obj.pk, obj.timestamp = saved.pk, saved.timestamp
+
+    def has_change_permission(self, request, obj=None):
+        # Журнал только дополняется: исправление — новая операция
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 
 class ReviewForm(forms.ModelForm):
     class Meta:
@@ -75,11 +310,13 @@ class ReviewForm(forms.ModelForm):
 
 
 @admin.register(CarReview)
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(CarSearchAdminMixin, LargeTableAdminMixin, admin.ModelAdmin):
     form = ReviewForm
     list_display = ['user', 'car', 'rating', 'created_at']
+    list_select_related = ['user', 'car']
     list_filter = ['rating']
-    search_fields = ['user__username', 'car__brand']
+    search_fields = ['user__username', 'car__brand', 'car__model']
+    raw_id_fields = ['user', 'car']
     readonly_fields = ['created_at']
 
 
@@ -90,10 +327,15 @@ class FineForm(forms.ModelForm):
 
 
 @admin.register(Fine)
-class FineAdmin(admin.ModelAdmin):
+class FineAdmin(CarSearchAdminMixin, LargeTableAdminMixin, ExportAdminMixin, admin.ModelAdmin):
     form = FineForm
-    list_display = ['user', 'rental', 'amount', 'reason', 'issued_at']  # Убрали 'car'
+    list_display = ['user', 'rental', 'kind', 'amount', 'reason', 'issued_at']  # Убрали 'car'
+    # str(rental) обращается к машине и пользователю аренды
+    list_select_related = ['user', 'rental__car', 'rental__user']
+    list_filter = ['kind']
+    raw_id_fields = ['user', 'rental']
     search_fields = ['user__username', 'rental__car__brand']
+    car_search_path = 'rental__car'
     readonly_fields = ['issued_at']  # Убрали 'created_at'
 
 
@@ -108,7 +350,7 @@ class DealerForm(forms.ModelForm):
 
 
 @admin.register(Dealer)
-class DealerAdmin(GuardedModelAdmin):
+class DealerAdmin(ObjectPermissionAdminMixin, GuardedModelAdmin):
     form = DealerForm
     search_fields = ['name', 'address']
     list_display = ['name', 'address', 'latitude', 'longitude']
@@ -128,14 +370,20 @@ class CarForm(forms.ModelForm):
 
 
 @admin.register(Car)
-class CarAdmin(GuardedModelAdmin):
+class CarAdmin(ObjectPermissionAdminMixin, GuardedModelAdmin):
     form = CarForm
     search_fields = ['brand', 'model']
-    list_display = ['brand', 'model', 'year', 'price_per_hour', 'is_available', 'dealer']
+    list_display = ['brand', 'model', 'year', 'price_per_hour', 'is_available', 'dealer', 'rating_avg', 'review_count']
     list_filter = ['year', 'dealer', 'is_available']
     list_editable = ['is_available', 'price_per_hour']
     autocomplete_fields = ['dealer']
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по search_vector с опечатками, в том числе для автодополнения
+        if not search_term.strip():
+            return queryset, False
+        return filter_cars(queryset, search_term), False
+
 
 class CarLocationForm(forms.ModelForm):
     class Meta:
@@ -144,7 +392,7 @@ class CarLocationForm(forms.ModelForm):
 
 
 @admin.register(CarLocation)
-class CarLocationAdmin(admin.ModelAdmin):
+class CarLocationAdmin(CarSearchAdminMixin, admin.ModelAdmin):
     form = CarLocationForm
     list_display = ['car', 'latitude', 'longitude', 'updated_at']
     search_fields = ['car__brand', 'car__model']
@@ -159,8 +407,112 @@ class TripTrackingForm(forms.ModelForm):
 
 
 @admin.register(TripTracking)
-class TripTrackingAdmin(admin.ModelAdmin):
+class TripTrackingAdmin(LargeTableAdminMixin, ExportAdminMixin, admin.ModelAdmin):
     form = TripTrackingForm
     list_display = ['rental', 'timestamp', 'latitude', 'longitude']
+    list_select_related = ['rental__car', 'rental__user']
     search_fields = ['rental__id']
+    search_help_text = "Номер аренды"
     readonly_fields = ['timestamp']
+    raw_id_fields = ['rental']
+
+    def get_search_results(self, request, queryset, search_term):
+        # Точный номер аренды идёт по индексу (rental, timestamp) в каждой
+        # секции; icontains привёл бы id к тексту и прочитал всю таблицу
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if not term.isdigit():
+            return queryset.none(), False
+        return queryset.filter(rental_id=int(term)), False
+
+
+@admin.register(PricingRule)
+class PricingRuleAdmin(admin.ModelAdmin):
+    list_display = ['name', 'car_type', 'dealer', 'season_start', 'season_end', 'min_hours', 'multiplier', 'is_active']
+    list_filter = ['is_active', 'car_type', 'dealer']
+    search_fields = ['name']
+    readonly_fields = ['updated_at']
+
+
+class FleetReportForm(forms.Form):
+    start = forms.DateField(label="С", widget=forms.DateInput(attrs={"type": "date"}))
+    end = forms.DateField(label="По", widget=forms.DateInput(attrs={"type": "date"}))
+    group_by = forms.ChoiceField(label="Группировка", choices=reports.GROUP_LABELS.items())
+
+    def clean(self):
+        cleaned = super().clean()
+        if cleaned.get("start") and cleaned.get("end") and cleaned["start"] > cleaned["end"]:
+            raise forms.ValidationError("Начало периода позже конца")
+        return cleaned
+
+
+@admin.register(DailyFleetStats)
+class FleetReportAdmin(admin.ModelAdmin):
+    """
+    Панель выручки и загрузки парка вместо списка строк сводки. Читает только
+    сводки (rental/reports.py), так что стоимость не зависит от числа аренд;
+    export/ отдаёт те же данные в CSV по дням, дилерам и типам машин.
+    """
+    change_list_template = "admin/rental/dailyfleetstats/report.html"
+    REPORT_DAYS = 30
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path("export/", self.admin_site.admin_view(self.export_view), name="rental_dailyfleetstats_export"),
+            *super().get_urls(),
+        ]
+
+    def report_params(self, request):
+        """-> (форма, первый день, день после последнего, группировка)"""
+        today = timezone.localdate()
+        initial = {"start": today - timedelta(days=self.REPORT_DAYS - 1), "end": today, "group_by": "dealer"}
+        form = FleetReportForm(request.GET or None, initial=initial)
+        params = form.cleaned_data if form.is_valid() else initial
+        return form, params["start"], params["end"] + timedelta(days=1), params["group_by"]
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        form, start, end, group_by = self.report_params(request)
+        rows = reports.fleet_report(start, end, group_by)
+        for row in rows:
+            row["rented_hours"] = row["rented_seconds"] / 3600
+            row["utilization_percent"] = row["utilization"] * 100
+        types = dict(Transaction.TRANSACTION_TYPES)
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.opts,
+            "title": "Выручка и загрузка парка",
+            "form": form,
+            "rows": rows,
+            "group_label": reports.GROUP_LABELS[group_by],
+            "ledger": [
+                (types.get(kind, kind), amount, operations)
+                for kind, (amount, operations) in reports.ledger_report(start, end).items()
+            ],
+            "watermarks": RollupWatermark.objects.order_by("name"),
+            "export_query": request.GET.urlencode(),
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, self.change_list_template, context)
+
+    def export_view(self, request):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        _, start, end, _ = self.report_params(request)
+        response = HttpResponse(content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="fleet_{start}_{end - timedelta(days=1)}.csv"'
+        writer = csv.writer(response)
+        writer.writerow(reports.EXPORT_HEADER)
+        writer.writerows(reports.export_rows(start, end))
+        return response
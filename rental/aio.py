@@ -0,0 +1,44 @@
+"""
+Параллельные запросы к базе из async-представлений.
+
+Асинхронный ORM Django (aget, acount, async for) выполняет запросы в
+одном потоке на запрос (thread_sensitive), поэтому asyncio.gather над
+ними не даёт параллельности: запросы всё равно идут по очереди. Здесь
+независимые синхронные функции запускаются каждая в своём потоке пула
+ASYNC_DB_WORKERS, у каждого потока — своё соединение с базой. Соединения
+живут по правилам CONN_MAX_AGE, как в обычном запросе.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.ASYNC_DB_WORKERS, thread_name_prefix="async-db")
+    return _executor
+
+
+def _with_connection(func):
+    def run():
+        close_old_connections()
+        try:
+            return func()
+        finally:
+            close_old_connections()
+    return run
+
+
+async def gather_queries(*funcs):
+    """Выполняет функции без аргументов параллельно; результаты в том же порядке"""
+    executor = get_executor()
+    return await asyncio.gather(*(
+        sync_to_async(_with_connection(func), thread_sensitive=False, executor=executor)()
+        for func in funcs
+    ))
@@ -0,0 +1,211 @@
+"""
+JSON API каталога для мобильного приложения.
+
+Строки читаются через values_list только нужных столбцов и сразу
+превращаются в словари — экземпляры моделей не создаются. Параметры:
+    ?fields=id,brand,price_per_hour — набор полей (по умолчанию default_fields)
+    ?limit=50 — размер страницы (до max_limit)
+    ?cursor=<id> — продолжение: строки с id больше курсора; ссылку на
+                   следующую страницу отдаёт поле next
+Ответы сжимаются gzip, если клиент это поддерживает.
+"""
+from bisect import bisect_right
+
+from django.core.files.storage import default_storage
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.gzip import gzip_page
+
+from .availability import get_available_car_ids
+from .forms import ApiAvailabilityForm
+from .models import Car, CarLocation, Dealer
+
+
+def image_url(name):
+    return default_storage.url(name) if name else None
+
+
+def parse_ids(value, limit):
+    ids = [int(item) for item in value.split(",") if item.strip()]
+    if len(ids) > limit:
+        raise ValueError(f"Не больше {limit} id за запрос")
+    return ids
+
+
+class ApiError(Exception):
+    pass
+
+
+@method_decorator(gzip_page, name="dispatch")
+class ApiListView(View):
+    model = None
+    # Имя в ответе -> (поле для values_list, преобразование значения или None)
+    fields = {}
+    default_fields = ()
+    page_size = 50
+    max_limit = 500
+
+    def get_queryset(self):
+        return self.model._default_manager.all()
+
+    def filter_queryset(self, queryset):
+        return queryset
+
+    def get_fields(self):
+        requested = self.request.GET.get("fields")
+        if not requested:
+            return list(self.default_fields)
+        names = [name.strip() for name in requested.split(",") if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ApiError(f"Неизвестные поля: {', '.join(unknown)}. Доступны: {', '.join(self.fields)}")
+        return names
+
+    def get_int_param(self, name, default=None, minimum=0, maximum=None):
+        value = self.request.GET.get(name)
+        if value in (None, ""):
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            raise ApiError(f"{name}: ожидается целое число")
+        if value < minimum or (maximum is not None and value > maximum):
+            raise ApiError(f"{name}: допустимо от {minimum} до {maximum}")
+        return value
+
+    def serialize(self, rows, names):
+        converters = [(index, self.fields[name][1]) for index, name in enumerate(names, 1) if self.fields[name][1]]
+        results = []
+        for row in rows:
+            if converters:
+                row = list(row)
+                for index, convert in converters:
+                    row[index] = convert(row[index])
+            results.append(dict(zip(names, row[1:])))
+        return results
+
+    def get_next_url(self, cursor):
+        params = self.request.GET.copy()
+        params["cursor"] = cursor
+        return f"{self.request.path}?{params.urlencode()}"
+
+    def get(self, request):
+        try:
+            names = self.get_fields()
+            limit = self.get_int_param("limit", self.page_size, minimum=1, maximum=self.max_limit)
+            cursor = self.get_int_param("cursor")
+            queryset = self.filter_queryset(self.get_queryset())
+        except ApiError as e:
+            return JsonResponse({"errors": str(e)}, status=400)
+
+        queryset = queryset.order_by("pk")
+        if cursor is not None:
+            queryset = queryset.filter(pk__gt=cursor)
+        # Первый столбец — pk для курсора; лишняя строка — признак следующей страницы
+        rows = list(queryset.values_list("pk", *(self.fields[name][0] for name in names))[:limit + 1])
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+        return JsonResponse({
+            "results": self.serialize(rows, names),
+            "next": self.get_next_url(rows[-1][0]) if has_next else None,
+        })
+
+
+class CarApiView(ApiListView):
+    """?type=, ?dealer=, ?available=1, ?ids=1,2,3"""
+    model = Car
+    fields = {
+        "id": ("id", None),
+        "brand": ("brand", None),
+        "model": ("model", None),
+        "type": ("type", None),
+        "year": ("year", None),
+        "price_per_hour": ("price_per_hour", str),
+        "is_available": ("is_available", None),
+        "transmission": ("transmission", None),
+        "fuel_type": ("fuel_type", None),
+        "dealer_id": ("dealer_id", None),
+        "image": ("image", image_url),
+        "description": ("description", None),
+        "review_count": ("review_count", None),
+        "rating_avg": ("rating_avg", None),
+    }
+    default_fields = ("id", "brand", "model", "type", "year", "price_per_hour", "is_available", "rating_avg")
+
+    def filter_queryset(self, queryset):
+        params = self.request.GET
+        if params.get("type"):
+            queryset = queryset.filter(type=params["type"])
+        dealer = self.get_int_param("dealer")
+        if dealer is not None:
+            queryset = queryset.filter(dealer_id=dealer)
+        if params.get("available") in ("1", "true"):
+            queryset = queryset.filter(is_available=True)
+        if params.get("ids"):
+            try:
+                queryset = queryset.filter(pk__in=parse_ids(params["ids"], self.max_limit))
+            except ValueError as e:
+                raise ApiError(f"ids: {e}")
+        return queryset
+
+
+class DealerApiView(ApiListView):
+    model = Dealer
+    fields = {
+        "id": ("id", None),
+        "name": ("name", None),
+        "address": ("address", None),
+        "latitude": ("latitude", float),
+        "longitude": ("longitude", float),
+    }
+    default_fields = tuple(fields)
+
+
+class CarLocationApiView(ApiListView):
+    """?car=1,2,3"""
+    model = CarLocation
+    fields = {
+        "car_id": ("car_id", None),
+        "latitude": ("latitude", float),
+        "longitude": ("longitude", float),
+        "updated_at": ("updated_at", None),
+    }
+    default_fields = tuple(fields)
+
+    def filter_queryset(self, queryset):
+        if self.request.GET.get("car"):
+            try:
+                queryset = queryset.filter(car_id__in=parse_ids(self.request.GET["car"], self.max_limit))
+            except ValueError as e:
+                raise ApiError(f"car: {e}")
+        return queryset
+
+
+@method_decorator(gzip_page, name="dispatch")
+class AvailabilityApiView(View):
+    """
+    id машин, свободных на [start, end): ?start=&end=[&type=][&dealer=].
+    Ответ из индекса занятости, без запросов к базе; курсор — последний id.
+    """
+    page_size = 500
+    max_limit = 5000
+
+    def get(self, request):
+        form = ApiAvailabilityForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({"errors": form.errors}, status=400)
+        data = form.cleaned_data
+        car_ids = get_available_car_ids(
+            data["start"], data["end"], car_type=data["type"] or None, dealer_id=data["dealer"],
+        )
+        if data["cursor"] is not None:
+            car_ids = car_ids[bisect_right(car_ids, data["cursor"]):]  # список отсортирован
+        limit = min(data["limit"] or self.page_size, self.max_limit)
+        page = car_ids[:limit]
+        next_url = None
+        if len(car_ids) > limit:
+            params = request.GET.copy()
+            params["cursor"] = page[-1]
+            next_url = f"{request.path}?{params.urlencode()}"
+        return JsonResponse({"results": page, "next": next_url})
@@ -0,0 +1,108 @@
+"""
+Асинхронные версии читающих страниц для работы под ASGI.
+
+Подключаются вместо синхронных, когда ASYNC_VIEWS включена (по умолчанию —
+при запуске через src/asgi.py, см. rental/urls.py). Логика страниц та же:
+классы наследуют синхронные представления и заменяют только get — данные
+читаются асинхронным ORM, а код, который может сходить в базу
+синхронно (индекс занятости, перестройка правил цен), уходит в поток через
+sync_to_async. TemplateResponse Django под ASGI рендерит в потоке, поэтому
+ленивые queryset'ы внутри {% cache %} остаются ленивыми.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+
+from .stats import aget_home_stats
+from .views import (
+    ActiveRentalsView, CarDetailView, CarListView, CarSearchView, CarTypeListView, HomePageView,
+    RentalHistoryView, TransactionHistoryView,
+)
+
+
+class AsyncHomePageView(HomePageView):
+    """Промахи кеша счётчиков досчитываются параллельно (rental/aio.py)"""
+
+    async def get(self, request, *args, **kwargs):
+        self.stats = await aget_home_stats()
+        return self.render_to_response(self.get_context_data(**kwargs))
+
+    def get_stats(self):
+        return self.stats
+
+
+class AsyncConditionalGetMixin:
+    """Async-вариант ConditionalGetMixin: страница собирается в render_page"""
+
+    async def get_async_validators(self):
+        # Валидаторы списка строят индекс занятости — это синхронный ORM
+        return await sync_to_async(self.get_validators)()
+
+    async def get(self, request, *args, **kwargs):
+        etag, last_modified = await self.get_async_validators()
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = await self.render_page()
+        return self.add_validators(response, etag, last_modified)
+
+    async def render_page(self):
+        raise NotImplementedError
+
+
+class AsyncCarListMixin(AsyncConditionalGetMixin):
+    async def render_page(self):
+        # Список id — из индекса занятости, а с фильтрами формы и из базы
+        self.object_list = await sync_to_async(self.get_queryset)()
+        # Машины страницы загружает пагинация; расчёт цен может перестроить таблицу правил
+        context = await sync_to_async(self.get_context_data)()
+        return self.render_to_response(context)
+
+
+class AsyncCarListView(AsyncCarListMixin, CarListView):
+    pass
+
+
+class AsyncCarTypeListView(AsyncCarListMixin, CarTypeListView):
+    pass
+
+
+class AsyncCarSearchView(AsyncCarListMixin, CarSearchView):
+    pass
+
+
+class AsyncCarDetailView(AsyncConditionalGetMixin, CarDetailView):
+    async def render_page(self):
+        try:
+            self.object = await self.get_queryset().aget(pk=self.kwargs["pk"])
+        except self.model.DoesNotExist:
+            raise Http404("Машина не найдена")
+        return self.render_to_response(self.get_context_data(object=self.object))
+
+
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+    """Пользователь загружается через request.auser(): ленивый request.user в async-коде не работает"""
+
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await request.auser()
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        return await super(LoginRequiredMixin, self).dispatch(request, *args, **kwargs)
+
+
+class AsyncKeysetListMixin(AsyncLoginRequiredMixin):
+    async def get(self, request, *args, **kwargs):
+        self.object_list = [obj async for obj in self.get_queryset()]
+        return self.render_to_response(self.get_context_data())
+
+
+class AsyncRentalHistoryView(AsyncKeysetListMixin, RentalHistoryView):
+    pass
+
+
+class AsyncTransactionHistoryView(AsyncKeysetListMixin, TransactionHistoryView):
+    pass
+
+
+class AsyncActiveRentalsView(AsyncKeysetListMixin, ActiveRentalsView):
+    pass
@@ -0,0 +1,293 @@
+"""
+Индекс занятости машин.
+
+Для каждой машины хранится отсортированный календарь бронирований
+(полуинтервалы [start, end) в секундах epoch). Проверка «свободна ли машина»
+выполняется бинарным поиском, поэтому поиск не сканирует таблицу Rental.
+Индекс живёт в памяти процесса, строится лениво и поддерживается сигналами
+(см. rental/signals.py). Изменения других процессов индекс узнаёт по
+версии занятости в общем кеше (rental/catalog_cache.py), которую те же
+сигналы сдвигают после коммита: версия отличается от запомненной при
+построении — индекс перестраивается из базы, как правила цен в
+rental/pricing.py. AVAILABILITY_INDEX_TTL остаётся страховкой на случай
+записей мимо сигналов (update(), raw SQL).
+
+Новый индекс загружается из базы без блокировки: поиск в это время
+отвечает по старому, а изменения из сигналов, пришедшие за время загрузки,
+записываются и повторяются на новом индексе перед подменой. Ждёт только
+самый первый поиск процесса — отвечать ему не по чему.
+
+Поиск перебирает машины-кандидаты (после фильтров по типу и дилеру) с
+проверкой календаря за O(log n): свободными может оказаться весь парк,
+так что ответ линеен по числу кандидатов, но таблицу Rental он не читает.
+"""
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils import timezone
+
+from .catalog_cache import get_availability_version
+
+
+def to_timestamp(value):
+    """datetime -> секунды epoch (float)"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    return value.timestamp()
+
+
+class BookingCalendar:
+    """Бронирования одной машины, отсортированные по началу."""
+
+    __slots__ = ("starts", "ends", "rental_ids", "_max_ends")
+
+    def __init__(self, intervals=()):
+        intervals = sorted(intervals)
+        self.starts = [start for start, _, _ in intervals]
+        self.ends = [end for _, end, _ in intervals]
+        self.rental_ids = [rental_id for _, _, rental_id in intervals]
+        self._max_ends = []
+        self._rebuild_from(0)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _rebuild_from(self, index):
+        """Префиксный максимум окончаний — позволяет отвечать за O(log n)
+        даже если интервалы пересекаются (старые двойные брони)."""
+        del self._max_ends[index:]
+        current = self._max_ends[index - 1] if index else None
+        for end in self.ends[index:]:
+            if current is None or end > current:
+                current = end
+            self._max_ends.append(current)
+
+    def add(self, rental_id, start, end):
+        self.remove(rental_id)
+        index = bisect_right(self.starts, start)
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+        self.rental_ids.insert(index, rental_id)
+        self._rebuild_from(index)
+
+    def remove(self, rental_id):
+        try:
+            index = self.rental_ids.index(rental_id)
+        except ValueError:
+            return False
+        del self.starts[index]
+        del self.ends[index]
+        del self.rental_ids[index]
+        self._rebuild_from(index)
+        return True
+
+    def is_free(self, start, end):
+        """Нет ли бронирований, пересекающих [start, end)"""
+        index = bisect_left(self.starts, end)
+        return index == 0 or self._max_ends[index - 1] <= start
+
+
+class AvailabilityIndex:
+    """Поиск свободных машин по диапазону дат, типу и дилеру."""
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        # Один поток строит индекс, остальные тем временем ищут по старому
+        self._build_lock = threading.Lock()
+        self._built_at = None
+        # Версия занятости из общего кеша, с которой построен индекс
+        self._version = None
+        # Изменения, пришедшие во время build(): (метод, аргументы)
+        self._pending = None
+        self._generation = 0
+        self._reset()
+
+    def _reset(self):
+        self._cars = {}  # car_id -> (type, dealer_id, is_available)
+        self._by_type = defaultdict(set)
+        self._by_dealer = defaultdict(set)
+        self._calendars = {}  # car_id -> BookingCalendar
+        self._rental_cars = {}  # rental_id -> car_id
+
+    @property
+    def is_built(self):
+        return self._built_at is not None
+
+    def load(self, cars, rentals):
+        """
+        Заполняет индекс целиком.
+        cars — итерируемое (car_id, type, dealer_id, is_available),
+        rentals — итерируемое (rental_id, car_id, start, end).
+        """
+        grouped = defaultdict(list)
+        rental_cars = {}
+        for rental_id, car_id, start, end in rentals:
+            grouped[car_id].append((to_timestamp(start), to_timestamp(end), rental_id))
+            rental_cars[rental_id] = car_id
+
+        with self._lock:
+            self._reset()
+            for car_id, car_type, dealer_id, is_available in cars:
+                self._set_car(car_id, car_type, dealer_id, is_available)
+            self._calendars = {car_id: BookingCalendar(items) for car_id, items in grouped.items()}
+            self._rental_cars = rental_cars
+            self._built_at = time.monotonic()
+
+    def build(self):
+        """
+        Строит индекс из базы и подменяет им текущий. Закончившиеся аренды
+        не загружаются.
+        """
+        from .models import Car, Rental
+
+        with self._lock:
+            self._pending = []
+            generation = self._generation
+        # Версия читается до загрузки: изменение во время неё даст ещё одну перестройку
+        version = get_availability_version()
+        fresh = AvailabilityIndex(ttl=self.ttl)
+        try:
+            cars = Car.objects.values_list("id", "type", "dealer_id", "is_available")
+            rentals = (
+                Rental.objects.filter(end_time__gt=timezone.now())
+                .values_list("id", "car_id", "start_time", "end_time")
+                .iterator(chunk_size=10000)
+            )
+            fresh.load(cars.iterator(chunk_size=10000), rentals)
+            with self._lock:
+                # invalidate() во время загрузки: данные могли устареть
+                if generation != self._generation:
+                    return
+                for name, args in self._pending:
+                    getattr(fresh, name)(*args)
+                self._cars, self._by_type, self._by_dealer = fresh._cars, fresh._by_type, fresh._by_dealer
+                self._calendars, self._rental_cars = fresh._calendars, fresh._rental_cars
+                self._built_at = fresh._built_at
+                self._version = version
+        finally:
+            with self._lock:
+                self._pending = None
+
+    def is_stale(self):
+        ttl = self.ttl
+        if ttl is None:
+            ttl = getattr(settings, "AVAILABILITY_INDEX_TTL", 300)
+        built_at = self._built_at
+        if built_at is None or bool(ttl and time.monotonic() - built_at > ttl):
+            return True
+        return self._version != get_availability_version()
+
+    def ensure_built(self):
+        if not self.is_stale():
+            return
+        if self.is_built:
+            # Устаревший индекс остаётся в работе, пока другой поток строит новый
+            if not self._build_lock.acquire(blocking=False):
+                return
+        else:
+            self._build_lock.acquire()
+        try:
+            if self.is_stale():
+                self.build()
+        finally:
+            self._build_lock.release()
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._built_at = None
+            self._reset()
+
+    def _record(self, name, *args):
+        """Запоминает изменение для индекса, который сейчас строится"""
+        if self._pending is not None:
+            self._pending.append((name, args))
+
+    def _set_car(self, car_id, car_type, dealer_id, is_available):
+        previous = self._cars.get(car_id)
+        if previous is not None:
+            self._by_type[previous[0]].discard(car_id)
+            self._by_dealer[previous[1]].discard(car_id)
+        self._cars[car_id] = (car_type, dealer_id, is_available)
+        self._by_type[car_type].add(car_id)
+        self._by_dealer[dealer_id].add(car_id)
+
+    def update_car(self, car_id, car_type, dealer_id, is_available):
+        with self._lock:
+            self._record("update_car", car_id, car_type, dealer_id, is_available)
+            if self.is_built:
+                self._set_car(car_id, car_type, dealer_id, is_available)
+
+    def remove_car(self, car_id):
+        with self._lock:
+            self._record("remove_car", car_id)
+            previous = self._cars.pop(car_id, None)
+            if previous is not None:
+                self._by_type[previous[0]].discard(car_id)
+                self._by_dealer[previous[1]].discard(car_id)
+            calendar = self._calendars.pop(car_id, None)
+            if calendar is not None:
+                for rental_id in calendar.rental_ids:
+                    self._rental_cars.pop(rental_id, None)
+
+    def update_rental(self, rental_id, car_id, start, end):
+        with self._lock:
+            self._record("update_rental", rental_id, car_id, start, end)
+            if not self.is_built:
+                return
+            self._remove_rental(rental_id)
+            calendar = self._calendars.get(car_id)
+            if calendar is None:
+                calendar = self._calendars[car_id] = BookingCalendar()
+            calendar.add(rental_id, to_timestamp(start), to_timestamp(end))
+            self._rental_cars[rental_id] = car_id
+
+    def remove_rental(self, rental_id):
+        with self._lock:
+            self._record("remove_rental", rental_id)
+            self._remove_rental(rental_id)
+
+    def _remove_rental(self, rental_id):
+        car_id = self._rental_cars.pop(rental_id, None)
+        calendar = self._calendars.get(car_id)
+        if calendar is not None:
+            calendar.remove(rental_id)
+
+    def search(self, start, end, car_type=None, dealer_id=None):
+        """Отсортированный список id машин, свободных на [start, end)"""
+        start, end = to_timestamp(start), to_timestamp(end)
+        with self._lock:
+            if car_type and dealer_id:
+                by_type = self._by_type.get(car_type, ())
+                by_dealer = self._by_dealer.get(dealer_id, ())
+                if len(by_type) > len(by_dealer):
+                    by_type, by_dealer = by_dealer, by_type
+                candidates = [car_id for car_id in by_type if car_id in by_dealer]
+            elif car_type:
+                candidates = self._by_type.get(car_type, ())
+            elif dealer_id:
+                candidates = self._by_dealer.get(dealer_id, ())
+            else:
+                candidates = self._cars.keys()
+
+            result = []
+            for car_id in candidates:
+                if not self._cars[car_id][2]:
+                    continue
+                calendar = self._calendars.get(car_id)
+                if calendar is None or calendar.is_free(start, end):
+                    result.append(car_id)
+        result.sort()
+        return result
+
+
+availability_index = AvailabilityIndex()
+
+
+def get_available_car_ids(start, end, car_type=None, dealer_id=None):
+    availability_index.ensure_built()
+    return availability_index.search(start, end, car_type=car_type, dealer_id=dealer_id)
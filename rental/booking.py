@@ -0,0 +1,46 @@
+"""
+Оформление брони без двойного бронирования.
+
+Гарантию даёт ограничение-исключение rental_no_overlap в базе (см. Rental.Meta):
+для одной машины периоды [start_time, end_time) не могут пересекаться.
+Перед вставкой выполняется дешёвая проверка по индексу (car, end_time),
+чтобы типичный случай «уже занято» отсекался без неудачного INSERT.
+С pay=True оплата проводится через журнал (rental/ledger.py) в той же
+транзакции, что и бронь.
+"""
+from django.db import IntegrityError, transaction
+
+from . import ledger
+from .models import Rental
+
+NO_OVERLAP_CONSTRAINT = "rental_no_overlap"
+
+class BookingConflict(Exception):
+    """Машина уже забронирована на пересекающийся период"""
+
+
+def overlapping_rentals(car_id, start, end, exclude_pk=None):
+    qs = Rental.objects.filter(car_id=car_id, end_time__gt=start, start_time__lt=end)
+    if exclude_pk is not None:
+        qs = qs.exclude(pk=exclude_pk)
+    return qs
+
+
+def book_car(rental, pay=False):
+    """Сохраняет бронь (и с pay — оплату) или бросает BookingConflict"""
+    rental.fill_period()
+    if overlapping_rentals(rental.car_id, rental.start_time, rental.end_time, rental.pk).exists():
+        raise BookingConflict
+    try:
+        with transaction.atomic():
+            if pay:
+                rental.is_paid = True
+            rental.save()
+            if pay:
+                ledger.pay_rental(rental)
+    except IntegrityError as e:
+        # Конкурентная бронь успела раньше — сработало ограничение в базе
+        if NO_OVERLAP_CONSTRAINT in str(e):
+            raise BookingConflict from e
+        raise
+    return rental
@@ -0,0 +1,88 @@
+"""
+Версии каталога для кеша фрагментов и условных GET.
+
+У каждой машины в кеше лежит версия — время последнего изменения в
+наносекундах. Её сдвигают сигналы Car и CarReview (см.
+rental/signals.py), и она входит в ключ фрагмента {% cache %} карточки и
+страницы машины: изменённая машина просто получает новый ключ, старые
+фрагменты вытесняются по таймауту. Та же версия даёт ETag и Last-Modified,
+так что повторный запрос без изменений отвечает 304 без рендеринга.
+
+Версия каталога в целом сдвигается при любом изменении машины (списки,
+фильтры по оценке), версия занятости — при изменении аренд. Позиция машины
+(CarLocation) на страницах каталога не выводится и версий не сдвигает:
+телеметрия обновляет её постоянно. Версия удалённой машины удаляется,
+чтобы её ETag не давал 304 вместо 404.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+
+CAR_VERSION_KEY = "catalog:car:{}:version"
+CATALOG_VERSION_KEY = "catalog:version"
+AVAILABILITY_VERSION_KEY = "catalog:availability_version"
+
+
+def new_version():
+    return time.time_ns()
+
+
+def version_to_timestamp(version):
+    """Версия -> секунды epoch для Last-Modified"""
+    return version // 1_000_000_000
+
+
+def get_car_versions(car_ids, create=True):
+    """{car_id: версия} одним get_many; недостающие заводятся, если create"""
+    keys = {CAR_VERSION_KEY.format(car_id): car_id for car_id in car_ids}
+    cached = cache.get_many(keys)
+    versions = {keys[key]: version for key, version in cached.items()}
+    missing = {key: new_version() for key in keys if key not in cached}
+    if missing and create:
+        cache.set_many(missing, None)
+        versions.update({keys[key]: version for key, version in missing.items()})
+    return versions
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        version = new_version()
+        cache.add(key, version, None)
+        version = cache.get(key, version)
+    return version
+
+
+def get_catalog_version():
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def get_availability_version():
+    return get_version(AVAILABILITY_VERSION_KEY)
+
+
+def bump_cars(car_ids):
+    """Новая версия машинам и каталогу"""
+    version = new_version()
+    values = {CAR_VERSION_KEY.format(car_id): version for car_id in car_ids if car_id is not None}
+    values[CATALOG_VERSION_KEY] = version
+    cache.set_many(values, None)
+
+
+def bump_car(car_id):
+    bump_cars([car_id])
+
+
+def forget_car(car_id):
+    """Удалённая машина: версии нет, каталог получает новую"""
+    cache.delete(CAR_VERSION_KEY.format(car_id))
+    cache.set(CATALOG_VERSION_KEY, new_version(), None)
+
+
+def bump_availability():
+    cache.set(AVAILABILITY_VERSION_KEY, new_version(), None)
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
@@ -0,0 +1,240 @@
+"""
+Потоковая выгрузка аренд, операций, штрафов и точек трекинга.
+
+Строки читаются серверным курсором порциями по EXPORT_CHUNK_SIZE
+(QuerySet.iterator) и сразу кодируются в CSV, NDJSON или Parquet, так что
+память процесса не зависит от числа строк: в ней одна порция (для
+Parquet — одна группа строк PARQUET_ROW_GROUP). Parquet доступен, если
+установлен pyarrow.
+
+На PostgreSQL выгрузка идёт в отдельной транзакции REPEATABLE READ,
+READ ONLY: курсор без WITH HOLD не материализуется на сервере целиком, а все
+порции видят один снимок базы. Внутри уже открытой транзакции (тесты,
+ATOMIC_REQUESTS) строки читаются в ней.
+
+stream() — генератор байтов для файла (команда export_data),
+streaming_response() — ответ для админки. Под ASGI синхронный генератор
+StreamingHttpResponse сначала собрал бы в список целиком, поэтому там
+каждая порция читается через sync_to_async в потоке запроса — в том же,
+где открыт курсор.
+
+Архивные секции трекинга (rental/tracking.py) уже лежат файлами и сюда не
+попадают.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections, transaction
+from django.http import StreamingHttpResponse
+
+from .models import Fine, Rental, Transaction, TripTracking
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Набор -> (модель, поля, поле даты для --since/--until, порядок строк).
+# У аренд нет личных и платёжных данных клиента: ФИО, телефона, адреса и карты.
+DATASETS = {
+    "rentals": (
+        Rental,
+        ("id", "user_id", "car_id", "start_time", "end_time", "city", "pickup_location", "dropoff_location",
+         "payment_method", "is_paid", "total_price"),
+        "start_time",
+        ("pk",),
+    ),
+    "transactions": (
+        Transaction, ("id", "user_id", "transaction_type", "amount", "timestamp"), "timestamp", ("pk",),
+    ),
+    "fines": (
+        Fine, ("id", "user_id", "rental_id", "kind", "amount", "reason", "issued_at"), "issued_at", ("pk",),
+    ),
+    # Точки одной аренды подряд — по индексу (rental, timestamp) каждой секции
+    "tracking": (
+        TripTracking, ("id", "rental_id", "timestamp", "latitude", "longitude"), "timestamp",
+        ("rental_id", "timestamp"),
+    ),
+}
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+# Строк в группе Parquet: мелкие группы плохо сжимаются и медленно читаются
+PARQUET_ROW_GROUP = 50_000
+
+
+def available_formats():
+    formats = ["csv", "ndjson"]
+    if pyarrow is not None:
+        formats.append("parquet")
+    return formats
+
+
+def dataset_for(model):
+    for name, (dataset_model, *_) in DATASETS.items():
+        if dataset_model is model:
+            return name
+    raise LookupError(f"Нет выгрузки для {model.__name__}")
+
+
+def iter_batches(queryset, fields, chunk_size):
+    """Списки кортежей по chunk_size строк из серверного курсора"""
+    connection = connections[queryset.db]
+    snapshot = connection.vendor == "postgresql" and not connection.in_atomic_block
+    with transaction.atomic(using=queryset.db):
+        if snapshot:
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+        while batch := list(islice(rows, chunk_size)):
+            yield batch
+
+
+def plain(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_csv(batches, fields, model):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for batch in batches:
+        writer.writerows([[plain(value) for value in row] for row in batch])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def encode_ndjson(batches, fields, model):
+    for batch in batches:
+        lines = [
+            json.dumps({field: plain(value) for field, value in zip(fields, row)}, ensure_ascii=False)
+            for row in batch
+        ]
+        yield ("\n".join(lines) + "\n").encode()
+
+
+class ChunkSink(io.RawIOBase):
+    """Файл для ParquetWriter: записанные байты забираются take()"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_type(field):
+    if field.is_relation:
+        field = field.target_field
+    kind = field.get_internal_type()
+    if kind in ("AutoField", "BigAutoField", "IntegerField", "BigIntegerField", "PositiveIntegerField",
+                "PositiveBigIntegerField"):
+        return pyarrow.int64()
+    if kind == "DecimalField":
+        return pyarrow.decimal128(field.max_digits, field.decimal_places)
+    if kind == "DateTimeField":
+        return pyarrow.timestamp("us", tz="UTC")
+    if kind == "DateField":
+        return pyarrow.date32()
+    if kind == "TimeField":
+        return pyarrow.time64("us")
+    if kind == "BooleanField":
+        return pyarrow.bool_()
+    if kind == "FloatField":
+        return pyarrow.float64()
+    return pyarrow.string()
+
+
+def parquet_table(rows, schema):
+    columns = zip(*rows)
+    return pyarrow.Table.from_arrays(
+        [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema,
+    )
+
+
+def encode_parquet(batches, fields, model):
+    # get_field находит и по attname: user_id -> ForeignKey user
+    schema = pyarrow.schema([(name, parquet_type(model._meta.get_field(name))) for name in fields])
+    sink = ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema, compression="zstd")
+    rows = []
+    try:
+        for batch in batches:
+            rows.extend(batch)
+            if len(rows) >= PARQUET_ROW_GROUP:
+                writer.write_table(parquet_table(rows, schema))
+                rows = []
+                yield sink.take()
+        if rows:
+            writer.write_table(parquet_table(rows, schema))
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+ENCODERS = {
+    "csv": encode_csv,
+    "ndjson": encode_ndjson,
+    "parquet": encode_parquet,
+}
+
+
+def stream(queryset, fmt, fields=None, chunk_size=None):
+    """Байты выгрузки queryset в формате fmt; fields по умолчанию — из DATASETS"""
+    if fmt not in available_formats():
+        raise ValueError(f"Формат {fmt} недоступен")
+    if fields is None:
+        fields = DATASETS[dataset_for(queryset.model)][1]
+    batches = iter_batches(queryset, fields, chunk_size or settings.EXPORT_CHUNK_SIZE)
+    return ENCODERS[fmt](batches, fields, queryset.model)
+
+
+async def aiterate(chunks):
+    """Порции синхронного генератора для ASGI, по одной в потоке запроса"""
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    try:
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+    finally:
+        # Клиент мог оборвать загрузку: транзакцию и курсор закрывает тот же поток
+        await sync_to_async(chunks.close, thread_sensitive=True)()
+
+
+def streaming_response(queryset, fmt, filename, fields=None):
+    chunks = stream(queryset, fmt, fields)
+    response = StreamingHttpResponse(
+        aiterate(chunks) if settings.ASYNC_VIEWS else chunks, content_type=CONTENT_TYPES[fmt],
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{fmt}"'
+    return response
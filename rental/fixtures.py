@@ -0,0 +1,290 @@
+"""
+Генератор данных production-масштаба для нагрузочных тестов.
+
+Одинаковые seed, размеры и now дают одинаковые данные. Объекты, чьи id нужны
+дальше (дилеры, машины, пользователи, аренды), создаются bulk_create
+пачками; журналы (отзывы, операции, штрафы, точки трекинга) грузятся
+COPY — так же, как приём телеметрии (rental/telemetry.py), и заодно с
+заданными датами, которые bulk_create затёр бы auto_now_add.
+
+Аренды у каждой машины идут подряд без пересечений (ограничение
+rental_no_overlap), балансы пользователей сходятся с журналом операций.
+Вход для всех пользователей — пароль PASSWORD.
+"""
+import csv
+import io
+import random
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts.models import UserModel
+from . import catalog_cache, stats, tracking
+from .availability import availability_index
+from .geo import grid_cell
+from .models import Car, CarLocation, CarReview, Dealer, Fine, Rental, Transaction, TripTracking
+from .ratings import rebuild_car_ratings
+
+PASSWORD = "fixture"
+USERNAME_PREFIX = "fixture"
+
+CENTER = (43.238949, 76.889709)
+MODELS = {
+    "Toyota": ["Camry", "Corolla", "RAV4", "Land Cruiser", "Prius"],
+    "Hyundai": ["Sonata", "Elantra", "Tucson", "Santa Fe", "Accent"],
+    "Kia": ["Rio", "K5", "Sportage", "Sorento", "Carnival"],
+    "BMW": ["X5", "X3", "320i", "530i", "Z4"],
+    "Mercedes-Benz": ["E200", "C180", "GLE", "V-Class", "SL"],
+    "Chevrolet": ["Cobalt", "Malibu", "Tahoe", "Captiva", "Spark"],
+    "Lexus": ["RX 350", "ES 250", "LX 600", "NX 200", "IS 300"],
+    "Volkswagen": ["Polo", "Passat", "Tiguan", "Touareg", "Golf"],
+}
+DESCRIPTIONS = [
+    "Экономичный городской автомобиль, удобная парковка",
+    "Просторный салон, подходит для поездок всей семьёй",
+    "Полный привод, уверенно едет в горы и по бездорожью",
+    "Комфортный автомобиль для деловых встреч",
+    "Кондиционер, подогрев сидений, камера заднего вида",
+]
+COMMENTS = ["Всё отлично", "Чистая машина", "Немного шумная", "Рекомендую", "Были проблемы с выдачей", ""]
+
+
+@dataclass
+class FixtureSizes:
+    dealers: int = 50
+    cars: int = 2_000
+    users: int = 10_000
+    rentals: int = 100_000
+    reviews: int = 30_000
+    fines: int = 5_000
+    tracked_rentals: int = 2_000
+    points: int = 2_000_000
+    days: int = 365
+
+
+def copy_rows(model, fields, rows):
+    """Грузит строки в таблицу модели через COPY. rows — кортежи значений полей fields."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    buffer.seek(0)
+    opts = model._meta
+    quote = connection.ops.quote_name
+    model_fields = [opts.get_field(name) for name in fields]
+    columns = ", ".join(quote(field.column) for field in model_fields)
+    # csv.writer пишет "" и None одинаково — пустым полем, а COPY читает его как NULL.
+    # Для NOT NULL столбцов пустое поле — пустая строка (например, отзыв без текста).
+    not_null = ", ".join(quote(field.column) for field in model_fields if not field.null)
+    options = f"FORMAT csv, FORCE_NOT_NULL ({not_null})" if not_null else "FORMAT csv"
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {quote(opts.db_table)} ({columns}) FROM STDIN WITH ({options})", buffer)
+    return count
+
+
+class FixtureGenerator:
+    def __init__(self, sizes, seed=0, batch_size=5000, now=None, log=None):
+        self.sizes = sizes
+        self.seed = seed
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        self.random = random.Random(seed)
+        self.now = (now or timezone.now()).replace(minute=0, second=0, microsecond=0)
+        self.start = self.now - timedelta(days=sizes.days)
+
+    def generate(self):
+        if connection.vendor != "postgresql":
+            raise RuntimeError("Генератор грузит журналы через COPY и работает только с PostgreSQL")
+        if UserModel.objects.filter(username__startswith=f"{USERNAME_PREFIX}{self.seed}_").exists():
+            raise RuntimeError(f"Данные с seed={self.seed} уже загружены")
+        with transaction.atomic():
+            dealers = self.create_dealers()
+            cars = self.create_cars(dealers)
+            users = self.create_users()
+            rentals = self.create_rentals(cars, users)
+            self.create_reviews(rentals)
+            self.create_transactions(users, rentals)
+            self.create_fines(rentals)
+        # Трекинг грузится вне общей транзакции: миллионы строк, секции по месяцам
+        self.create_tracking(rentals)
+        self.refresh()
+
+    def batches(self, items):
+        for offset in range(0, len(items), self.batch_size):
+            yield items[offset:offset + self.batch_size]
+
+    def bulk_create(self, model, objects):
+        created = []
+        for batch in self.batches(objects):
+            created.extend(model.objects.bulk_create(batch))
+        self.log(f"{model._meta.verbose_name_plural}: {len(created)}")
+        return created
+
+    def point_near(self, spread):
+        return (
+            round(CENTER[0] + self.random.uniform(-spread, spread), 6),
+            round(CENTER[1] + self.random.uniform(-spread, spread), 6),
+        )
+
+    def create_dealers(self):
+        dealers = []
+        for i in range(self.sizes.dealers):
+            latitude, longitude = self.point_near(0.5)
+            dealers.append(Dealer(
+                name=f"Дилер {self.seed}-{i}", address=f"ул. Абая, {i + 1}",
+                latitude=latitude, longitude=longitude, grid_cell=grid_cell(latitude, longitude),
+            ))
+        return self.bulk_create(Dealer, dealers)
+
+    def create_cars(self, dealers):
+        rnd = self.random
+        brands = list(MODELS)
+        cars = []
+        for _ in range(self.sizes.cars):
+            brand = rnd.choice(brands)
+            cars.append(Car(
+                brand=brand, model=rnd.choice(MODELS[brand]), type=rnd.choice(Car.CarType.values),
+                year=rnd.randint(2012, 2025), price_per_hour=Decimal(rnd.randrange(1500, 25000, 100)),
+                is_available=rnd.random() < 0.9, description=rnd.choice(DESCRIPTIONS),
+                dealer=rnd.choice(dealers) if dealers and rnd.random() < 0.95 else None,
+                transmission=rnd.choice(Car.TransmissionTypes.values), fuel_type=rnd.choice(Car.FuelTypes.values),
+            ))
+        cars = self.bulk_create(Car, cars)
+        locations = []
+        for car in cars:
+            latitude, longitude = self.point_near(0.3)
+            locations.append(CarLocation(
+                car=car, latitude=latitude, longitude=longitude, grid_cell=grid_cell(latitude, longitude),
+            ))
+        self.bulk_create(CarLocation, locations)
+        return cars
+
+    def create_users(self):
+        # Один хеш на всех: PBKDF2 на каждого пользователя занял бы минуты
+        password = make_password(PASSWORD)
+        users = [
+            UserModel(
+                username=f"{USERNAME_PREFIX}{self.seed}_{i}", email=f"{USERNAME_PREFIX}{self.seed}_{i}@example.com",
+                password=password, phone=f"+7701{i:07d}"[:20],
+            )
+            for i in range(self.sizes.users)
+        ]
+        return self.bulk_create(UserModel, users)
+
+    def create_rentals(self, cars, users):
+        """Аренды машин подряд от начала периода; последние могут идти сейчас или быть впереди"""
+        rnd = self.random
+        per_car = max(1, self.sizes.rentals // max(1, len(cars)))
+        span = (self.now + timedelta(days=7) - self.start) / per_car
+        rentals = []
+        for car in cars:
+            cursor = self.start + timedelta(hours=rnd.randint(0, 48))
+            for _ in range(per_car):
+                if len(rentals) >= self.sizes.rentals:
+                    break
+                hours = rnd.randint(2, max(3, int(span.total_seconds() // 3600 * 0.7)))
+                start, end = cursor, cursor + timedelta(hours=hours)
+                cursor = end + timedelta(hours=rnd.randint(1, max(2, int(span.total_seconds() // 3600 * 0.3))))
+                rentals.append(Rental(
+                    user=rnd.choice(users), car=car, start_time=start, end_time=end,
+                    full_name="Фикстура", phone_number="+77010000000", address="-", city="Алматы",
+                    pickup_location="-", pickup_date=start.date(), pickup_time=start.time(),
+                    dropoff_location="-", dropoff_date=end.date(), dropoff_time=end.time(),
+                    payment_method=rnd.choice(["CARD", "PAYPAL", "BITCOIN"]),
+                    is_paid=end < self.now, total_price=car.price_per_hour * hours,
+                ))
+        return self.bulk_create(Rental, rentals)
+
+    def finished(self, rentals):
+        return [rental for rental in rentals if rental.end_time < self.now]
+
+    def create_reviews(self, rentals):
+        rnd = self.random
+        finished = self.finished(rentals)
+        chosen = rnd.sample(finished, min(self.sizes.reviews, len(finished)))
+        count = copy_rows(CarReview, ("user", "car", "rating", "comment", "created_at"), (
+            (rental.user_id, rental.car_id, rnd.choice([1, 2, 3, 4, 4, 5, 5, 5]), rnd.choice(COMMENTS),
+             (rental.end_time + timedelta(hours=rnd.randint(1, 72))).isoformat())
+            for rental in chosen
+        ))
+        self.log(f"Отзывы: {count}")
+        rebuild_car_ratings()
+
+    def create_transactions(self, users, rentals):
+        """Пополнение перед каждой оплаченной арендой и её оплата; баланс = сумма журнала"""
+        rnd = self.random
+        balances = {user.pk: Decimal("0") for user in users}
+        rows = []
+        for rental in sorted(self.finished(rentals), key=lambda rental: rental.start_time):
+            top_up = rental.total_price + Decimal(rnd.randrange(0, 20000, 500))
+            rows.append((rental.user_id, "TOP_UP", top_up, (rental.start_time - timedelta(minutes=30)).isoformat()))
+            rows.append((rental.user_id, "RENTAL", rental.total_price, rental.start_time.isoformat()))
+            balances[rental.user_id] += top_up - rental.total_price
+        count = copy_rows(Transaction, ("user", "transaction_type", "amount", "timestamp"), rows)
+        self.log(f"Операции: {count}")
+        for user in users:
+            user.balance = balances[user.pk]
+        for batch in self.batches(users):
+            UserModel.objects.bulk_update(batch, ["balance"])
+
+    def create_fines(self, rentals):
+        rnd = self.random
+        finished = self.finished(rentals)
+        chosen = rnd.sample(finished, min(self.sizes.fines, len(finished)))
+        reasons = {
+            Fine.Kind.SPEEDING: "Превышение скорости",
+            Fine.Kind.GEOFENCE: "Выезд за геозону",
+            Fine.Kind.MANUAL: "Повреждение салона",
+        }
+        rows = []
+        for rental in chosen:
+            kind = rnd.choice(list(reasons))
+            amount = Decimal(rnd.randrange(5000, 50000, 1000))
+            rows.append((rental.user_id, rental.pk, amount, reasons[kind], kind.value, rental.end_time.isoformat()))
+        count = copy_rows(Fine, ("user", "rental", "amount", "reason", "kind", "issued_at"), rows)
+        self.log(f"Штрафы: {count}")
+
+    def create_tracking(self, rentals):
+        """Точки случайного блуждания вдоль последних законченных аренд, поровну на аренду"""
+        rnd = self.random
+        finished = sorted(self.finished(rentals), key=lambda rental: rental.end_time)[-self.sizes.tracked_rentals:]
+        if not finished or not self.sizes.points:
+            return
+        if tracking.is_partitioned():
+            existing = {name for name, _ in tracking.list_partitions()}
+            month = tracking.month_start(min(rental.start_time for rental in finished))
+            while month <= self.now:
+                if tracking.partition_name(month) not in existing:
+                    tracking.create_partition(month)
+                month = tracking.add_months(month, 1)
+
+        per_rental = max(2, self.sizes.points // len(finished))
+        total = 0
+        pending = []
+        for rental in finished:
+            step = (rental.end_time - rental.start_time) / per_rental
+            latitude, longitude = self.point_near(0.3)
+            for i in range(per_rental):
+                latitude = round(latitude + rnd.uniform(-0.0005, 0.0005), 6)
+                longitude = round(longitude + rnd.uniform(-0.0005, 0.0005), 6)
+                pending.append((rental.pk, (rental.start_time + step * i).isoformat(), latitude, longitude))
+            if len(pending) >= self.batch_size * 20:
+                total += copy_rows(TripTracking, ("rental", "timestamp", "latitude", "longitude"), pending)
+                pending = []
+        total += copy_rows(TripTracking, ("rental", "timestamp", "latitude", "longitude"), pending)
+        self.log(f"Точки трекинга: {total}")
+
+    def refresh(self):
+        """Статистика планировщика и кеши, которые bulk-загрузка обошла"""
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        stats.invalidate(*stats.HOME_STATS_KEYS.values())
+        catalog_cache.bump_cars([])
+        catalog_cache.bump_availability()
+        availability_index.invalidate()
@@ -1,5 +1,10 @@
+from datetime import datetime, time, timedelta
+
 from django import forms
-from .models import Rental
+from django.utils.timezone import make_aware
+
+from .models import Car, Dealer, Rental
+from .search import search_cars
 from django.utils.timezone import now
 
 class RentalForm(forms.ModelForm):
@@ -20,3 +25,165 @@ class RentalForm(forms.ModelForm):
             "expiration_date": forms.TextInput(attrs={"placeholder": "MM/YY"}),
             "cvc": forms.TextInput(attrs={"placeholder": "123"}),
         }
+
+    def clean(self):
+        cleaned_data = super().clean()
+        pickup = (cleaned_data.get("pickup_date"), cleaned_data.get("pickup_time"))
+        dropoff = (cleaned_data.get("dropoff_date"), cleaned_data.get("dropoff_time"))
+        if all(pickup) and all(dropoff) and dropoff <= pickup:
+            raise forms.ValidationError("Возврат должен быть позже получения")
+        return cleaned_data
+
+
+class CarSearchForm(forms.Form):
+    q = forms.CharField(
+        required=False, max_length=200, label="Поиск",
+        widget=forms.TextInput(attrs={"placeholder": "Марка, модель, описание", "class": "form-control"}),
+    )
+    pickup_date = forms.DateField(
+        required=False, label="Дата получения",
+        widget=forms.DateInput(attrs={"type": "date", "class": "form-control"}),
+    )
+    dropoff_date = forms.DateField(
+        required=False, label="Дата возврата",
+        widget=forms.DateInput(attrs={"type": "date", "class": "form-control"}),
+    )
+    type = forms.ChoiceField(
+        required=False, label="Тип",
+        choices=[("", "Любой")] + Car.CarType.choices,
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+    dealer = forms.ModelChoiceField(
+        required=False, label="Дилер", queryset=Dealer.objects.all(), empty_label="Любой",
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+    min_rating = forms.FloatField(
+        required=False, label="Оценка от", min_value=1, max_value=5,
+        widget=forms.NumberInput(attrs={"step": 0.5, "class": "form-control"}),
+    )
+    ordering = forms.ChoiceField(
+        required=False, label="Сортировка",
+        choices=[
+            ("", "По умолчанию"),
+            ("-rating_avg", "Сначала с высокой оценкой"),
+            ("-review_count", "Больше отзывов"),
+            ("price_per_hour", "Сначала дешёвые"),
+            ("-price_per_hour", "Сначала дорогие"),
+        ],
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        pickup_date = cleaned_data.get("pickup_date")
+        dropoff_date = cleaned_data.get("dropoff_date")
+        if pickup_date and dropoff_date and dropoff_date < pickup_date:
+            raise forms.ValidationError("Дата возврата раньше даты получения")
+        return cleaned_data
+
+    def get_search_params(self):
+        """
+        Параметры для индекса занятости. Даты включительные: машина должна
+        быть свободна с начала дня получения до конца дня возврата.
+        Без дат ищем машины, свободные прямо сейчас.
+        """
+        pickup_date = self.cleaned_data.get("pickup_date")
+        dropoff_date = self.cleaned_data.get("dropoff_date") or pickup_date
+        if pickup_date:
+            start = make_aware(datetime.combine(pickup_date, time.min))
+            end = make_aware(datetime.combine(dropoff_date + timedelta(days=1), time.min))
+        else:
+            start = end = now()
+        dealer = self.cleaned_data.get("dealer")
+        return {
+            "start": start,
+            "end": end,
+            "car_type": self.cleaned_data.get("type") or None,
+            "dealer_id": dealer.pk if dealer else None,
+        }
+
+    def has_queryset_filters(self):
+        """Есть ли фильтры или сортировка, которые выполняет база"""
+        data = self.cleaned_data
+        return bool(data.get("min_rating") or data.get("q", "").strip() or data.get("ordering"))
+
+    def filter_queryset(self, queryset):
+        """Фильтр и сортировка по денормализованным полям Car и поиск по тексту"""
+        min_rating = self.cleaned_data.get("min_rating")
+        if min_rating:
+            queryset = queryset.filter(rating_avg__gte=min_rating)
+        text = self.cleaned_data.get("q", "").strip()
+        if text:
+            # Без явной сортировки — самые релевантные первыми
+            queryset = search_cars(queryset, text)
+        ordering = self.cleaned_data.get("ordering")
+        if ordering:
+            return queryset.order_by(ordering, "pk")
+        return queryset
+
+
+class NearbyForm(forms.Form):
+    lat = forms.FloatField(min_value=-90, max_value=90)
+    lon = forms.FloatField(min_value=-180, max_value=180)
+    k = forms.IntegerField(required=False, min_value=1, max_value=100)
+    radius = forms.FloatField(required=False, min_value=0.1, max_value=200, help_text="км")
+
+    def clean_k(self):
+        return self.cleaned_data.get("k") or 10
+
+    def clean_radius(self):
+        return self.cleaned_data.get("radius") or 50.0
+
+
+class RouteForm(forms.Form):
+    tolerance = forms.FloatField(required=False, min_value=0, max_value=10_000, help_text="м")
+    algorithm = forms.ChoiceField(required=False, choices=[("dp", "Douglas–Peucker"), ("vw", "Visvalingam–Whyatt")])
+
+    def clean_tolerance(self):
+        tolerance = self.cleaned_data.get("tolerance")
+        return 10.0 if tolerance is None else tolerance
+
+    def clean_algorithm(self):
+        return self.cleaned_data.get("algorithm") or "dp"
+
+
+class QuoteForm(forms.Form):
+    MAX_CARS = 100
+
+    cars = forms.CharField(help_text="id машин через запятую")
+    start = forms.DateTimeField()
+    end = forms.DateTimeField()
+
+    def clean_cars(self):
+        try:
+            car_ids = {int(value) for value in self.cleaned_data["cars"].split(",") if value.strip()}
+        except ValueError:
+            raise forms.ValidationError("Ожидаются id машин через запятую")
+        if not car_ids:
+            raise forms.ValidationError("Не указаны машины")
+        if len(car_ids) > self.MAX_CARS:
+            raise forms.ValidationError(f"Не больше {self.MAX_CARS} машин за запрос")
+        return sorted(car_ids)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get("start"), cleaned_data.get("end")
+        if start and end and end <= start:
+            raise forms.ValidationError("Окончание должно быть позже начала")
+        return cleaned_data
+
+
+class ApiAvailabilityForm(forms.Form):
+    start = forms.DateTimeField()
+    end = forms.DateTimeField()
+    type = forms.ChoiceField(required=False, choices=[("", "")] + Car.CarType.choices)
+    dealer = forms.IntegerField(required=False, min_value=1)
+    cursor = forms.IntegerField(required=False, min_value=0)
+    limit = forms.IntegerField(required=False, min_value=1)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get("start"), cleaned_data.get("end")
+        if start and end and end <= start:
+            raise forms.ValidationError("Окончание должно быть позже начала")
+        return cleaned_data
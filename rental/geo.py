@@ -0,0 +1,88 @@
+"""
+Поиск ближайших машин и дилеров по сетке.
+
+Поверхность делится на ячейки GRID_STEP x GRID_STEP градусов, номер ячейки
+хранится в индексированном поле grid_cell (Dealer, CarLocation). Номера
+идут по строкам широты, поэтому квадрат вокруг точки — это по одному
+диапазону BETWEEN на строку сетки, и каждый обслуживается B-tree индексом.
+Точные расстояния (гаверсинус) считаются только для попавших в квадрат строк.
+"""
+import math
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+GRID_STEP = 0.01  # градусов, ~1.1 км по широте
+GRID_COLUMNS = round(360 / GRID_STEP)
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def grid_row(latitude):
+    return math.floor((float(latitude) + 90) / GRID_STEP)
+
+
+def grid_column(longitude):
+    return math.floor((float(longitude) + 180) / GRID_STEP) % GRID_COLUMNS
+
+
+def grid_cell(latitude, longitude):
+    if latitude is None or longitude is None:
+        return None
+    return grid_row(latitude) * GRID_COLUMNS + grid_column(longitude)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (float(lat1), float(lon1), float(lat2), float(lon2)))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def cells_within(latitude, longitude, radius_km, field="grid_cell"):
+    """Q по ячейкам квадрата, описанного вокруг круга радиуса radius_km"""
+    latitude, longitude = float(latitude), float(longitude)
+    rows = math.ceil(radius_km / (KM_PER_DEGREE * GRID_STEP))
+    max_latitude = min(89.9, abs(latitude) + rows * GRID_STEP)
+    columns = math.ceil(radius_km / (KM_PER_DEGREE * GRID_STEP * math.cos(math.radians(max_latitude))))
+
+    center_row, center_column = grid_row(latitude), grid_column(longitude)
+    ranges = []
+    for row in range(center_row - rows, center_row + rows + 1):
+        first, last = center_column - columns, center_column + columns
+        if last - first + 1 >= GRID_COLUMNS:
+            ranges.append((row * GRID_COLUMNS, row * GRID_COLUMNS + GRID_COLUMNS - 1))
+            continue
+        # Разрыв на меридиане 180°
+        for lo, hi in ((first, last),) if 0 <= first and last < GRID_COLUMNS else (
+            (first % GRID_COLUMNS, GRID_COLUMNS - 1), (0, last % GRID_COLUMNS),
+        ):
+            ranges.append((row * GRID_COLUMNS + lo, row * GRID_COLUMNS + hi))
+    return reduce(or_, (Q(**{f"{field}__range": r}) for r in ranges))
+
+
+def within(queryset, latitude, longitude, radius_km):
+    """Объекты не дальше radius_km, отсортированные по расстоянию: [(distance_km, obj), ...]"""
+    result = []
+    for obj in queryset.filter(cells_within(latitude, longitude, radius_km)):
+        distance = haversine_km(latitude, longitude, obj.latitude, obj.longitude)
+        if distance <= radius_km:
+            result.append((distance, obj))
+    result.sort(key=lambda item: item[0])
+    return result
+
+
+def nearest(queryset, latitude, longitude, k=10, max_radius_km=50.0, predicate=None):
+    """
+    k ближайших объектов в пределах max_radius_km. Радиус поиска удваивается,
+    пока не наберётся k объектов: всё, что ближе найденного радиуса, уже в выборке.
+    """
+    radius = KM_PER_DEGREE * GRID_STEP
+    while True:
+        radius = min(radius, max_radius_km)
+        found = within(queryset, latitude, longitude, radius)
+        if predicate is not None:
+            found = [item for item in found if predicate(item[1])]
+        if len(found) >= k or radius >= max_radius_km:
+            return found[:k]
+        radius *= 2
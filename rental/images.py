@@ -0,0 +1,181 @@
+"""
+Уменьшенные копии фото машин и аватаров.
+
+После сохранения модели с новым файлом render_variants (Pillow) в пуле
+потоков IMAGE_WORKERS режет исходник под размеры SIZES, каждый в 1x и 2x,
+и кодирует в AVIF (если Pillow собран с libavif), WebP и JPEG. Файлы
+называются по хешу содержимого — их можно отдавать с вечным кешем.
+Описание копий и размеры исходника лежат в JSON-поле модели:
+
+    {"source": "cars/x.jpg", "width": 4000, "height": 3000,
+     "variants": {"card": {"webp": [[400, 300, "cars/variants/ab12….webp"], …], …}}}
+
+Пока копии не готовы (или source не совпадает с текущим файлом), шаблонный
+тег {% picture %} отдаёт исходник. Команда process_images пересчитывает
+копии существующих файлов в пуле процессов.
+"""
+import hashlib
+import io
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+# Ширина в CSS-пикселях для каждого места показа
+SIZES = {
+    "card": 400,
+    "detail": 800,
+    "avatar": 96,
+}
+DENSITIES = (1, 2)
+QUALITY = {"avif": 55, "webp": 80, "jpeg": 82}
+EXTENSIONS = {"avif": "avif", "webp": "webp", "jpeg": "jpg"}
+MIME_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg"}
+
+_executor = None
+
+
+def available_formats():
+    """Форматы от лучшего сжатия к худшему; JPEG есть всегда"""
+    # Плагины вроде AvifImagePlugin регистрируются в Image.SAVE только после init()
+    Image.init()
+    formats = ["jpeg"]
+    if features.check("webp"):
+        formats.insert(0, "webp")
+    if "AVIF" in Image.SAVE:
+        formats.insert(0, "avif")
+    return formats
+
+
+def encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == "jpeg":
+        image = image.convert("RGB")
+        image.save(buffer, "JPEG", quality=QUALITY[fmt], optimize=True, progressive=True)
+    else:
+        image.save(buffer, fmt.upper(), quality=QUALITY[fmt])
+    return buffer.getvalue()
+
+
+def render_variants(data, sizes, formats=None):
+    """
+    Копии изображения из байтов data. Без Django — годится для пула процессов.
+    -> ((ширина, высота исходника), [(размер, формат, ширина, высота, байты), ...])
+    """
+    formats = formats or available_formats()
+    with Image.open(io.BytesIO(data)) as source:
+        # Ориентация из EXIF, иначе снимки с телефона ложатся набок
+        source = ImageOps.exif_transpose(source)
+        if source.mode not in ("RGB", "RGBA"):
+            source = source.convert("RGBA" if "transparency" in source.info else "RGB")
+        original = source.size
+        variants = []
+        for size in sizes:
+            widths = sorted({min(SIZES[size] * density, original[0]) for density in DENSITIES})
+            for width in widths:
+                height = max(1, round(original[1] * width / original[0]))
+                resized = source.resize((width, height), Image.Resampling.LANCZOS) if width != original[0] else source
+                for fmt in formats:
+                    variants.append((size, fmt, width, height, encode(resized, fmt)))
+    return original, variants
+
+
+def store_variants(source_name, original, variants):
+    """Сохраняет копии под именами с хешем содержимого, возвращает JSON для модели"""
+    directory = posixpath.join(posixpath.dirname(source_name), "variants")
+    stored = {}
+    for size, fmt, width, height, data in variants:
+        digest = hashlib.sha256(data).hexdigest()[:20]
+        name = posixpath.join(directory, f"{digest}.{EXTENSIONS[fmt]}")
+        # Одинаковое содержимое — один файл: повторная обработка ничего не пишет
+        if not default_storage.exists(name):
+            name = default_storage.save(name, ContentFile(data))
+        stored.setdefault(size, {}).setdefault(fmt, []).append([width, height, name])
+    return {"source": source_name, "width": original[0], "height": original[1], "variants": stored}
+
+
+def read_source(name):
+    with default_storage.open(name, "rb") as file:
+        return file.read()
+
+
+def save_variants(model, pk, field_name, variants_field, info, on_saved=None):
+    """
+    Записывает JSON, только если за время обработки файл у объекта не
+    сменился. update() не шлёт сигналов — кеши сбрасывает on_saved(pk).
+    """
+    updated = model.objects.filter(pk=pk, **{field_name: info["source"]}).update(**{variants_field: info})
+    if updated and on_saved is not None:
+        on_saved(pk)
+    return updated
+
+
+def process(model, pk, field_name, variants_field, sizes, on_saved=None):
+    """Обработка одного объекта: исходник из хранилища, копии, запись в модель"""
+    name = model.objects.filter(pk=pk).values_list(field_name, flat=True).first()
+    if not name:
+        return False
+    original, variants = render_variants(read_source(name), sizes)
+    info = store_variants(name, original, variants)
+    return bool(save_variants(model, pk, field_name, variants_field, info, on_saved))
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix="images")
+    return _executor
+
+
+def _process_logged(*args):
+    close_old_connections()
+    try:
+        process(*args)
+    except Exception:
+        logger.exception("Не удалось обработать изображение %s", args[:2])
+    finally:
+        close_old_connections()
+
+
+def schedule(instance, field_name, variants_field, sizes, on_saved=None):
+    """
+    После коммита ставит обработку в пул, если файл новый. Для удалённого
+    файла сразу очищает описание копий.
+    """
+    name = getattr(instance, field_name).name or ""
+    info = getattr(instance, variants_field) or {}
+    if name == info.get("source", ""):
+        return
+    model = type(instance)
+    if not name:
+        model.objects.filter(pk=instance.pk).update(**{variants_field: {}})
+        return
+    args = (model, instance.pk, field_name, variants_field, sizes, on_saved)
+    if settings.IMAGE_PROCESSING_SYNC:
+        transaction.on_commit(partial(process, *args))
+    else:
+        transaction.on_commit(partial(get_executor().submit, _process_logged, *args))
+
+
+def variant_set(field, info, size):
+    """
+    {формат: [(url, ширина, высота), ...]} для size, если копии относятся к
+    текущему файлу поля; иначе None.
+    """
+    if not field or not info or info.get("source") != field.name:
+        return None
+    formats = info.get("variants", {}).get(size)
+    if not formats:
+        return None
+    return {
+        fmt: [(default_storage.url(name), width, height) for width, height, name in items]
+        for fmt, items in formats.items()
+    }
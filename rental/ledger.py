@@ -0,0 +1,131 @@
+"""
+Баланс пользователя как журнал операций.
+
+Каждое движение денег — строка Transaction, и изменение UserModel.balance
+фиксируется в той же транзакции базы, что и эта строка. Строка
+пользователя блокируется (SELECT ... FOR UPDATE), поэтому параллельные
+пополнения и списания одного пользователя выполняются по очереди и не
+теряют обновлений, а проверка «хватает ли денег» не гоняется с другим
+списанием. Операции разных пользователей друг друга не ждут.
+
+BalanceSnapshot — периодический слепок баланса по журналу: баланс по
+журналу = последний слепок + сумма операций после него, без SUM по всей
+истории. Сверка с UserModel.balance выявляет расхождения (правки в обход
+журнала).
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Sum, When
+
+from accounts.models import UserModel
+from .models import BalanceSnapshot, Transaction
+
+CREDIT_TYPES = {"TOP_UP"}
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+def signed_amount(transaction_type, amount):
+    return amount if transaction_type in CREDIT_TYPES else -amount
+
+
+def post(user_id, transaction_type, amount, allow_negative=False):
+    """
+    Проводит операцию: создаёт Transaction и меняет баланс атомарно.
+    amount — положительная сумма, знак определяется типом операции.
+    Возвращает созданную Transaction; при нехватке средств — InsufficientFunds.
+    """
+    amount = Decimal(amount)
+    if amount <= 0:
+        raise ValueError("Сумма операции должна быть положительной")
+    delta = signed_amount(transaction_type, amount)
+    with transaction.atomic():
+        balance = (
+            UserModel.objects.select_for_update()
+            .values_list("balance", flat=True)
+            .get(pk=user_id)
+        )
+        if delta < 0 and not allow_negative and balance + delta < 0:
+            raise InsufficientFunds(f"Недостаточно средств: баланс {balance}, требуется {amount}")
+        UserModel.objects.filter(pk=user_id).update(balance=F("balance") + delta)
+        return Transaction.objects.create(user_id=user_id, transaction_type=transaction_type, amount=amount)
+
+
+def top_up(user_id, amount):
+    return post(user_id, "TOP_UP", amount)
+
+
+def charge(user_id, amount, transaction_type="RENTAL"):
+    return post(user_id, transaction_type, amount)
+
+
+def pay_rental(rental):
+    """
+    Оплата аренды внешним способом (карта, PayPal, Bitcoin): поступление и
+    списание за аренду проводятся парой, баланс не меняется, а журнал
+    совпадает с оплаченными арендами. Вызывать в транзакции брони —
+    откат брони откатывает и операции. Пара в сумме нулевая, поэтому
+    отрицательный баланс (после правки в админке) оплате не мешает.
+    """
+    if rental.total_price:
+        post(rental.user_id, "TOP_UP", rental.total_price)
+        post(rental.user_id, "RENTAL", rental.total_price, allow_negative=True)
+
+
+def _signed_sum(transactions):
+    total = transactions.aggregate(
+        total=Sum(Case(
+            When(transaction_type__in=CREDIT_TYPES, then=F("amount")),
+            default=-F("amount"),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ))
+    )["total"]
+    return total or Decimal("0")
+
+
+def latest_snapshot(user_id):
+    return BalanceSnapshot.objects.filter(user_id=user_id).order_by("-last_transaction_id").first()
+
+
+def ledger_balance(user_id, snapshot=None):
+    """Баланс по журналу: последний слепок плюс операции после него"""
+    snapshot = snapshot or latest_snapshot(user_id)
+    transactions = Transaction.objects.filter(user_id=user_id)
+    if snapshot is None:
+        return _signed_sum(transactions)
+    return snapshot.balance + _signed_sum(transactions.filter(pk__gt=snapshot.last_transaction_id))
+
+
+def take_snapshot(user_id):
+    """
+    Слепок баланса пользователя по журналу. Под блокировкой строки
+    пользователя: незакоммиченных операций в этот момент нет, и слепок
+    не пропустит строку с меньшим id, закоммиченную позже.
+    Возвращает (слепок или None, расхождение с UserModel.balance).
+    """
+    with transaction.atomic():
+        balance = UserModel.objects.select_for_update().values_list("balance", flat=True).get(pk=user_id)
+        latest = latest_snapshot(user_id)
+        computed = ledger_balance(user_id, latest)
+        last_id = Transaction.objects.filter(user_id=user_id).order_by("-pk").values_list("pk", flat=True).first()
+        snapshot = None
+        if last_id is not None and (latest is None or latest.last_transaction_id < last_id):
+            snapshot = BalanceSnapshot.objects.create(user_id=user_id, balance=computed, last_transaction_id=last_id)
+    return snapshot, balance - computed
+
+
+def take_snapshots(batch_size=1000):
+    """Слепки для всех пользователей с новыми операциями. Возвращает (слепков, {user_id: расхождение})"""
+    users = (
+        Transaction.objects.values_list("user_id", flat=True).distinct().order_by("user_id")
+    )
+    created, drift = 0, {}
+    for user_id in users.iterator(chunk_size=batch_size):
+        snapshot, difference = take_snapshot(user_id)
+        created += snapshot is not None
+        if difference:
+            drift[user_id] = difference
+    return created, drift
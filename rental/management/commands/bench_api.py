@@ -0,0 +1,85 @@
+import gzip
+import json
+import time
+
+from django.core import serializers
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.forms.models import model_to_dict
+from django.test import RequestFactory
+
+from rental.api import CarApiView
+from rental.models import Car
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк сериализации API: values_list и словари против экземпляров моделей"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cars", type=int, default=20_000)
+        parser.add_argument("--page", type=int, default=1000)
+        parser.add_argument("--rounds", type=int, default=5)
+
+    def handle(self, *args, **options):
+        Car.objects.bulk_create(
+            [
+                Car(brand="Bench", model=f"Api {i}", year=2000 + i % 25, price_per_hour=100 + i % 50,
+                    description="Бенчмарк API " * 5)
+                for i in range(options["cars"])
+            ],
+            batch_size=5000,
+        )
+        page = options["page"]
+        view = CarApiView()
+        names = list(CarApiView.fields)
+        lookups = ["pk"] + [CarApiView.fields[name][0] for name in names]
+        queryset = Car.objects.filter(brand="Bench").order_by("pk")
+
+        def instances_serializers():
+            return serializers.serialize("json", queryset[:page])
+
+        def instances_to_dict():
+            rows = []
+            for car in queryset[:page]:
+                row = model_to_dict(car)
+                row["image"] = car.image.url if car.image else None
+                rows.append(row)
+            return json.dumps(rows, cls=DjangoJSONEncoder)
+
+        def fast_path():
+            return json.dumps(view.serialize(list(queryset.values_list(*lookups)[:page]), names), cls=DjangoJSONEncoder)
+
+        def sparse():
+            fields = ["id", "brand", "model", "price_per_hour"]
+            rows = queryset.values_list("pk", *(CarApiView.fields[name][0] for name in fields))[:page]
+            return json.dumps(view.serialize(list(rows), fields), cls=DjangoJSONEncoder)
+
+        try:
+            for label, func in (
+                ("serializers.serialize (модели)", instances_serializers),
+                ("model_to_dict (модели)", instances_to_dict),
+                ("values_list, все поля", fast_path),
+                ("values_list, ?fields=4 поля", sparse),
+            ):
+                timings = []
+                for _ in range(options["rounds"]):
+                    started = time.perf_counter()
+                    body = func()
+                    timings.append(time.perf_counter() - started)
+                self.stdout.write(
+                    f"{label:34} {min(timings) * 1000:7.1f} мс на {page} машин, "
+                    f"{len(body) // 1024} КБ, gzip {len(gzip.compress(body.encode())) // 1024} КБ"
+                )
+
+            request = RequestFactory().get("/api/cars/", {"limit": 500}, HTTP_ACCEPT_ENCODING="gzip")
+            timings = []
+            for _ in range(options["rounds"]):
+                started = time.perf_counter()
+                response = CarApiView.as_view()(request)
+                timings.append(time.perf_counter() - started)
+            self.stdout.write(
+                f"GET /api/cars/?limit=500: {min(timings) * 1000:.1f} мс, "
+                f"{response.get('Content-Encoding')}, {len(response.content) // 1024} КБ"
+            )
+        finally:
+            Car.objects.filter(brand="Bench").delete()
@@ -0,0 +1,95 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from rental.availability import AvailabilityIndex
+from rental.models import Car
+
+DAY = 24 * 60 * 60
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк индекса занятости на синтетических данных (без базы)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cars", type=int, default=10_000)
+        parser.add_argument("--rentals", type=int, default=1_000_000)
+        parser.add_argument("--dealers", type=int, default=50)
+        parser.add_argument("--queries", type=int, default=1_000)
+        parser.add_argument("--baseline-queries", type=int, default=5,
+                            help="Сколько запросов прогнать полным перебором аренд для сравнения")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options["seed"])
+        types = Car.CarType.values
+        horizon = 365 * DAY
+
+        cars = [
+            (car_id, rnd.choice(types), rnd.randint(1, options["dealers"]), rnd.random() > 0.05)
+            for car_id in range(1, options["cars"] + 1)
+        ]
+        # Брони одной машины идут друг за другом без пересечений
+        per_car = max(1, options["rentals"] // options["cars"])
+        slot = horizon / per_car
+        rentals = []
+        rental_id = 0
+        for car_id, *_ in cars:
+            for n in range(per_car):
+                start = n * slot + rnd.uniform(0, slot / 2)
+                rental_id += 1
+                rentals.append((rental_id, car_id, start, start + rnd.uniform(DAY / 4, slot / 2)))
+
+        index = AvailabilityIndex(ttl=0)
+        started = time.perf_counter()
+        index.load(cars, rentals)
+        build_time = time.perf_counter() - started
+        self.stdout.write(f"Машин: {len(cars)}, аренд: {len(rentals)}, построение индекса: {build_time:.2f} с")
+
+        def random_query():
+            start = rnd.uniform(0, horizon)
+            return {
+                "start": start,
+                "end": start + rnd.uniform(DAY, 4 * DAY),
+                "car_type": rnd.choice([None, rnd.choice(types)]),
+                "dealer_id": rnd.choice([None, rnd.randint(1, options["dealers"])]),
+            }
+
+        latencies = []
+        found = 0
+        for _ in range(options["queries"]):
+            query = random_query()
+            started = time.perf_counter()
+            found += len(index.search(**query))
+            latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+        self.stdout.write(
+            f"Индекс: {options['queries']} запросов, "
+            f"p50 {statistics.median(latencies):.2f} мс, "
+            f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f} мс, "
+            f"p99 {latencies[int(len(latencies) * 0.99) - 1]:.2f} мс, "
+            f"в среднем найдено {found / options['queries']:.0f} машин"
+        )
+
+        if options["baseline_queries"]:
+            car_map = {car_id: rest for car_id, *rest in cars}
+            timings = []
+            for _ in range(options["baseline_queries"]):
+                query = random_query()
+                started = time.perf_counter()
+                busy = {
+                    car_id for _, car_id, start, end in rentals
+                    if start < query["end"] and end > query["start"]
+                }
+                [
+                    car_id for car_id, (car_type, dealer_id, is_available) in car_map.items()
+                    if is_available and car_id not in busy
+                    and (not query["car_type"] or car_type == query["car_type"])
+                    and (not query["dealer_id"] or dealer_id == query["dealer_id"])
+                ]
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(
+                f"Перебор всех аренд: {len(timings)} запросов, p50 {statistics.median(timings):.2f} мс"
+            )
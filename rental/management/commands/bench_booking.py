@@ -0,0 +1,96 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from accounts.models import UserModel
+from rental.booking import BookingConflict, book_car
+from rental.models import Car, Rental
+
+
+class Command(BaseCommand):
+    help = "Нагрузочный тест: сотни одновременных броней одной машины, победитель должен быть один"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bookings", type=int, default=500, help="Попыток брони в одном залпе")
+        parser.add_argument("--concurrency", type=int, default=50,
+                            help="Параллельных соединений (не больше max_connections базы)")
+        parser.add_argument("--rounds", type=int, default=3,
+                            help="Сколько раз повторить залп, каждый раз на новый период")
+
+    def handle(self, *args, **options):
+        user, _ = UserModel.objects.get_or_create(username="bench_booking")
+        car = Car.objects.create(brand="Bench", model="Booking", year=2024, price_per_hour=1)
+        failed = False
+        try:
+            for round_no in range(options["rounds"]):
+                start = timezone.now().replace(microsecond=0) + timedelta(days=30 + round_no * 7)
+                failed |= not self.run_round(user, car, start, options["bookings"], options["concurrency"])
+        finally:
+            car.delete()
+            user.delete()
+        if failed:
+            raise CommandError("Обнаружено двойное бронирование")
+
+    def run_round(self, user, car, start, bookings, concurrency):
+        barrier = threading.Barrier(concurrency)
+        results = []
+        errors = []
+        lock = threading.Lock()
+
+        def worker(numbers):
+            try:
+                connection.ensure_connection()
+                barrier.wait(timeout=60)
+                for n in numbers:
+                    # Периоды пересекаются, но не совпадают
+                    rental = Rental(
+                        user=user, car=car,
+                        start_time=start + timedelta(minutes=n),
+                        end_time=start + timedelta(days=2, minutes=n),
+                        full_name="Bench", phone_number="0", address="-", city="-",
+                        pickup_location="-", pickup_date=start.date(), pickup_time=start.time(),
+                        dropoff_location="-", dropoff_date=start.date() + timedelta(days=2),
+                        dropoff_time=start.time(), payment_method="PAYPAL",
+                    )
+                    started = time.perf_counter()
+                    try:
+                        book_car(rental)
+                        won = True
+                    except BookingConflict:
+                        won = False
+                    with lock:
+                        results.append((won, time.perf_counter() - started))
+            except Exception as e:
+                barrier.abort()
+                with lock:
+                    errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=worker, args=(range(i, bookings, concurrency),))
+            for i in range(concurrency)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if errors:
+            raise CommandError(f"Ошибка в потоке: {errors[0]!r}")
+
+        winners = sum(won for won, _ in results)
+        latencies = sorted(latency * 1000 for _, latency in results)
+        stored = Rental.objects.filter(car=car, start_time__gte=start, start_time__lt=start + timedelta(days=1)).count()
+        self.stdout.write(
+            f"{bookings} броней в {concurrency} потоков: победителей {winners}, в базе {stored}, "
+            f"{bookings / elapsed:.0f} попыток/с, "
+            f"p50 {latencies[len(latencies) // 2]:.1f} мс, p99 {latencies[int(len(latencies) * 0.99) - 1]:.1f} мс"
+        )
+        return winners == 1 and stored == 1
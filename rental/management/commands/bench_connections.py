@@ -0,0 +1,124 @@
+"""
+Цена подключения к базе на запрос: CONN_MAX_AGE=0 против постоянных соединений.
+
+Команда повторяет жизненный цикл запроса Django без HTTP-сервера:
+request_started, несколько запросов к базе, request_finished. На этих
+сигналах висит close_old_connections, поэтому при CONN_MAX_AGE=0 каждый
+«запрос» заново подключается к PostgreSQL (TCP, аутентификация, старт
+backend-процесса), а при CONN_MAX_AGE>0 переиспользует соединение, как
+воркеры gunicorn под WSGI. Профиль pooled — то, что работает в
+Docker-образе (ASGI): CONN_MAX_AGE=0, но подключение идёт к pgbouncer,
+который держит соединения с PostgreSQL открытыми. Запускать против
+сервисов из docker-compose:
+
+    python manage.py bench_connections --direct db:5432 --pooler pgbouncer:6432
+"""
+import os
+import threading
+import time
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+
+from rental.management.commands.bench_servers import percentile
+from rental.models import Car
+
+PROFILES = {
+    # src/settings.py: соединение закрывается в конце каждого запроса
+    "per-request": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False},
+    # src/settings_production.py под WSGI
+    "persistent": {"CONN_MAX_AGE": 600, "CONN_HEALTH_CHECKS": True},
+    # src/settings_production.py под ASGI (Docker-образ): через pgbouncer
+    "pooled": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": True},
+}
+# Какой адрес базы берёт профиль: напрямую PostgreSQL или пулер
+ADDRESSES = {"per-request": "direct", "persistent": "direct", "pooled": "pooler"}
+
+
+class Command(BaseCommand):
+    help = "Задержка запроса с подключением к базе на каждый запрос и с постоянными соединениями"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profiles", default=",".join(PROFILES), help=f"Через запятую из: {', '.join(PROFILES)}")
+        parser.add_argument("--requests", type=int, default=2000, help="Запросов на поток")
+        parser.add_argument("--threads", type=int, default=4, help="Потоков, как gthread-воркер gunicorn")
+        parser.add_argument("--queries", type=int, default=3, help="Запросов к базе внутри одного запроса")
+        parser.add_argument("--direct", help="host:port самого PostgreSQL (по умолчанию — из настроек)")
+        parser.add_argument("--pooler", default=os.environ.get("DATABASE_POOLER", "pgbouncer:6432"),
+                            help="host:port pgbouncer для профиля pooled")
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options["profiles"].split(",") if name.strip()]
+        unknown = [name for name in names if name not in PROFILES]
+        if unknown:
+            raise CommandError(f"Неизвестные профили: {', '.join(unknown)}")
+
+        summary = []
+        for name in names:
+            address = options[ADDRESSES[name]]
+            profile = dict(PROFILES[name])
+            if address:
+                host, _, port = address.rpartition(":")
+                profile.update(HOST=host, PORT=port)
+            latencies, connects = self.run_profile(profile, options)
+            total = sum(latencies)
+            summary.append((name, latencies, connects))
+            self.stdout.write(
+                f"{name:12} {len(latencies) / total * options['threads']:8.1f} запр/с   "
+                f"p50 {percentile(latencies, 0.5) * 1000:6.2f} мс   p99 {percentile(latencies, 0.99) * 1000:6.2f} мс   "
+                f"подключений {connects}"
+            )
+        if len(summary) > 1:
+            base, other = summary[0][1], summary[-1][1]
+            saved = percentile(base, 0.5) - percentile(other, 0.5)
+            self.stdout.write(f"\nРазница p50 {summary[0][0]} и {summary[-1][0]}: {saved * 1000:.2f} мс на запрос")
+
+    def run_profile(self, profile, options):
+        latencies = []
+        counters = {"connects": 0}
+        lock = threading.Lock()
+        errors = []
+
+        def on_connect(sender, connection, **kwargs):
+            with lock:
+                counters["connects"] += 1
+
+        def worker():
+            local = []
+            try:
+                for _ in range(options["requests"]):
+                    started = time.perf_counter()
+                    request_started.send(sender=WSGIHandler, environ={})
+                    for _ in range(options["queries"]):
+                        list(Car.objects.values_list("pk", flat=True)[:1])
+                    request_finished.send(sender=WSGIHandler)
+                    local.append(time.perf_counter() - started)
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+            finally:
+                connections.close_all()
+            with lock:
+                latencies.extend(local)
+
+        # Соединения потоков создаются из одного словаря настроек базы
+        settings_dict = connections[DEFAULT_DB_ALIAS].settings_dict
+        saved = {key: settings_dict[key] for key in profile}
+        settings_dict.update(profile)
+        connections.close_all()
+        connection_created.connect(on_connect, weak=False)
+        try:
+            threads = [threading.Thread(target=worker) for _ in range(options["threads"])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            connection_created.disconnect(on_connect)
+            settings_dict.update(saved)
+        if errors:
+            raise CommandError(f"Ошибка в потоке: {errors[0]}")
+        return latencies, counters["connects"]
@@ -0,0 +1,116 @@
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import F
+
+from accounts.models import UserModel
+from rental.ledger import InsufficientFunds, charge, ledger_balance, take_snapshot, top_up
+from rental.models import Transaction
+
+
+class Command(BaseCommand):
+    help = "Нагрузочный тест журнала баланса: параллельные пополнения и списания без потерянных обновлений"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--operations", type=int, default=5000)
+        parser.add_argument("--concurrency", type=int, default=40,
+                            help="Параллельных соединений (не больше max_connections базы)")
+        parser.add_argument("--users", type=int, default=3,
+                            help="Мало пользователей — много конкуренции за одну строку")
+        parser.add_argument("--naive", action="store_true",
+                            help="Для сравнения: читать баланс и сохранять его без блокировки")
+
+    def handle(self, *args, **options):
+        users = [
+            UserModel.objects.create(username=f"bench_ledger_{i}", balance=Decimal("100.00"))
+            for i in range(options["users"])
+        ]
+        try:
+            self.run(users, options)
+        finally:
+            for user in users:
+                user.delete()
+
+    def run(self, users, options):
+        concurrency, operations = options["concurrency"], options["operations"]
+        barrier = threading.Barrier(concurrency)
+        lock = threading.Lock()
+        expected = {user.pk: Decimal("100.00") for user in users}
+        counters = {"declined": 0}
+        errors = []
+
+        def naive(user_id, amount, credit):
+            user = UserModel.objects.get(pk=user_id)
+            if not credit and user.balance < amount:
+                raise InsufficientFunds
+            user.balance += amount if credit else -amount
+            user.save(update_fields=["balance"])
+            Transaction.objects.create(user_id=user_id, transaction_type="TOP_UP" if credit else "RENTAL", amount=amount)
+
+        def worker(seed, count):
+            rnd = random.Random(seed)
+            try:
+                connection.ensure_connection()
+                barrier.wait(timeout=60)
+                for _ in range(count):
+                    user_id = rnd.choice(users).pk
+                    amount = Decimal(rnd.randint(1, 5000)) / 100
+                    credit = rnd.random() < 0.5
+                    try:
+                        if options["naive"]:
+                            naive(user_id, amount, credit)
+                        elif credit:
+                            top_up(user_id, amount)
+                        else:
+                            charge(user_id, amount)
+                    except InsufficientFunds:
+                        with lock:
+                            counters["declined"] += 1
+                        continue
+                    with lock:
+                        expected[user_id] += amount if credit else -amount
+            except Exception as e:
+                barrier.abort()
+                with lock:
+                    errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=worker, args=(i, len(range(i, operations, concurrency))))
+            for i in range(concurrency)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        if errors:
+            raise CommandError(f"Ошибка в потоке: {errors[0]!r}")
+
+        self.stdout.write(
+            f"{operations} операций в {concurrency} потоков на {len(users)} пользователей: "
+            f"{operations / elapsed:.0f} операций/с, отклонено за нехваткой средств {counters['declined']}"
+        )
+        lost = False
+        balances = dict(UserModel.objects.filter(pk__in=expected).values_list("pk", "balance"))
+        for user_id, amount in expected.items():
+            # Журнал начинается со 100.00, внесённых мимо него
+            by_ledger = ledger_balance(user_id) + Decimal("100.00")
+            negative = balances[user_id] < 0
+            ok = balances[user_id] == amount == by_ledger and not negative
+            lost |= not ok
+            self.stdout.write(
+                f"  {user_id}: баланс {balances[user_id]}, ожидалось {amount}, по журналу {by_ledger}"
+                + ("" if ok else "  <-- расхождение")
+            )
+        UserModel.objects.filter(pk__in=expected).update(balance=F("balance") - Decimal("100.00"))
+        snapshot, drift = take_snapshot(users[0].pk)
+        self.stdout.write(f"Слепок: {snapshot.balance if snapshot else '-'}, расхождение {drift}")
+        if lost:
+            raise CommandError("Потерянные обновления или баланс ушёл в минус")
@@ -0,0 +1,72 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from rental.geo import grid_cell, haversine_km, nearest
+from rental.models import Car, CarLocation
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк поиска ближайших машин по сетке против полного перебора"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cars", type=int, default=100_000)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--baseline-queries", type=int, default=5)
+        parser.add_argument("-k", type=int, default=10)
+        parser.add_argument("--spread", type=float, default=0.5,
+                            help="Разброс координат вокруг центра города, градусов")
+
+    def handle(self, *args, **options):
+        rnd = random.Random(7)
+        center = (43.238949, 76.889709)
+        spread = options["spread"]
+
+        def random_point():
+            return (
+                round(center[0] + rnd.uniform(-spread, spread), 6),
+                round(center[1] + rnd.uniform(-spread, spread), 6),
+            )
+
+        started = time.perf_counter()
+        cars = Car.objects.bulk_create(
+            [Car(brand="Bench", model="Nearby", year=2024, price_per_hour=1) for _ in range(options["cars"])],
+            batch_size=5000,
+        )
+        locations = []
+        for car in cars:
+            latitude, longitude = random_point()
+            locations.append(CarLocation(
+                car=car, latitude=latitude, longitude=longitude, grid_cell=grid_cell(latitude, longitude),
+            ))
+        CarLocation.objects.bulk_create(locations, batch_size=5000)
+        self.stdout.write(f"Создано {len(cars)} машин с координатами за {time.perf_counter() - started:.1f} с")
+
+        try:
+            queryset = CarLocation.objects.filter(car__brand="Bench")
+            latencies = []
+            for _ in range(options["queries"]):
+                latitude, longitude = random_point()
+                started = time.perf_counter()
+                nearest(queryset, latitude, longitude, k=options["k"])
+                latencies.append((time.perf_counter() - started) * 1000)
+            latencies.sort()
+            self.stdout.write(
+                f"Сетка: k={options['k']}, {len(latencies)} запросов, "
+                f"p50 {statistics.median(latencies):.1f} мс, p99 {latencies[int(len(latencies) * 0.99) - 1]:.1f} мс"
+            )
+
+            timings = []
+            for _ in range(options["baseline_queries"]):
+                latitude, longitude = random_point()
+                started = time.perf_counter()
+                rows = queryset.values_list("car_id", "latitude", "longitude")
+                sorted(rows, key=lambda row: haversine_km(latitude, longitude, row[1], row[2]))[:options["k"]]
+                timings.append((time.perf_counter() - started) * 1000)
+            if timings:
+                self.stdout.write(f"Полный перебор: p50 {statistics.median(timings):.1f} мс")
+        finally:
+            CarLocation.objects.filter(car__brand="Bench", car__model="Nearby").delete()
+            Car.objects.filter(brand="Bench", model="Nearby").delete()
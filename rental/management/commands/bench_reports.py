@@ -0,0 +1,63 @@
+"""
+Отчёт по парку из сводок против агрегации по исходным таблицам.
+
+    python manage.py generate_fixtures --seed 1 --rentals 10000000
+    python manage.py refresh_rollups --rebuild
+    python manage.py bench_reports --days 30 --group-by dealer
+
+Итоги обоих способов сверяются: расхождение значит, что сводки отстали
+(не запущен refresh_rollups) или посчитаны неверно.
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from rental import reports
+from rental.management.commands.bench_servers import percentile
+from rental.models import RollupChange
+
+
+class Command(BaseCommand):
+    help = "Время отчёта по парку: сводки против агрегации аренд и штрафов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30, help="Длина периода, дней до сегодня включительно")
+        parser.add_argument("--group-by", choices=list(reports.GROUPS), default="dealer")
+        parser.add_argument("--rounds", type=int, default=20, help="Замеров отчёта из сводок")
+        parser.add_argument("--adhoc-rounds", type=int, default=3, help="Замеров агрегации по исходным таблицам")
+
+    def handle(self, *args, **options):
+        end = timezone.localdate() + timedelta(days=1)
+        start = end - timedelta(days=options["days"])
+        group_by = options["group_by"]
+        pending = RollupChange.objects.count()
+        if pending:
+            self.stdout.write(self.style.WARNING(f"В очереди {pending} изменений: запустите refresh_rollups"))
+
+        rollup, totals = self.measure(options["rounds"], lambda: reports.fleet_totals(start, end, group_by))
+        adhoc, expected = self.measure(options["adhoc_rounds"], lambda: reports.adhoc_fleet_totals(start, end, group_by))
+
+        self.stdout.write(f"Период {start} — {end - timedelta(days=1)}, группировка {group_by}, групп: {len(expected)}")
+        self.stdout.write(f"{'способ':24} {'p50 мс':>10} {'p95 мс':>10}")
+        for name, latencies in (("сводки", rollup), ("аренды и штрафы", adhoc)):
+            self.stdout.write(
+                f"{name:24} {percentile(latencies, 0.5) * 1000:10.1f} {percentile(latencies, 0.95) * 1000:10.1f}"
+            )
+        self.stdout.write(f"Ускорение: x{percentile(adhoc, 0.5) / max(percentile(rollup, 0.5), 1e-9):.0f}")
+
+        mismatched = sorted(
+            (str(key) for key in totals.keys() | expected.keys() if totals.get(key) != expected.get(key)),
+        )
+        if mismatched:
+            raise CommandError(f"Сводки расходятся с исходными таблицами в группах: {', '.join(mismatched[:20])}")
+        self.stdout.write(self.style.SUCCESS("Итоги совпадают"))
+
+    def measure(self, rounds, run):
+        latencies, result = [], None
+        for _ in range(max(rounds, 1)):
+            started = time.perf_counter()
+            result = run()
+            latencies.append(time.perf_counter() - started)
+        return latencies, result
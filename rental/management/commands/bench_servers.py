@@ -0,0 +1,230 @@
+"""
+Нагрузочный тест: одни и те же страницы под WSGI, ASGI и production-gunicorn.
+
+Команда по очереди поднимает сервер в каждом режиме на свободном порту,
+гоняет по списку путей заданное число параллельных клиентов (HTTP/1.1
+keep-alive на asyncio, без сторонних библиотек) и печатает запросов в
+секунду, p50 и p99 задержки по каждому пути и в целом.
+
+    python manage.py bench_servers --concurrency 50 --duration 15 --user demo
+    python manage.py bench_servers --modes wsgi,gunicorn --workers 4
+"""
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from rental.models import Car
+
+
+def gunicorn_argv(port, workers):
+    return [
+        sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}",
+        "--workers", str(workers), "--log-level", "warning",
+    ]
+
+
+MODES = {
+    # То, что запускают Dockerfile и docker-compose до ASGI: runserver, поток на запрос
+    "wsgi": lambda port, workers: [
+        sys.executable, "manage.py", "runserver", "--noreload", f"127.0.0.1:{port}",
+    ],
+    "asgi": lambda port, workers: [
+        sys.executable, "-m", "uvicorn", "src.asgi:application", "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers), "--no-access-log", "--log-level", "warning",
+    ],
+    # Production: gunicorn.conf.py, preload и постоянные соединения (src/settings_production.py)
+    "gunicorn": gunicorn_argv,
+    "gunicorn-asgi": gunicorn_argv,
+}
+
+# Окружение сервера поверх текущего
+MODE_ENV = {
+    "gunicorn": {"DJANGO_SETTINGS_MODULE": "src.settings_production", "SERVER_MODE": "wsgi"},
+    "gunicorn-asgi": {"DJANGO_SETTINGS_MODULE": "src.settings_production", "SERVER_MODE": "asgi"},
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def read_response(reader):
+    """-> (статус, держать ли соединение)"""
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    version, status = lines[0].split(" ", 2)[:2]
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+    if "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+    elif headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.read()
+        keep_alive = False
+    return int(status), keep_alive
+
+
+async def client(port, paths, offset, deadline, cookie, results):
+    reader = writer = None
+    index = offset
+    while time.perf_counter() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        request = f"GET {path} HTTP/1.1\r\nHost: localhost\r\n{cookie}\r\n".encode()
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(request)
+            status, keep_alive = await read_response(reader)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            status, keep_alive = 0, False
+        results.append((path, time.perf_counter() - started, status))
+        if not keep_alive and writer is not None:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_load(port, paths, concurrency, duration, cookie):
+    results = []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(client(port, paths, i, deadline, cookie, results) for i in range(concurrency)))
+    return results
+
+
+async def wait_ready(port, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return True
+        except OSError:
+            await asyncio.sleep(0.2)
+    return False
+
+
+class Command(BaseCommand):
+    help = "Нагрузочный тест страниц: запросов/с и p99 под WSGI и ASGI"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--modes", default=",".join(MODES), help=f"Через запятую из: {', '.join(MODES)}")
+        parser.add_argument("--paths", help="Пути через запятую; по умолчанию главная, каталог и страница машины")
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--duration", type=float, default=10)
+        parser.add_argument("--warmup", type=float, default=2)
+        parser.add_argument("--workers", type=int, default=2, help="Процессов сервера там, где режим их поддерживает")
+        parser.add_argument("--user", help="Имя пользователя: запросы идут с его сессией (для истории аренд)")
+
+    def handle(self, *args, **options):
+        modes = [mode.strip() for mode in options["modes"].split(",") if mode.strip()]
+        unknown = [mode for mode in modes if mode not in MODES]
+        if unknown:
+            raise CommandError(f"Неизвестные режимы: {', '.join(unknown)}")
+        paths = self.get_paths(options)
+        session = self.create_session(options["user"])
+        cookie = f"Cookie: {settings.SESSION_COOKIE_NAME}={session.session_key}\r\n" if session else ""
+
+        summary = []
+        try:
+            for mode in modes:
+                results = self.run_mode(mode, paths, cookie, options)
+                summary.append((mode, self.report(mode, paths, results, options["duration"])))
+        finally:
+            if session:
+                session.delete()
+
+        self.stdout.write("\nИтого:")
+        for mode, (rps, p99, errors) in summary:
+            self.stdout.write(f"  {mode:6} {rps:8.1f} запр/с   p99 {p99 * 1000:7.1f} мс   ошибок {errors}")
+
+    def get_paths(self, options):
+        if options["paths"]:
+            return [path.strip() for path in options["paths"].split(",") if path.strip()]
+        paths = ["/", "/cars/"]
+        car_id = Car.objects.order_by("pk").values_list("pk", flat=True).first()
+        if car_id is not None:
+            paths.append(f"/cars/{car_id}/")
+        if options["user"]:
+            paths.append("/rental-history/")
+        return paths
+
+    def create_session(self, username):
+        if not username:
+            return None
+        user = get_user_model().objects.filter(username=username).first()
+        if user is None:
+            raise CommandError(f"Нет пользователя {username}")
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session
+
+    def run_mode(self, mode, paths, cookie, options):
+        port = free_port()
+        argv = MODES[mode](port, options["workers"])
+        self.stdout.write(f"\n[{mode}] {' '.join(argv[1:])}")
+        server = subprocess.Popen(
+            argv, cwd=settings.BASE_DIR, env={**os.environ, **MODE_ENV.get(mode, {})},
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True,
+        )
+        try:
+            if not asyncio.run(wait_ready(port, 30)):
+                raise CommandError(f"{mode}: сервер не поднялся на порту {port}")
+            # Прогрев: кеши, индекс занятости, таблица цен в каждом процессе
+            asyncio.run(run_load(port, paths, options["concurrency"], options["warmup"], cookie))
+            return asyncio.run(run_load(port, paths, options["concurrency"], options["duration"], cookie))
+        finally:
+            os.killpg(server.pid, signal.SIGTERM)
+            try:
+                server.wait(10)
+            except subprocess.TimeoutExpired:
+                os.killpg(server.pid, signal.SIGKILL)
+
+    def report(self, mode, paths, results, duration):
+        for path in paths:
+            latencies = [elapsed for item_path, elapsed, _ in results if item_path == path]
+            statuses = {}
+            for item_path, _, status in results:
+                if item_path == path:
+                    statuses[status] = statuses.get(status, 0) + 1
+            self.stdout.write(
+                f"  {urlsplit(path).path:24} {len(latencies) / duration:8.1f} запр/с   "
+                f"p50 {percentile(latencies, 0.5) * 1000:7.1f} мс   p99 {percentile(latencies, 0.99) * 1000:7.1f} мс   "
+                f"коды {dict(sorted(statuses.items()))}"
+            )
+        latencies = [elapsed for _, elapsed, _ in results]
+        errors = sum(1 for _, _, status in results if not 200 <= status < 400)
+        return len(results) / duration, percentile(latencies, 0.99), errors
@@ -0,0 +1,81 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.models import UserModel
+from rental.models import Car, CarLocation, Rental, TripTracking
+from rental.telemetry import TelemetryBuffer
+
+
+class Command(BaseCommand):
+    help = "Сравнивает поштучный save() трекинга с пакетной загрузкой (bulk_create и COPY)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--points", type=int, default=200_000)
+        parser.add_argument("--single-points", type=int, default=2_000,
+                            help="Сколько точек писать поштучно (медленно)")
+        parser.add_argument("--cars", type=int, default=100)
+        parser.add_argument("--batch-size", type=int, default=5_000)
+
+    def handle(self, *args, **options):
+        user, _ = UserModel.objects.get_or_create(username="bench_telemetry")
+        start = timezone.now() + timedelta(days=3650)
+        cars = Car.objects.bulk_create([
+            Car(brand="Bench", model=f"Telemetry {n}", year=2024, price_per_hour=1)
+            for n in range(options["cars"])
+        ])
+        rentals = Rental.objects.bulk_create([
+            Rental(
+                user=user, car=car, start_time=start, end_time=start + timedelta(days=1),
+                full_name="Bench", phone_number="0", address="-", city="-",
+                pickup_location="-", pickup_date=start.date(), pickup_time=start.time(),
+                dropoff_location="-", dropoff_date=start.date(), dropoff_time=start.time(),
+                payment_method="PAYPAL",
+            )
+            for car in cars
+        ])
+        try:
+            self.run(rentals, options)
+        finally:
+            Car.objects.filter(pk__in=[car.pk for car in cars]).delete()
+            user.delete()
+
+    def run(self, rentals, options):
+        rnd = random.Random(1)
+        base = timezone.now()
+
+        def points(count):
+            for n in range(count):
+                rental = rentals[n % len(rentals)]
+                yield {
+                    "rental_id": rental.pk,
+                    "latitude": round(43.2 + rnd.uniform(-0.1, 0.1), 6),
+                    "longitude": round(76.9 + rnd.uniform(-0.1, 0.1), 6),
+                    "timestamp": (base + timedelta(seconds=n)).isoformat(),
+                }
+
+        # Поштучно, как сейчас: save() трека + save() CarLocation
+        count = options["single_points"]
+        started = time.perf_counter()
+        for data in points(count):
+            rental = next(r for r in rentals if r.pk == data["rental_id"])
+            TripTracking.objects.create(
+                rental=rental, latitude=data["latitude"], longitude=data["longitude"], timestamp=data["timestamp"],
+            )
+            CarLocation.objects.update_or_create(
+                car_id=rental.car_id, defaults={"latitude": data["latitude"], "longitude": data["longitude"]},
+            )
+        self.report("save() поштучно", count, time.perf_counter() - started)
+
+        for label, use_copy in (("bulk_create", False), ("COPY", True)):
+            count = options["points"]
+            started = time.perf_counter()
+            with TelemetryBuffer(batch_size=options["batch_size"], use_copy=use_copy) as buffer:
+                buffer.extend(points(count))
+            self.report(f"{label}, пачки по {options['batch_size']}", buffer.accepted, time.perf_counter() - started)
+
+    def report(self, label, count, elapsed):
+        self.stdout.write(f"{label}: {count} точек за {elapsed:.2f} с, {count / elapsed:.0f} точек/с")
@@ -0,0 +1,144 @@
+import math
+import random
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import UserModel
+from rental.analytics import analyze_track, issue_trip_fines, load_track, track_arrays, trip_options
+from rental.geo import haversine_km
+from rental.models import Car, Fine, Rental, TripTracking
+from rental.tracking import iter_track
+
+
+def analyze_python(points, center, options):
+    """Тот же расчёт циклом по точкам — базовая линия для сравнения"""
+    distance = idle = max_speed = 0.0
+    speeding, exits = 0, 0
+    run_seconds, outside = 0.0, False
+    for (t1, lat1, lon1), (t2, lat2, lon2) in zip(points, points[1:]):
+        segment = haversine_km(lat1, lon1, lat2, lon2)
+        interval = (t2 - t1).total_seconds()
+        valid = 0 < interval <= options["max_gap_seconds"]
+        speed = segment * 3600 / interval if valid else 0.0
+        if speed > options["max_plausible_speed_kmh"]:
+            valid, speed = False, 0.0
+        else:
+            distance += segment
+        if valid:
+            max_speed = max(max_speed, speed)
+            if speed < options["idle_speed_kmh"]:
+                idle += interval
+        if speed > options["speed_limit_kmh"]:
+            run_seconds += interval
+        else:
+            speeding += run_seconds >= options["speeding_min_seconds"]
+            run_seconds = 0.0
+    speeding += run_seconds >= options["speeding_min_seconds"]
+    for _, latitude, longitude in points:
+        is_outside = haversine_km(center[0], center[1], latitude, longitude) > options["geofence_radius_km"]
+        exits += is_outside and not outside
+        outside = is_outside
+    return distance, idle, max_speed, speeding, exits
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк векторной аналитики поездок (NumPy) против цикла на Python"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--points", type=int, default=200_000, help="Точек в треке (раз в секунду)")
+        parser.add_argument("--rounds", type=int, default=3)
+        parser.add_argument("--db", action="store_true",
+                            help="Также записать трек в базу и замерить загрузку и выписку штрафов")
+
+    def handle(self, *args, **options):
+        rnd = random.Random(7)
+        center = (43.238949, 76.889709)
+        started_at = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        latitude, longitude, heading = center[0], center[1], 0.0
+        points = []
+        for second in range(options["points"]):
+            # Чередуются стоянки, езда по городу и участки трассы
+            phase = (second // 600) % 4
+            speed = (0.0, 50.0, 130.0, 70.0)[phase] + rnd.uniform(-5, 5)
+            heading += rnd.uniform(-0.05, 0.05)
+            step = max(speed, 0.0) / 3600 / 111.2
+            latitude += step * math.cos(heading)
+            longitude += step * math.sin(heading) / math.cos(math.radians(latitude))
+            points.append((
+                started_at + timedelta(seconds=second),
+                Decimal(f"{latitude:.6f}"),
+                Decimal(f"{longitude:.6f}"),
+            ))
+        trip = trip_options()
+
+        measure = self.measure(options["rounds"])
+        def vectorized():
+            return analyze_track(*track_arrays(points), center=center)
+
+        numpy_time, stats = measure(vectorized)
+        convert_time, arrays = measure(lambda: track_arrays(points))
+        compute_time, _ = measure(lambda: analyze_track(*arrays, center=center))
+        python_time, baseline = measure(lambda: analyze_python(points, center, trip))
+
+        self.stdout.write(
+            f"NumPy: {numpy_time * 1000:.0f} мс (загрузка в массивы {convert_time * 1000:.0f} мс, "
+            f"расчёт {compute_time * 1000:.0f} мс), {len(points) / numpy_time:.0f} точек/с"
+        )
+        self.stdout.write(f"Python: {python_time * 1000:.0f} мс, {len(points) / python_time:.0f} точек/с")
+        self.stdout.write(f"Ускорение: x{python_time / numpy_time:.1f} (без загрузки x{python_time / compute_time:.1f})")
+        self.stdout.write(
+            f"Пробег {stats['distance_km']:.1f} / {baseline[0]:.1f} км, "
+            f"простой {stats['idle_seconds']:.0f} / {baseline[1]:.0f} с, "
+            f"превышений {len(stats['speeding'])} / {baseline[3]}, "
+            f"выездов из зоны {len(stats['geofence_exits'])} / {baseline[4]}"
+        )
+        if options["db"]:
+            self.bench_db(points, measure)
+
+    @staticmethod
+    def measure(rounds):
+        def measure(func):
+            timings = []
+            for _ in range(rounds):
+                started = time.perf_counter()
+                result = func()
+                timings.append(time.perf_counter() - started)
+            return min(timings), result
+        return measure
+
+    def bench_db(self, points, measure):
+        user, _ = UserModel.objects.get_or_create(username="bench_trip_analytics")
+        car = Car.objects.create(brand="Bench", model="Trip", year=2024, price_per_hour=1)
+        start, end = points[0][0], points[-1][0]
+        try:
+            rental = Rental.objects.create(
+                user=user, car=car, start_time=start, end_time=end,
+                full_name="Bench", phone_number="0", address="-", city="-",
+                pickup_location="-", pickup_date=start.date(), pickup_time=start.time(),
+                dropoff_location="-", dropoff_date=end.date(), dropoff_time=end.time(),
+                payment_method="PAYPAL",
+            )
+            TripTracking.objects.bulk_create(
+                [TripTracking(rental=rental, timestamp=t, latitude=lat, longitude=lon) for t, lat, lon in points],
+                batch_size=10_000,
+            )
+            float_time, _ = measure(lambda: load_track(rental.pk))
+            decimal_time, _ = measure(lambda: track_arrays(list(iter_track(rental.pk))))
+            self.stdout.write(
+                f"Загрузка из базы: double precision {float_time * 1000:.0f} мс, "
+                f"через Decimal/datetime {decimal_time * 1000:.0f} мс"
+            )
+            started = time.perf_counter()
+            checked, issued = issue_trip_fines(start, end + timedelta(seconds=1))
+            repeated = issue_trip_fines(start, end + timedelta(seconds=1))
+            self.stdout.write(
+                f"issue_trip_fines: аренд {checked}, штрафов {issued} "
+                f"({Fine.objects.filter(rental=rental).count()} в базе) за {time.perf_counter() - started:.2f} с, "
+                f"повторный запуск: {repeated}"
+            )
+        finally:
+            car.delete()
+            user.delete()
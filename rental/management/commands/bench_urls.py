@@ -0,0 +1,206 @@
+"""
+Бенчмарк всех страниц rental/urls.py и списков админки в одном процессе.
+
+Для каждого URL: запросов к базе на запрос, p50/p95/p99 задержки и пик
+выделенной памяти (tracemalloc, отдельным проходом — он замедляет
+запросы). Имеет смысл на данных generate_fixtures:
+
+    python manage.py generate_fixtures --seed 1
+    python manage.py bench_urls --user fixture1_0 --save bench.json
+    # после изменений
+    python manage.py bench_urls --user fixture1_0 --compare bench.json
+
+--compare завершает команду ошибкой, если у какого-то URL выросло число
+запросов или p95 стал хуже порога --tolerance.
+"""
+import json
+import resource
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
+from django.utils.http import urlencode
+
+from rental import urls as rental_urls
+from rental.management.commands.bench_servers import percentile
+from rental.models import Car, Dealer, Rental, TripTracking
+
+# Требуют токена трекера и пишут в базу — их меряет bench_telemetry
+SKIPPED = {"telemetry_ingest"}
+# Какой объект подставлять в <int:pk>
+PK_SOURCES = {"rental_track": "rental", "rental_route": "rental"}
+
+
+class Command(BaseCommand):
+    help = "Запросов к базе, задержка и память по каждому URL сайта и спискам админки"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Пользователь для страниц, требующих входа (его аренды и платежи)")
+        parser.add_argument("--rounds", type=int, default=20, help="Замеров на URL")
+        parser.add_argument("--warmup", type=int, default=2, help="Прогревочных запросов на URL")
+        parser.add_argument("--no-admin", action="store_true", help="Без списков админки")
+        parser.add_argument("--save", help="Сохранить результаты в JSON")
+        parser.add_argument("--compare", help="Сравнить с сохранённым JSON и упасть при регрессии")
+        parser.add_argument("--tolerance", type=float, default=1.25, help="Допустимый рост p95 (1.25 — на 25%%)")
+
+    def handle(self, *args, **options):
+        user = self.get_user(options["user"])
+        client = Client(SERVER_NAME="localhost")
+        client.force_login(user)
+        targets = self.site_targets(user)
+        admin_user = None
+        if not options["no_admin"]:
+            admin_user = get_user_model().objects.create_superuser(
+                f"bench_urls_{int(time.time())}", password=None,
+            )
+        try:
+            results = {name: self.measure(client, url, options) for name, url in targets}
+            if admin_user is not None:
+                admin_client = Client(SERVER_NAME="localhost")
+                admin_client.force_login(admin_user)
+                for name, url in self.admin_targets():
+                    results[name] = self.measure(admin_client, url, options)
+        finally:
+            if admin_user is not None:
+                admin_user.delete()
+
+        self.report(results)
+        if options["save"]:
+            with open(options["save"], "w") as file:
+                json.dump(results, file, indent=2, ensure_ascii=False)
+        if options["compare"]:
+            self.compare(results, options["compare"], options["tolerance"])
+
+    def get_user(self, username):
+        users = get_user_model().objects
+        user = users.filter(username=username).first() if username else users.filter(is_staff=False).first()
+        if user is None:
+            raise CommandError("Нет пользователя: запустите generate_fixtures или укажите --user")
+        return user
+
+    def site_targets(self, user):
+        car = Car.objects.order_by("pk").first()
+        if car is None:
+            raise CommandError("В базе нет машин: запустите generate_fixtures")
+        dealer = Dealer.objects.order_by("pk").first()
+        rental = self.tracked_rental(user)
+        start = (timezone.now() + timedelta(days=3)).replace(microsecond=0)
+        end = start + timedelta(days=2)
+        lat, lon = (float(dealer.latitude), float(dealer.longitude)) if dealer else (43.24, 76.89)
+        objects = {"car": car, "rental": rental}
+        params = {
+            "car_search": {"q": f"{car.brand} {car.model}", "pickup_date": start.date(), "dropoff_date": end.date()},
+            "car_quote": {"cars": car.pk, "start": start.isoformat(), "end": end.isoformat()},
+            "nearest_cars": {"lat": lat, "lon": lon},
+            "nearest_dealers": {"lat": lat, "lon": lon},
+            "api_availability": {"start": start.isoformat(), "end": end.isoformat()},
+            "api_locations": {"car": car.pk},
+        }
+
+        targets = []
+        for pattern in rental_urls.urlpatterns:
+            name = pattern.name
+            if not name or name in SKIPPED:
+                continue
+            kwargs = {}
+            for key in pattern.pattern.converters:
+                if key == "pk":
+                    source = objects[PK_SOURCES.get(name, "car")]
+                    kwargs[key] = source.pk if source is not None else None
+                elif key == "type":
+                    kwargs[key] = car.type
+            if None in kwargs.values():
+                self.stdout.write(self.style.WARNING(f"{name}: нет аренды с трекингом у пользователя, пропущено"))
+                continue
+            url = reverse(name, kwargs=kwargs)
+            if name in params:
+                url = f"{url}?{urlencode(params[name])}"
+            targets.append((name, url))
+        return targets
+
+    def tracked_rental(self, user):
+        for rental_id in Rental.objects.filter(user=user).order_by("-end_time").values_list("pk", flat=True)[:50]:
+            if TripTracking.objects.filter(rental_id=rental_id).exists():
+                return Rental(pk=rental_id)
+        return None
+
+    def admin_targets(self):
+        targets = []
+        for model in admin.site._registry:
+            opts = model._meta
+            try:
+                targets.append((f"admin:{opts.model_name}", reverse(f"admin:{opts.app_label}_{opts.model_name}_changelist")))
+            except NoReverseMatch:
+                continue
+        return sorted(targets)
+
+    def request(self, client, url):
+        response = client.get(url)
+        if response.streaming:
+            # Запросы к базе потоковых ответов идут при чтении тела
+            b"".join(response.streaming_content)
+        return response.status_code
+
+    def measure(self, client, url, options):
+        for _ in range(options["warmup"]):
+            self.request(client, url)
+        latencies, queries, statuses = [], [], set()
+        for _ in range(options["rounds"]):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                statuses.add(self.request(client, url))
+                latencies.append(time.perf_counter() - started)
+            queries.append(len(captured))
+
+        tracemalloc.start()
+        try:
+            self.request(client, url)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return {
+            "url": url,
+            "status": sorted(statuses),
+            "queries": max(queries),
+            "p50_ms": percentile(latencies, 0.5) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "peak_kb": peak // 1024,
+        }
+
+    def report(self, results):
+        self.stdout.write(f"{'URL':28} {'коды':10} {'запросов':>8} {'p50 мс':>8} {'p95 мс':>8} {'p99 мс':>8} {'пик КБ':>8}")
+        for name, row in results.items():
+            self.stdout.write(
+                f"{name:28} {','.join(map(str, row['status'])):10} {row['queries']:8} "
+                f"{row['p50_ms']:8.1f} {row['p95_ms']:8.1f} {row['p99_ms']:8.1f} {row['peak_kb']:8}"
+            )
+        # ru_maxrss — КБ на Linux
+        self.stdout.write(f"\nПик памяти процесса: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024} МБ")
+        if settings.DEBUG:
+            self.stdout.write(self.style.WARNING("DEBUG включён: задержки выше, чем в production"))
+
+    def compare(self, results, path, tolerance):
+        with open(path) as file:
+            baseline = json.load(file)
+        regressions = []
+        for name, row in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            if row["queries"] > before["queries"]:
+                regressions.append(f"{name}: запросов {before['queries']} -> {row['queries']}")
+            if row["p95_ms"] > before["p95_ms"] * tolerance:
+                regressions.append(f"{name}: p95 {before['p95_ms']:.1f} -> {row['p95_ms']:.1f} мс")
+        if regressions:
+            raise CommandError("Регрессии:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"Регрессий относительно {path} нет"))
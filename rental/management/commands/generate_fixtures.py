@@ -0,0 +1,46 @@
+"""
+Данные production-масштаба для нагрузочных тестов (rental/fixtures.py).
+
+    python manage.py generate_fixtures --seed 1 --cars 5000 --points 5000000
+    python manage.py bench_urls --user fixture1_0
+"""
+import time
+from dataclasses import fields
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from rental.fixtures import PASSWORD, FixtureGenerator, FixtureSizes
+
+
+class Command(BaseCommand):
+    help = "Генерирует дилеров, машины, пользователей, аренды, отзывы, операции, штрафы и трекинг"
+
+    def add_arguments(self, parser):
+        for field in fields(FixtureSizes):
+            parser.add_argument(f"--{field.name.replace('_', '-')}", type=int, default=field.default)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--now", help="Момент «сейчас» (ISO 8601) для полностью одинаковых дат")
+
+    def handle(self, *args, **options):
+        sizes = FixtureSizes(**{field.name: options[field.name] for field in fields(FixtureSizes)})
+        now = None
+        if options["now"]:
+            now = datetime.fromisoformat(options["now"])
+            if timezone.is_naive(now):
+                now = timezone.make_aware(now)
+        generator = FixtureGenerator(
+            sizes, seed=options["seed"], batch_size=options["batch_size"], now=now,
+            log=lambda message: self.stdout.write(f"  {message}"),
+        )
+        started = time.perf_counter()
+        try:
+            generator.generate()
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово за {time.perf_counter() - started:.1f} с. "
+            f"Пользователи fixture{options['seed']}_N, пароль {PASSWORD}"
+        ))
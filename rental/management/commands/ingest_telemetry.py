@@ -0,0 +1,31 @@
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rental.telemetry import READERS, ingest
+
+
+class Command(BaseCommand):
+    help = "Загружает GPS-точки из файла NDJSON или CSV (- для stdin)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=sorted(READERS), default=None,
+                            help="По умолчанию определяется по расширению файла")
+        parser.add_argument("--batch-size", type=int, default=settings.TELEMETRY_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("csv" if path.endswith(".csv") else "ndjson")
+        started = time.perf_counter()
+        if path == "-":
+            accepted, rejected = ingest(sys.stdin, fmt=fmt, batch_size=options["batch_size"])
+        else:
+            with open(path, newline="") as f:
+                accepted, rejected = ingest(f, fmt=fmt, batch_size=options["batch_size"])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Принято точек: {accepted}, отклонено: {rejected}, {accepted / elapsed:.0f} точек/с"
+        ))
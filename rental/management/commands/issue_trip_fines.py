@@ -0,0 +1,37 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from rental.analytics import issue_trip_fines
+
+
+def parse_moment(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        raise CommandError(f"Не удалось разобрать дату: {value}")
+    return moment if timezone.is_aware(moment) else timezone.make_aware(moment)
+
+
+class Command(BaseCommand):
+    help = "Анализирует треки закончившихся аренд и выписывает штрафы за нарушения"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="Начало окна по окончанию аренды (по умолчанию сутки назад)")
+        parser.add_argument("--until", help="Конец окна (по умолчанию сейчас)")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true", help="Посчитать штрафы, но не сохранять")
+
+    def handle(self, *args, **options):
+        until = parse_moment(options["until"]) if options["until"] else timezone.now()
+        since = parse_moment(options["since"]) if options["since"] else until - timedelta(days=1)
+        started = time.perf_counter()
+        checked, issued = issue_trip_fines(
+            since, until, dry_run=options["dry_run"], batch_size=options["batch_size"],
+        )
+        verb = "Нашлось бы" if options["dry_run"] else "Выписано"
+        self.stdout.write(self.style.SUCCESS(
+            f"Проверено аренд: {checked}, {verb} штрафов: {issued} за {time.perf_counter() - started:.2f} с"
+        ))
@@ -0,0 +1,79 @@
+"""
+Копии для уже загруженных фото машин и аватаров (rental/images.py).
+
+Pillow режет и кодирует в пуле процессов, основной процесс читает
+исходники и пишет файлы и JSON. Уже обработанные файлы пропускаются.
+
+    python manage.py process_images --workers 8
+"""
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from accounts.models import UserModel
+from rental.images import read_source, render_variants, save_variants, store_variants
+from rental.models import Car
+from rental.signals import car_variants_saved
+
+TARGETS = {
+    "cars": (Car, "image", "image_variants", ("card", "detail"), car_variants_saved),
+    "avatars": (UserModel, "avatar", "avatar_variants", ("avatar",), None),
+}
+
+
+class Command(BaseCommand):
+    help = "Генерирует уменьшенные копии существующих изображений параллельно"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--targets", default=",".join(TARGETS), help=f"Через запятую из: {', '.join(TARGETS)}")
+        parser.add_argument("--workers", type=int, default=os.cpu_count())
+        parser.add_argument("--force", action="store_true", help="Пересчитать и уже обработанные")
+
+    def handle(self, *args, **options):
+        with ProcessPoolExecutor(max_workers=options["workers"]) as executor:
+            for target in options["targets"].split(","):
+                started = time.perf_counter()
+                done, failed = self.process(executor, *TARGETS[target.strip()], options)
+                self.stdout.write(
+                    f"{target}: обработано {done}, ошибок {failed} за {time.perf_counter() - started:.1f} с"
+                )
+
+    def process(self, executor, model, field_name, variants_field, sizes, on_saved, options):
+        rows = model.objects.exclude(Q(**{f"{field_name}__isnull": True}) | Q(**{field_name: ""}))
+        rows = rows.order_by("pk").values_list("pk", field_name, variants_field)
+        # Не больше двух задач на процесс в очереди: исходники не копятся в памяти
+        limit = options["workers"] * 2
+        pending = {}
+        done = failed = 0
+
+        def collect(futures):
+            nonlocal done, failed
+            for future in futures:
+                pk, name = pending.pop(future)
+                try:
+                    original, variants = future.result()
+                    info = store_variants(name, original, variants)
+                    save_variants(model, pk, field_name, variants_field, info, on_saved)
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{model._meta.model_name} {pk} ({name}): {e}")
+
+        for pk, name, info in rows.iterator(chunk_size=1000):
+            if not options["force"] and (info or {}).get("source") == name:
+                continue
+            try:
+                data = read_source(name)
+            except OSError as e:
+                failed += 1
+                self.stderr.write(f"{model._meta.model_name} {pk} ({name}): {e}")
+                continue
+            pending[executor.submit(render_variants, data, sizes)] = (pk, name)
+            if len(pending) >= limit:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+        collect(list(pending))
+        return done, failed
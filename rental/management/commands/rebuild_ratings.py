@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rental.catalog_cache import bump_cars
+from rental.models import Car
+from rental.ratings import rebuild_car_ratings
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает review_count/rating_sum/rating_avg у всех машин"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        updated = rebuild_car_ratings(batch_size=options["batch_size"])
+        # Пересчёт шёл через UPDATE без сигналов — сбрасываем кеш карточек
+        bump_cars(Car.objects.values_list("pk", flat=True).iterator())
+        self.stdout.write(self.style.SUCCESS(
+            f"Пересчитано машин: {updated} за {time.perf_counter() - started:.2f} с"
+        ))
@@ -0,0 +1,36 @@
+"""
+Обновление сводок выручки и загрузки парка (rental/reports.py).
+
+    python manage.py refresh_rollups --rebuild   # первый запуск или проверка
+    python manage.py refresh_rollups --every 60  # инкрементально раз в минуту
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from rental import reports
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает сводки парка по очереди изменений и добавляет новые операции журнала"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true", help="Построить сводки заново из исходных таблиц")
+        parser.add_argument("--every", type=float, help="Повторять каждые N секунд")
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            started = time.perf_counter()
+            reports.rebuild()
+            self.stdout.write(self.style.SUCCESS(f"Сводки построены заново за {time.perf_counter() - started:.1f} с"))
+            return
+        while True:
+            started = time.perf_counter()
+            cells, operations = reports.refresh()
+            self.stdout.write(
+                f"Ячеек (машина, день): {cells}, новых операций: {operations} "
+                f"за {(time.perf_counter() - started) * 1000:.0f} мс"
+            )
+            if not options["every"]:
+                break
+            time.sleep(options["every"])
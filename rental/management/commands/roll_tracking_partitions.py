@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rental.tracking import archive_partition, ensure_partitions, is_partitioned, partitions_to_archive
+
+
+class Command(BaseCommand):
+    help = "Создаёт секции трекинга на будущие месяцы и архивирует старые"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ahead", type=int, default=3, help="На сколько месяцев вперёд готовить секции")
+        parser.add_argument("--archive-after", type=int, default=settings.TRIP_ARCHIVE_AFTER_MONTHS,
+                            help="Архивировать секции старше стольких месяцев (0 — не архивировать)")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError("Таблица трекинга не секционирована (нужен PostgreSQL и миграция rental 0006)")
+
+        if options["dry_run"]:
+            self.stdout.write("Архивировались бы: " + ", ".join(
+                name for name, _ in partitions_to_archive(options["archive_after"])
+            ) if options["archive_after"] else "Архивирование отключено")
+            return
+
+        for name in ensure_partitions(options["ahead"]):
+            self.stdout.write(f"Создана секция {name}")
+
+        if options["archive_after"]:
+            for name, month in partitions_to_archive(options["archive_after"]):
+                archive = archive_partition(name, month)
+                self.stdout.write(
+                    f"{name}: {archive.rows} точек -> {archive.path} ({archive.size_bytes} байт)"
+                )
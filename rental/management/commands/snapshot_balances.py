@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rental.ledger import take_snapshots
+
+
+class Command(BaseCommand):
+    help = "Делает слепки балансов по журналу операций и сверяет их с балансами пользователей"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        created, drift = take_snapshots(batch_size=options["batch_size"])
+        for user_id, difference in sorted(drift.items()):
+            self.stdout.write(self.style.WARNING(f"Пользователь {user_id}: баланс расходится с журналом на {difference}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Слепков: {created}, расхождений: {len(drift)} за {time.perf_counter() - started:.2f} с"
+        ))
@@ -0,0 +1,198 @@
+"""
+Метрики представлений для Prometheus поверх django_prometheus.
+
+django_prometheus даёт задержку и число запросов по представлениям
+(django_http_requests_latency_seconds_by_view_method), запросы к базе и
+обращения к кешу в целом. Здесь к ним добавляется разбивка по
+представлению (имя URL):
+
+- rental_view_db_queries / rental_view_db_seconds — число SQL-запросов и
+  суммарное время базы на один HTTP-запрос. N+1 виден как рост числа
+  запросов у одного представления;
+- rental_view_template_seconds — время рендеринга TemplateResponse;
+- rental_view_cache_hits_total / rental_view_cache_misses_total — попадания
+  в кеш (get, get_many и {% cache %} идут через него) через бэкенды этого
+  модуля. Они же ведут общие счётчики django_cache_* из django_prometheus:
+  его собственные бэкенды возвращают `cached or default` и считают
+  закешированные 0, [] и {} промахами, поэтому в основе — бэкенды Django.
+
+Счётчики запроса лежат в contextvar: sync_to_async копирует контекст,
+поэтому запросы async-представлений и потоков rental/aio.py тоже
+учитываются. Запросы медленнее SLOW_REQUEST_SECONDS пишутся в лог
+rental.slow_requests вместе с их SQL.
+"""
+import logging
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache.backends import filebased, locmem
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django_prometheus.cache.metrics import django_cache_get_total, django_cache_hits_total, django_cache_misses_total
+from prometheus_client import Counter, Histogram
+
+logger = logging.getLogger("rental.slow_requests")
+
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, float("inf"))
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, float("inf"))
+
+VIEW_DB_QUERIES = Histogram(
+    "rental_view_db_queries", "SQL-запросов на HTTP-запрос", ["view"], buckets=QUERY_BUCKETS,
+)
+VIEW_DB_SECONDS = Histogram(
+    "rental_view_db_seconds", "Суммарное время SQL на HTTP-запрос", ["view"], buckets=TIME_BUCKETS,
+)
+VIEW_TEMPLATE_SECONDS = Histogram(
+    "rental_view_template_seconds", "Время рендеринга шаблона ответа", ["view"], buckets=TIME_BUCKETS,
+)
+VIEW_CACHE_HITS = Counter("rental_view_cache_hits_total", "Попаданий в кеш за запросы представления", ["view"])
+VIEW_CACHE_MISSES = Counter("rental_view_cache_misses_total", "Промахов кеша за запросы представления", ["view"])
+
+# Сколько SQL хранить для лога медленного запроса
+MAX_LOGGED_QUERIES = 200
+
+_MISSING = object()
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "template_started", "cache_hits", "cache_misses", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_started = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.statements = []
+
+
+_current = ContextVar("rental_request_stats", default=None)
+
+
+def current_stats():
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        if len(stats.statements) < MAX_LOGGED_QUERIES:
+            stats.statements.append((elapsed, sql))
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # Обёртка живёт на объекте соединения, переподключение не должно её дублировать
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def view_name(request):
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match else "<unresolved>"
+
+
+class ViewMetricsMiddleware:
+    """Ставить сразу после PrometheusBeforeMiddleware"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token, started = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, stats, started)
+        return response
+
+    async def __acall__(self, request):
+        stats, token, started = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, stats, started)
+        return response
+
+    def start(self):
+        stats = RequestStats()
+        return stats, _current.set(stats), time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # Вызывается прямо перед response.render()
+        stats = _current.get()
+        if stats is not None:
+            stats.template_started = time.perf_counter()
+            name = view_name(request)
+            response.add_post_render_callback(
+                lambda rendered: VIEW_TEMPLATE_SECONDS.labels(name).observe(time.perf_counter() - stats.template_started)
+            )
+        return response
+
+    def finish(self, request, stats, started):
+        elapsed = time.perf_counter() - started
+        name = view_name(request)
+        VIEW_DB_QUERIES.labels(name).observe(stats.queries)
+        VIEW_DB_SECONDS.labels(name).observe(stats.db_seconds)
+        if stats.cache_hits:
+            VIEW_CACHE_HITS.labels(name).inc(stats.cache_hits)
+        if stats.cache_misses:
+            VIEW_CACHE_MISSES.labels(name).inc(stats.cache_misses)
+        threshold = getattr(settings, "SLOW_REQUEST_SECONDS", 1.0)
+        if threshold and elapsed >= threshold:
+            self.log_slow(request, name, elapsed, stats)
+
+    def log_slow(self, request, name, elapsed, stats):
+        slowest = sorted(stats.statements, key=lambda item: item[0], reverse=True)
+        logger.warning(
+            "Медленный запрос %s %s (%s): %.0f мс, SQL: %d запросов, %.0f мс\n%s",
+            request.method, request.get_full_path(), name, elapsed * 1000, stats.queries, stats.db_seconds * 1000,
+            "\n".join(f"  {seconds * 1000:7.1f} мс  {sql}" for seconds, sql in slowest),
+        )
+
+
+class ViewCacheMetricsMixin:
+    """
+    Попадания и промахи get в счётчики текущего запроса и django_prometheus.
+    get_many отдельно не считается: BaseCache.get_many вызывает get на каждый ключ.
+    """
+    metrics_backend = None
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version=version)
+        hit = value is not _MISSING
+        django_cache_get_total.labels(backend=self.metrics_backend).inc()
+        (django_cache_hits_total if hit else django_cache_misses_total).labels(backend=self.metrics_backend).inc()
+        stats = _current.get()
+        if stats is not None:
+            if hit:
+                stats.cache_hits += 1
+            else:
+                stats.cache_misses += 1
+        return value if hit else default
+
+
+class LocMemCache(ViewCacheMetricsMixin, locmem.LocMemCache):
+    metrics_backend = "locmem"
+
+
+class FileBasedCache(ViewCacheMetricsMixin, filebased.FileBasedCache):
+    metrics_backend = "filebased"
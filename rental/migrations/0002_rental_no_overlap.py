@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:51
+
+import django.contrib.postgres.constraints
+import django.db.models.expressions
+import rental.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('rental', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['car', 'end_time'], name='rental_car_end_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='rental',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(expressions=[(rental.models.Int8Range('car', django.db.models.expressions.CombinedExpression(models.F('car'), '+', models.Value(1))), '&&'), (rental.models.TsTzRange('start_time', 'end_time'), '&&')], name='rental_no_overlap'),
+        ),
+    ]
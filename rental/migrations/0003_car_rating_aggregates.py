@@ -0,0 +1,42 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:57
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_rating_aggregates(apps, schema_editor):
+    Car = apps.get_model('rental', 'Car')
+    CarReview = apps.get_model('rental', 'CarReview')
+    reviews = CarReview.objects.filter(car=OuterRef('pk')).order_by().values('car')
+    Car.objects.update(
+        review_count=Coalesce(Subquery(reviews.annotate(c=Count('pk')).values('c')), 0),
+        rating_sum=Coalesce(Subquery(reviews.annotate(s=Sum('rating')).values('s')), 0.0),
+        rating_avg=Coalesce(Subquery(reviews.annotate(a=models.Avg('rating')).values('a')), 0.0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0002_rental_no_overlap'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='rating_avg',
+            field=models.FloatField(db_index=True, default=0.0, editable=False, verbose_name='Средняя оценка'),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_sum',
+            field=models.FloatField(default=0.0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество отзывов'),
+        ),
+        migrations.RunPython(fill_rating_aggregates, migrations.RunPython.noop),
+    ]
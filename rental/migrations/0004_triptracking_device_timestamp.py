@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0003_car_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='triptracking',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время фиксации'),
+        ),
+    ]
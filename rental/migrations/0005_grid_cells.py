@@ -0,0 +1,39 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:00
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Cast, Floor, Mod
+
+
+def fill_grid_cells(apps, schema_editor):
+    # Та же формула, что в rental.geo.grid_cell (шаг 0.01°, 36000 столбцов)
+    step = Value(Decimal('0.01'))
+    cell = Cast(
+        Floor((F('latitude') + 90) / step) * 36000 + Mod(Floor((F('longitude') + 180) / step), 36000),
+        models.BigIntegerField(),
+    )
+    for model_name in ('Dealer', 'CarLocation'):
+        apps.get_model('rental', model_name).objects.update(grid_cell=cell)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0004_triptracking_device_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carlocation',
+            name='grid_cell',
+            field=models.BigIntegerField(db_index=True, editable=False, null=True, verbose_name='Ячейка сетки'),
+        ),
+        migrations.AddField(
+            model_name='dealer',
+            name='grid_cell',
+            field=models.BigIntegerField(db_index=True, editable=False, null=True, verbose_name='Ячейка сетки'),
+        ),
+        migrations.RunPython(fill_grid_cells, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,159 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:02
+
+from datetime import datetime, timezone
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.migrations.exceptions import IrreversibleError
+
+TABLE = 'rental_triptracking'
+LEGACY_TABLE = 'rental_triptracking_legacy'
+SEQUENCE = 'rental_triptracking_part_id_seq'
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def partition_triptracking(apps, schema_editor):
+    """
+    Пересоздаёт rental_triptracking как таблицу, секционированную по месяцам
+    (PARTITION BY RANGE timestamp), и переносит в неё старые строки.
+    Первичный ключ становится (id, timestamp) — ключ секционирования обязан
+    в него входить. Identity-столбцы в секционированных таблицах появились
+    только в PostgreSQL 17, поэтому id берётся из обычной последовательности.
+    Отдельного индекса по rental_id нет: его покрывает triptracking_rental_ts_idx.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {LEGACY_TABLE}')
+        cursor.execute(f'SELECT min("timestamp"), max("timestamp"), max(id) FROM {LEGACY_TABLE}')
+        first, last, max_id = cursor.fetchone()
+
+        cursor.execute(f'CREATE SEQUENCE IF NOT EXISTS {SEQUENCE} AS bigint')
+        cursor.execute(f"SELECT setval('{SEQUENCE}', %s, false)", [(max_id or 0) + 1])
+        cursor.execute(f'''
+            CREATE TABLE {TABLE} (
+                id bigint NOT NULL DEFAULT nextval('{SEQUENCE}'),
+                "timestamp" timestamp with time zone NOT NULL,
+                latitude numeric(9, 6) NOT NULL,
+                longitude numeric(9, 6) NOT NULL,
+                rental_id bigint NOT NULL
+                    CONSTRAINT rental_triptracking_rental_id_fk REFERENCES rental_rental (id)
+                    DEFERRABLE INITIALLY DEFERRED,
+                CONSTRAINT rental_triptracking_id_ts_pkey PRIMARY KEY (id, "timestamp")
+            ) PARTITION BY RANGE ("timestamp")
+        ''')
+        cursor.execute(f'ALTER SEQUENCE {SEQUENCE} OWNED BY {TABLE}.id')
+        cursor.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+
+        now = datetime.now(timezone.utc)
+        month = (first or now).astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        until = add_months(max(last or now, now).astimezone(timezone.utc), 3)
+        while month < until:
+            upper = add_months(month, 1)
+            cursor.execute(
+                f'CREATE TABLE {TABLE}_p{month:%Y%m} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)',
+                [month, upper],
+            )
+            month = upper
+
+        cursor.execute(f'''
+            INSERT INTO {TABLE} (id, "timestamp", latitude, longitude, rental_id)
+            SELECT id, "timestamp", latitude, longitude, rental_id FROM {LEGACY_TABLE}
+        ''')
+        # Отложенные проверки внешнего ключа — сейчас: с ними в этой же
+        # транзакции нельзя создать индекс (AddIndex ниже)
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        cursor.execute(f'DROP TABLE {LEGACY_TABLE}')
+
+
+def unpartition_triptracking(apps, schema_editor):
+    """
+    Возвращает обычную таблицу как в 0001 (id — identity, индекс по rental_id)
+    со всеми точками из секций. Точки архивированных секций лежат только
+    в файлах .trk, поэтому при наличии архивов откат запрещён.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM rental_trackarchive)')
+        if cursor.fetchone()[0]:
+            raise IrreversibleError(
+                'Секции трекинга архивированы (rental_trackarchive): их точек нет в базе, откат 0006 потерял бы их'
+            )
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {LEGACY_TABLE}')
+        cursor.execute(f'''
+            CREATE TABLE {TABLE} (
+                id bigint NOT NULL PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
+                "timestamp" timestamp with time zone NOT NULL,
+                latitude numeric(9, 6) NOT NULL,
+                longitude numeric(9, 6) NOT NULL,
+                rental_id bigint NOT NULL
+                    CONSTRAINT rental_triptracking_rental_id_fk REFERENCES rental_rental (id)
+                    DEFERRABLE INITIALLY DEFERRED
+            )
+        ''')
+        cursor.execute(f'CREATE INDEX rental_triptracking_rental_id_idx ON {TABLE} (rental_id)')
+        cursor.execute(f'''
+            INSERT INTO {TABLE} (id, "timestamp", latitude, longitude, rental_id)
+            SELECT id, "timestamp", latitude, longitude, rental_id FROM {LEGACY_TABLE}
+        ''')
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), coalesce(max(id), 0) + 1, false) FROM {TABLE}"
+        )
+        # Вместе с секциями и последовательностью rental_triptracking_part_id_seq
+        cursor.execute(f'DROP TABLE {LEGACY_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0005_grid_cells'),
+    ]
+
+    operations = [
+        # Раньше секционирования: откат должен успеть проверить архивы до удаления таблицы
+        migrations.CreateModel(
+            name='TrackArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('partition', models.CharField(max_length=63, unique=True, verbose_name='Секция')),
+                ('period_start', models.DateTimeField(verbose_name='Начало периода')),
+                ('period_end', models.DateTimeField(verbose_name='Конец периода')),
+                ('path', models.CharField(max_length=500, verbose_name='Файл архива')),
+                ('rows', models.PositiveBigIntegerField(verbose_name='Точек')),
+                ('size_bytes', models.PositiveBigIntegerField(verbose_name='Размер, байт')),
+                ('min_rental_id', models.BigIntegerField(null=True, verbose_name='Мин. id аренды')),
+                ('max_rental_id', models.BigIntegerField(null=True, verbose_name='Макс. id аренды')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+            ],
+            options={
+                'verbose_name': 'Архив трекинга',
+                'verbose_name_plural': 'Архивы трекинга',
+            },
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(partition_triptracking, unpartition_triptracking),
+            ],
+            # Состояние — как у новой таблицы: без индекса по rental_id.
+            # Составной ключ (id, timestamp) в Django 5.1 не выразить, для ORM
+            # ключом остаётся id — его значения по-прежнему уникальны (одна последовательность).
+            state_operations=[
+                migrations.AlterField(
+                    model_name='triptracking',
+                    name='rental',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='tracking', to='rental.rental', verbose_name='Аренда'),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='triptracking',
+            index=models.Index(fields=['rental', 'timestamp'], name='triptracking_rental_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0006_partition_triptracking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fine',
+            name='kind',
+            field=models.CharField(choices=[('MANUAL', 'Вручную'), ('SPEEDING', 'Превышение скорости'), ('GEOFENCE', 'Выезд за геозону')], default='MANUAL', max_length=10, verbose_name='Вид'),
+        ),
+    ]
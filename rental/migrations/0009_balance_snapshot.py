@@ -0,0 +1,31 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0008_history_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Баланс')),
+                ('last_transaction_id', models.BigIntegerField(verbose_name='Последняя учтённая операция')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Слепок баланса',
+                'verbose_name_plural': 'Слепки баланса',
+                'indexes': [models.Index(fields=['user', 'last_transaction_id'], name='snapshot_user_txn_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:13
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0009_balance_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PricingRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название')),
+                ('car_type', models.CharField(blank=True, choices=[('Sedan', 'Седан'), ('SUV', 'Внедорожник'), ('Hatchback', 'Хэтчбек'), ('Cabriolet', 'Кабриолет'), ('Coupe', 'Купе'), ('Minivan', 'Минивэн'), ('Pickup', 'Пикап')], max_length=20, verbose_name='Тип машины')),
+                ('season_start', models.DateField(blank=True, null=True, verbose_name='Начало сезона')),
+                ('season_end', models.DateField(blank=True, null=True, verbose_name='Конец сезона (включительно)')),
+                ('min_hours', models.PositiveIntegerField(default=0, verbose_name='От скольких часов аренды')),
+                ('multiplier', models.DecimalField(decimal_places=3, help_text='1.200 — наценка 20%, 0.900 — скидка 10%', max_digits=5, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Множитель')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Действует')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Изменено')),
+                ('dealer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='rental.dealer', verbose_name='Дилер')),
+            ],
+            options={
+                'verbose_name': 'Правило цены',
+                'verbose_name_plural': 'Правила цены',
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:34
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Вектор считается в базе, чтобы его не обходили bulk_create и update()
+CREATE_TRIGGERS = '''
+CREATE FUNCTION rental_car_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.brand, '') || ' ' || coalesce(NEW.model, '')), 'A')
+        || setweight(to_tsvector('russian', coalesce(NEW.description, '')), 'B')
+        || setweight(to_tsvector('simple', coalesce((SELECT name FROM rental_dealer WHERE id = NEW.dealer_id), '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER rental_car_search_vector
+    BEFORE INSERT OR UPDATE OF brand, model, description, dealer_id ON rental_car
+    FOR EACH ROW EXECUTE FUNCTION rental_car_search_vector();
+
+CREATE FUNCTION rental_dealer_search_vector() RETURNS trigger AS $$
+BEGIN
+    -- Пересчёт через триггер машины
+    UPDATE rental_car SET dealer_id = dealer_id WHERE dealer_id = NEW.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER rental_dealer_search_vector
+    AFTER UPDATE OF name ON rental_dealer
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION rental_dealer_search_vector();
+
+UPDATE rental_car SET brand = brand;
+'''
+
+DROP_TRIGGERS = '''
+DROP TRIGGER IF EXISTS rental_dealer_search_vector ON rental_dealer;
+DROP FUNCTION IF EXISTS rental_dealer_search_vector();
+DROP TRIGGER IF EXISTS rental_car_search_vector ON rental_car;
+DROP FUNCTION IF EXISTS rental_car_search_vector();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0011_car_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+        migrations.AddIndex(
+            model_name='car',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='car_search_vector_idx'),
+        ),
+    ]
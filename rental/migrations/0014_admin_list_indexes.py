@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0013_car_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='carreview',
+            index=models.Index(fields=['rating', 'id'], name='carreview_rating_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['transaction_type', 'id'], name='transaction_type_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fine',
+            index=models.Index(fields=['kind', 'id'], name='fine_kind_id_idx'),
+        ),
+    ]
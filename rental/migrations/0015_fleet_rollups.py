@@ -0,0 +1,191 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Изменения аренд и штрафов попадают в очередь rental_rollupchange
+# триггерами уровня оператора: bulk_create, update() и COPY дают одну
+# строку на машину, а не на каждую изменённую строку.
+CREATE_TRIGGERS = '''
+CREATE FUNCTION rental_rollup_rentals_changed() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO rental_rollupchange (car_id, start_time, end_time)
+    SELECT car_id, min(start_time), max(end_time) FROM changed_rows GROUP BY car_id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER rental_rollup_rentals_inserted
+    AFTER INSERT ON rental_rental REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rental_rollup_rentals_changed();
+
+CREATE TRIGGER rental_rollup_rentals_deleted
+    AFTER DELETE ON rental_rental REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rental_rollup_rentals_changed();
+
+CREATE FUNCTION rental_rollup_rentals_updated() RETURNS trigger AS $$
+BEGIN
+    -- Старый и новый период: аренду могли перенести на другие дни или машину
+    INSERT INTO rental_rollupchange (car_id, start_time, end_time)
+    SELECT car_id, min(start_time), max(end_time) FROM (
+        SELECT o.car_id, o.start_time, o.end_time FROM old_rows o JOIN new_rows n ON n.id = o.id
+        WHERE (o.car_id, o.start_time, o.end_time, o.total_price)
+              IS DISTINCT FROM (n.car_id, n.start_time, n.end_time, n.total_price)
+        UNION ALL
+        SELECT n.car_id, n.start_time, n.end_time FROM old_rows o JOIN new_rows n ON n.id = o.id
+        WHERE (o.car_id, o.start_time, o.end_time, o.total_price)
+              IS DISTINCT FROM (n.car_id, n.start_time, n.end_time, n.total_price)
+    ) changed
+    GROUP BY car_id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER rental_rollup_rentals_updated
+    AFTER UPDATE ON rental_rental REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rental_rollup_rentals_updated();
+
+CREATE FUNCTION rental_rollup_fines_changed() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO rental_rollupchange (car_id, start_time, end_time)
+    SELECT r.car_id, min(f.issued_at), max(f.issued_at)
+    FROM changed_rows f JOIN rental_rental r ON r.id = f.rental_id
+    GROUP BY r.car_id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER rental_rollup_fines_inserted
+    AFTER INSERT ON rental_fine REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rental_rollup_fines_changed();
+
+CREATE TRIGGER rental_rollup_fines_deleted
+    AFTER DELETE ON rental_fine REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rental_rollup_fines_changed();
+
+CREATE FUNCTION rental_rollup_fines_updated() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO rental_rollupchange (car_id, start_time, end_time)
+    SELECT r.car_id, min(f.issued_at), max(f.issued_at)
+    FROM (
+        SELECT o.rental_id, o.issued_at FROM old_rows o JOIN new_rows n ON n.id = o.id
+        WHERE (o.rental_id, o.issued_at, o.amount) IS DISTINCT FROM (n.rental_id, n.issued_at, n.amount)
+        UNION ALL
+        SELECT n.rental_id, n.issued_at FROM old_rows o JOIN new_rows n ON n.id = o.id
+        WHERE (o.rental_id, o.issued_at, o.amount) IS DISTINCT FROM (n.rental_id, n.issued_at, n.amount)
+    ) f JOIN rental_rental r ON r.id = f.rental_id
+    GROUP BY r.car_id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER rental_rollup_fines_updated
+    AFTER UPDATE ON rental_fine REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rental_rollup_fines_updated();
+
+CREATE FUNCTION rental_rollup_car_updated() RETURNS trigger AS $$
+BEGIN
+    -- Сводка показывает текущего дилера и тип машины
+    UPDATE rental_dailyfleetstats SET dealer_id = NEW.dealer_id, car_type = NEW.type WHERE car_id = NEW.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER rental_rollup_car_updated
+    AFTER UPDATE OF dealer_id, type ON rental_car
+    FOR EACH ROW WHEN (OLD.dealer_id IS DISTINCT FROM NEW.dealer_id OR OLD.type IS DISTINCT FROM NEW.type)
+    EXECUTE FUNCTION rental_rollup_car_updated();
+
+-- Существующая история: весь период каждой машины, первый refresh_rollups её посчитает
+INSERT INTO rental_rollupchange (car_id, start_time, end_time)
+SELECT car_id, min(start_time), max(end_time) FROM (
+    SELECT car_id, start_time, end_time FROM rental_rental
+    UNION ALL
+    SELECT r.car_id, f.issued_at, f.issued_at FROM rental_fine f JOIN rental_rental r ON r.id = f.rental_id
+) history
+GROUP BY car_id;
+'''
+
+DROP_TRIGGERS = '''
+DROP TRIGGER IF EXISTS rental_rollup_car_updated ON rental_car;
+DROP FUNCTION IF EXISTS rental_rollup_car_updated();
+DROP TRIGGER IF EXISTS rental_rollup_fines_updated ON rental_fine;
+DROP FUNCTION IF EXISTS rental_rollup_fines_updated();
+DROP TRIGGER IF EXISTS rental_rollup_fines_deleted ON rental_fine;
+DROP TRIGGER IF EXISTS rental_rollup_fines_inserted ON rental_fine;
+DROP FUNCTION IF EXISTS rental_rollup_fines_changed();
+DROP TRIGGER IF EXISTS rental_rollup_rentals_updated ON rental_rental;
+DROP FUNCTION IF EXISTS rental_rollup_rentals_updated();
+DROP TRIGGER IF EXISTS rental_rollup_rentals_deleted ON rental_rental;
+DROP TRIGGER IF EXISTS rental_rollup_rentals_inserted ON rental_rental;
+DROP FUNCTION IF EXISTS rental_rollup_rentals_changed();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0014_admin_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('car_id', models.BigIntegerField()),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Сводка')),
+                ('value', models.BigIntegerField(default=0, verbose_name='Последний учтённый id')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyLedgerStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('transaction_type', models.CharField(choices=[('TOP_UP', 'Пополнение баланса'), ('RENTAL', 'Оплата аренды')], max_length=10, verbose_name='Тип')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='Сумма')),
+                ('operations', models.PositiveIntegerField(default=0, verbose_name='Операций')),
+            ],
+            options={
+                'verbose_name': 'Операции за день',
+                'verbose_name_plural': 'Операции по дням',
+                'constraints': [models.UniqueConstraint(fields=('day', 'transaction_type'), name='ledgerstats_day_type_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyFleetStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('car_type', models.CharField(choices=[('Sedan', 'Седан'), ('SUV', 'Внедорожник'), ('Hatchback', 'Хэтчбек'), ('Cabriolet', 'Кабриолет'), ('Coupe', 'Купе'), ('Minivan', 'Минивэн'), ('Pickup', 'Пикап')], max_length=20, verbose_name='Тип')),
+                ('rentals', models.PositiveIntegerField(default=0, verbose_name='Начато аренд')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+                ('rented_seconds', models.PositiveIntegerField(default=0, verbose_name='Секунд в аренде')),
+                ('fines', models.PositiveIntegerField(default=0, verbose_name='Штрафов')),
+                ('fines_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма штрафов')),
+                ('car', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='rental.car', verbose_name='Автомобиль')),
+                ('dealer', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='rental.dealer', verbose_name='Дилер')),
+            ],
+            options={
+                'verbose_name': 'Сводка парка за день',
+                'verbose_name_plural': 'Отчёт по парку',
+                'indexes': [models.Index(fields=['car', 'day'], name='fleetstats_car_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'car'), name='fleetstats_day_car_uniq')],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='fine',
+            index=models.Index(fields=['issued_at'], name='fine_issued_idx'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
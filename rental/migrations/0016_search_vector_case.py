@@ -0,0 +1,54 @@
+from django.db import migrations
+
+# lower() и словари text search приводят регистр по LC_CTYPE базы: в
+# кластере с локалью C кириллица остаётся как есть, и «Астана» в векторе не
+# находится по «астана». Текст приводится к нижнему регистру заранее, без
+# зависимости от локали; запрос нижним регистром строит rental/search.py.
+CREATE_FUNCTIONS = '''
+CREATE FUNCTION rental_search_lower(value text) RETURNS text AS $$
+    SELECT lower(translate(
+        value,
+        'АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯӘҒҚҢӨҰҮҺІ',
+        'абвгдеёжзийклмнопрстуфхцчшщъыьэюяәғқңөұүһі'
+    ))
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE OR REPLACE FUNCTION rental_car_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', rental_search_lower(coalesce(NEW.brand, '') || ' ' || coalesce(NEW.model, ''))), 'A')
+        || setweight(to_tsvector('russian', rental_search_lower(coalesce(NEW.description, ''))), 'B')
+        || setweight(to_tsvector('simple', rental_search_lower(coalesce((SELECT name FROM rental_dealer WHERE id = NEW.dealer_id), ''))), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+UPDATE rental_car SET brand = brand;
+'''
+
+RESTORE_FUNCTIONS = '''
+CREATE OR REPLACE FUNCTION rental_car_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.brand, '') || ' ' || coalesce(NEW.model, '')), 'A')
+        || setweight(to_tsvector('russian', coalesce(NEW.description, '')), 'B')
+        || setweight(to_tsvector('simple', coalesce((SELECT name FROM rental_dealer WHERE id = NEW.dealer_id), '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP FUNCTION IF EXISTS rental_search_lower(text);
+
+UPDATE rental_car SET brand = brand;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0015_fleet_rollups'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_FUNCTIONS, RESTORE_FUNCTIONS),
+    ]
@@ -1,10 +1,28 @@
+from datetime import datetime
+
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import BigIntegerRangeField, DateTimeRangeField, RangeOperators
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
-from django.utils.timezone import now
+from django.db.models.functions import Upper
+from django.utils.timezone import make_aware, now
 
 from accounts.models import UserModel
+from .geo import grid_cell
+
+
+class Int8Range(models.Func):
+    function = "INT8RANGE"
+    output_field = BigIntegerRangeField()
+
+
+class TsTzRange(models.Func):
+    function = "TSTZRANGE"
+    output_field = DateTimeRangeField()
 
 
 # 1. Дилерский центр (точка получения машины)
@@ -13,6 +31,11 @@ class Dealer(models.Model):
     address = models.TextField(verbose_name="Адрес")
     latitude = models.DecimalField(max_digits=9, decimal_places=6, verbose_name="Широта")
     longitude = models.DecimalField(max_digits=9, decimal_places=6, verbose_name="Долгота")
+    grid_cell = models.BigIntegerField(null=True, editable=False, db_index=True, verbose_name="Ячейка сетки")
+
+    def save(self, *args, **kwargs):
+        self.grid_cell = grid_cell(self.latitude, self.longitude)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -50,6 +73,8 @@ class Car(models.Model):
     description = models.TextField(blank=True, null=True, verbose_name="Описание")
     dealer = models.ForeignKey("Dealer", on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Дилер")
     image = models.ImageField(upload_to='cars/', null=True, blank=True, verbose_name="Фото")
+    # Размеры фото и его уменьшенные копии (rental/images.py)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Копии фото")
     transmission = models.CharField(
         max_length=20,
         choices=TransmissionTypes.choices,
@@ -63,12 +88,68 @@ class Car(models.Model):
         default=FuelTypes.PB95,
     )
 
+    # Агрегаты отзывов, поддерживаются сигналами CarReview (rental/ratings.py)
+    review_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество отзывов")
+    rating_sum = models.FloatField(default=0.0, editable=False, verbose_name="Сумма оценок")
+    rating_avg = models.FloatField(default=0.0, editable=False, db_index=True, verbose_name="Средняя оценка")
+
+    # Марка, модель, описание и дилер для поиска; заполняет триггер в базе (rental/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    RATING_FIELDS = ("review_count", "rating_sum", "rating_avg")
+    # Пишутся только UPDATE'ами из rental/ratings.py и rental/images.py
+    DERIVED_FIELDS = RATING_FIELDS + ("image_variants",)
+
+    def save(self, *args, **kwargs):
+        # Обычное сохранение не должно затирать производные поля значениями,
+        # прочитанными раньше
+        if not self._state.adding and kwargs.get("update_fields") is None and not kwargs.get("force_insert"):
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DERIVED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.brand} {self.model} ({self.year})"
 
     class Meta:
         verbose_name = "Машина"
         verbose_name_plural = "Машины"
+        indexes = [
+            # Каталог и API: фильтр по типу и доступности, порядок по id
+            models.Index(fields=["type", "is_available", "id"], name="car_type_available_idx"),
+            # Только доступные машины: обычно это малая часть парка
+            models.Index(fields=["id"], condition=models.Q(is_available=True), name="car_available_idx"),
+            # Поиск в админке (icontains = UPPER(col) LIKE UPPER('%...%')):
+            # триграммы по тому же выражению, иначе индекс не подходит
+            GinIndex(OpClass(Upper("brand"), name="gin_trgm_ops"), name="car_brand_trgm_idx"),
+            GinIndex(OpClass(Upper("model"), name="gin_trgm_ops"), name="car_model_trgm_idx"),
+            GinIndex(fields=["search_vector"], name="car_search_vector_idx"),
+        ]
+
+
+# Правила цены: наценки и скидки по типу машины, дилеру, сезону и длительности (rental/pricing.py)
+class PricingRule(models.Model):
+    name = models.CharField(max_length=100, verbose_name="Название")
+    car_type = models.CharField(max_length=20, choices=Car.CarType.choices, blank=True, verbose_name="Тип машины")
+    dealer = models.ForeignKey(Dealer, on_delete=models.CASCADE, null=True, blank=True, verbose_name="Дилер")
+    season_start = models.DateField(null=True, blank=True, verbose_name="Начало сезона")
+    season_end = models.DateField(null=True, blank=True, verbose_name="Конец сезона (включительно)")
+    min_hours = models.PositiveIntegerField(default=0, verbose_name="От скольких часов аренды")
+    multiplier = models.DecimalField(
+        max_digits=5, decimal_places=3, validators=[MinValueValidator(0)],
+        verbose_name="Множитель", help_text="1.200 — наценка 20%, 0.900 — скидка 10%",
+    )
+    is_active = models.BooleanField(default=True, verbose_name="Действует")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменено")
+
+    def __str__(self):
+        return f"{self.name} (x{self.multiplier})"
+
+    class Meta:
+        verbose_name = "Правило цены"
+        verbose_name_plural = "Правила цены"
 
 
 # 3. Отзывы пользователей на машины
@@ -82,6 +163,12 @@ class CarReview(models.Model):
     def __str__(self):
         return f"Отзыв {self.user.username} на {self.car} ({self.rating})"
 
+    class Meta:
+        indexes = [
+            # Фильтр по оценке в админке при сортировке по -id
+            models.Index(fields=["rating", "id"], name="carreview_rating_id_idx"),
+        ]
+
 
 class Rental(models.Model):
     PAYMENT_METHODS = (
@@ -126,17 +213,47 @@ class Rental(models.Model):
     is_paid = models.BooleanField(default=False, verbose_name="Оплачено")
     total_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True, verbose_name="Итоговая цена")
 
+    def fill_period(self):
+        """Период аренды из даты/времени получения и возврата, если он не задан явно"""
+        if self.end_time is None and self.pickup_date and self.pickup_time:
+            self.start_time = make_aware(datetime.combine(self.pickup_date, self.pickup_time))
+        if self.end_time is None and self.dropoff_date and self.dropoff_time:
+            self.end_time = make_aware(datetime.combine(self.dropoff_date, self.dropoff_time))
+
     def save(self, *args, **kwargs):
-        """Автоматический расчет стоимости аренды"""
-        if self.pickup_date and self.dropoff_date:
-            days = (self.dropoff_date - self.pickup_date).days
-            self.total_price = days * self.car.price_per_hour * 24  # Цена за сутки
+        """Автоматический расчет стоимости аренды (почасово, с правилами цены)"""
+        from .pricing import pricing_engine
+
+        self.fill_period()
+        if self.start_time and self.end_time and kwargs.get("update_fields") is None:
+            self.total_price = pricing_engine.quote_rental(self)["total"]
 
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Аренда {self.car} пользователем {self.user.username}"
 
+    class Meta:
+        indexes = [
+            # Проверка пересечений: у машины большинство аренд в прошлом,
+            # условие end_time > start отсекает их по индексу
+            models.Index(fields=["car", "end_time"], name="rental_car_end_idx"),
+            # История аренд пользователя, keyset-пагинация (rental/pagination.py)
+            models.Index(fields=["user", "start_time", "id"], name="rental_user_start_idx"),
+        ]
+        constraints = [
+            # Одна машина не может быть забронирована на пересекающиеся периоды.
+            # int8range(car_id, car_id + 1) вместо равенства car_id — чтобы
+            # обойтись встроенными GiST-операторами без расширения btree_gist.
+            ExclusionConstraint(
+                name="rental_no_overlap",
+                expressions=[
+                    (Int8Range("car", models.F("car") + 1), RangeOperators.OVERLAPS),
+                    (TsTzRange("start_time", "end_time"), RangeOperators.OVERLAPS),
+                ],
+            ),
+        ]
+
 
 class Transaction(models.Model):
     TRANSACTION_TYPES = (
@@ -152,6 +269,32 @@ class Transaction(models.Model):
     def __str__(self):
         return f"Транзакция {self.user.username}: {self.transaction_type} {self.amount}"
 
+    class Meta:
+        indexes = [
+            # История платежей пользователя, keyset-пагинация (rental/pagination.py)
+            models.Index(fields=["user", "timestamp", "id"], name="transaction_user_ts_idx"),
+            # Фильтр по типу в админке при сортировке по -id
+            models.Index(fields=["transaction_type", "id"], name="transaction_type_id_idx"),
+        ]
+
+
+# Слепки баланса по журналу операций (rental/ledger.py)
+class BalanceSnapshot(models.Model):
+    user = models.ForeignKey(UserModel, on_delete=models.CASCADE, related_name="balance_snapshots", verbose_name="Пользователь")
+    balance = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Баланс")
+    last_transaction_id = models.BigIntegerField(verbose_name="Последняя учтённая операция")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создан")
+
+    def __str__(self):
+        return f"Баланс {self.user_id}: {self.balance} на операции {self.last_transaction_id}"
+
+    class Meta:
+        verbose_name = "Слепок баланса"
+        verbose_name_plural = "Слепки баланса"
+        indexes = [
+            models.Index(fields=["user", "last_transaction_id"], name="snapshot_user_txn_idx"),
+        ]
+
 
 # 3. Текущее местоположение машины
 class CarLocation(models.Model):
@@ -159,6 +302,11 @@ class CarLocation(models.Model):
     latitude = models.DecimalField(max_digits=9, decimal_places=6, verbose_name="Широта")
     longitude = models.DecimalField(max_digits=9, decimal_places=6, verbose_name="Долгота")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+    grid_cell = models.BigIntegerField(null=True, editable=False, db_index=True, verbose_name="Ячейка сетки")
+
+    def save(self, *args, **kwargs):
+        self.grid_cell = grid_cell(self.latitude, self.longitude)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Местоположение {self.car} ({self.latitude}, {self.longitude})"
@@ -174,22 +322,135 @@ class CarLocation(models.Model):
 
 # 4. История перемещений (лог трекинга)
 class TripTracking(models.Model):
-    rental = models.ForeignKey("Rental", on_delete=models.CASCADE, related_name="tracking", verbose_name="Аренда")
-    timestamp = models.DateTimeField(auto_now_add=True, verbose_name="Время фиксации")
+    # Отдельный индекс не нужен: поиск по аренде идёт по triptracking_rental_ts_idx
+    rental = models.ForeignKey(
+        "Rental", on_delete=models.CASCADE, db_index=False, related_name="tracking", verbose_name="Аренда",
+    )
+    timestamp = models.DateTimeField(default=now, verbose_name="Время фиксации")  # время с устройства
     latitude = models.DecimalField(max_digits=9, decimal_places=6, verbose_name="Широта")
     longitude = models.DecimalField(max_digits=9, decimal_places=6, verbose_name="Долгота")
 
     def __str__(self):
         return f"Трек аренды {self.rental.id} ({self.latitude}, {self.longitude})"
 
+    class Meta:
+        # Таблица секционирована по месяцам (см. rental/tracking.py)
+        indexes = [
+            models.Index(fields=["rental", "timestamp"], name="triptracking_rental_ts_idx"),
+        ]
+
+
+# 5. Архивы старых секций трекинга
+class TrackArchive(models.Model):
+    partition = models.CharField(max_length=63, unique=True, verbose_name="Секция")
+    period_start = models.DateTimeField(verbose_name="Начало периода")
+    period_end = models.DateTimeField(verbose_name="Конец периода")
+    path = models.CharField(max_length=500, verbose_name="Файл архива")
+    rows = models.PositiveBigIntegerField(verbose_name="Точек")
+    size_bytes = models.PositiveBigIntegerField(verbose_name="Размер, байт")
+    min_rental_id = models.BigIntegerField(null=True, verbose_name="Мин. id аренды")
+    max_rental_id = models.BigIntegerField(null=True, verbose_name="Макс. id аренды")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создан")
+
+    def __str__(self):
+        return f"Архив {self.partition} ({self.rows} точек)"
+
+    class Meta:
+        verbose_name = "Архив трекинга"
+        verbose_name_plural = "Архивы трекинга"
+
 
 # 6. Штрафы
 class Fine(models.Model):
+    class Kind(models.TextChoices):
+        MANUAL = "MANUAL", "Вручную"
+        SPEEDING = "SPEEDING", "Превышение скорости"
+        GEOFENCE = "GEOFENCE", "Выезд за геозону"
+
     user = models.ForeignKey(UserModel, on_delete=models.CASCADE, verbose_name="Пользователь")
     rental = models.ForeignKey(Rental, on_delete=models.CASCADE, verbose_name="Аренда")
     amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Сумма штрафа")
     reason = models.TextField(verbose_name="Причина")
+    kind = models.CharField(max_length=10, choices=Kind.choices, default=Kind.MANUAL, verbose_name="Вид")
     issued_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата")
 
     def __str__(self):
         return f"Штраф {self.user.username} ({self.amount} руб.)"
+
+    class Meta:
+        indexes = [
+            # Фильтр по виду в админке при сортировке по -id
+            models.Index(fields=["kind", "id"], name="fine_kind_id_idx"),
+            # Штрафы машины за день при пересчёте сводок (rental/reports.py)
+            models.Index(fields=["issued_at"], name="fine_issued_idx"),
+        ]
+
+
+# 7. Сводки для отчётов по парку (rental/reports.py)
+class DailyFleetStats(models.Model):
+    """Аренды и штрафы машины за день. Пересчитывает refresh_rollups"""
+    day = models.DateField(verbose_name="День")
+    # Без внешних ключей: сводку не должны трогать каскады и блокировки машин
+    car = models.ForeignKey(Car, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+", verbose_name="Автомобиль")
+    dealer = models.ForeignKey(
+        Dealer, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name="+", verbose_name="Дилер",
+    )
+    car_type = models.CharField(max_length=20, choices=Car.CarType.choices, verbose_name="Тип")
+    rentals = models.PositiveIntegerField(default=0, verbose_name="Начато аренд")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Выручка")
+    rented_seconds = models.PositiveIntegerField(default=0, verbose_name="Секунд в аренде")
+    fines = models.PositiveIntegerField(default=0, verbose_name="Штрафов")
+    fines_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Сумма штрафов")
+
+    def __str__(self):
+        return f"Машина {self.car_id} за {self.day}"
+
+    class Meta:
+        verbose_name = "Сводка парка за день"
+        verbose_name_plural = "Отчёт по парку"
+        constraints = [
+            models.UniqueConstraint(fields=["day", "car"], name="fleetstats_day_car_uniq"),
+        ]
+        indexes = [
+            # Смена дилера или типа машины переписывает её строки
+            models.Index(fields=["car", "day"], name="fleetstats_car_day_idx"),
+        ]
+
+
+class DailyLedgerStats(models.Model):
+    """Операции журнала за день по типам"""
+    day = models.DateField(verbose_name="День")
+    transaction_type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES, verbose_name="Тип")
+    amount = models.DecimalField(max_digits=16, decimal_places=2, default=0, verbose_name="Сумма")
+    operations = models.PositiveIntegerField(default=0, verbose_name="Операций")
+
+    def __str__(self):
+        return f"{self.transaction_type} за {self.day}"
+
+    class Meta:
+        verbose_name = "Операции за день"
+        verbose_name_plural = "Операции по дням"
+        constraints = [
+            models.UniqueConstraint(fields=["day", "transaction_type"], name="ledgerstats_day_type_uniq"),
+        ]
+
+
+class RollupChange(models.Model):
+    """
+    Очередь изменений для сводки парка: период аренды или момент штрафа
+    машины. Строки пишут триггеры rental_rental и rental_fine (миграция 0015),
+    refresh_rollups забирает и удаляет их.
+    """
+    car_id = models.BigIntegerField()
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+
+
+class RollupWatermark(models.Model):
+    """До какого id источник уже учтён в сводках"""
+    name = models.CharField(max_length=50, unique=True, verbose_name="Сводка")
+    value = models.BigIntegerField(default=0, verbose_name="Последний учтённый id")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
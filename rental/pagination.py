@@ -0,0 +1,112 @@
+"""
+Keyset-пагинация (seek) для длинных списков.
+
+Вместо OFFSET страница продолжается с последней показанной строки:
+WHERE (поле, id) < (значение, id) ORDER BY поле DESC, id DESC LIMIT n.
+Запрос идёт по индексу (user, поле, id) и стоит одинаково на первой и
+на тысячной странице; COUNT(*) не нужен — признак следующей страницы
+даёт лишняя (n + 1)-я строка.
+
+Для списков админки по огромным таблицам EstimatedCountPaginator берёт
+число строк из статистики планировщика, если оно больше
+ADMIN_EXACT_COUNT_LIMIT: точный COUNT(*) по десяткам миллионов строк идёт
+секунды, а в подписи к списку достаточно порядка величины.
+"""
+import json
+
+from django.conf import settings
+from django.core import signing
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404
+from django.utils.functional import cached_property
+
+CURSOR_SALT = "rental.pagination"
+
+
+def encode_cursor(value, pk):
+    return signing.dumps([value.isoformat(), pk], salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(cursor):
+    """-> (iso-строка значения, pk); подделанный или битый курсор — 404"""
+    try:
+        value, pk = signing.loads(cursor, salt=CURSOR_SALT)
+    except (signing.BadSignature, ValueError, TypeError):
+        raise Http404("Неверный курсор страницы")
+    return value, pk
+
+
+class KeysetPaginationMixin:
+    """
+    Для ListView: страница по page_size строк по убыванию keyset_field.
+    get_queryset представления возвращает self.keyset_page(queryset).
+    В контекст добавляются next_cursor и has_next; paginate_by не
+    используется, чтобы ListView не строил Paginator с COUNT(*).
+    """
+    keyset_field = None
+    page_size = 20
+    cursor_param = "cursor"
+
+    def keyset_page(self, queryset):
+        """Срез queryset для текущей страницы (плюс одна строка-признак)"""
+        queryset = queryset.order_by(f"-{self.keyset_field}", "-pk")
+        cursor = self.request.GET.get(self.cursor_param)
+        if cursor:
+            value, pk = decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(**{f"{self.keyset_field}__lt": value}) | Q(**{self.keyset_field: value, "pk__lt": pk})
+            )
+        return queryset[:self.page_size + 1]
+
+    def get_context_data(self, **kwargs):
+        rows = list(self.object_list)
+        has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        context = super().get_context_data(object_list=rows, **kwargs)
+        context["has_next"] = has_next
+        context["next_cursor"] = (
+            encode_cursor(getattr(rows[-1], self.keyset_field), rows[-1].pk) if has_next else None
+        )
+        return context
+
+
+def table_estimate(model, using="default"):
+    """Строк в таблице по pg_class.reltuples; у секционированной — сумма секций"""
+    table = model._meta.db_table
+    with connections[using].cursor() as cursor:
+        # reltuples = -1 у таблицы, которую ещё не анализировали
+        cursor.execute(
+            """
+            SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)::bigint FROM pg_class c
+            WHERE c.oid = %s::regclass
+               OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = %s::regclass)
+            """,
+            [table, table],
+        )
+        return cursor.fetchone()[0]
+
+
+def estimate_count(queryset):
+    """Оценка числа строк: без фильтров — по таблице, с фильтрами — по плану запроса"""
+    if not queryset.query.where:
+        return table_estimate(queryset.model, queryset.db)
+    plan = json.loads(queryset.order_by().explain(format="json"))
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    count — оценка планировщика, если она не меньше ADMIN_EXACT_COUNT_LIMIT,
+    иначе точный COUNT(*). estimated показывает, что число приблизительное.
+    """
+    estimated = False
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate < settings.ADMIN_EXACT_COUNT_LIMIT:
+            return super().count
+        self.estimated = True
+        return estimate
@@ -0,0 +1,109 @@
+"""
+Права django-guardian на объекты страницы за один запрос.
+
+user.has_perm(perm, obj) через ObjectPermissionBackend каждый раз создаёт
+новый ObjectPermissionChecker — два запроса (права пользователя и его
+групп) на объект, в списке админки это запросы на каждую строку.
+ObjectPermissions живёт на HTTP-запросе (object_permissions(request)):
+prefetch(objects) загружает права на всю страницу через
+ObjectPermissionChecker.prefetch_perms, и has_perm/get_perms дальше
+отвечают из памяти.
+
+Загруженные права кладутся в общий кеш на OBJECT_PERMS_CACHE_TIMEOUT секунд
+под ключом с версией. Версию сдвигают сигналы UserObjectPermission,
+GroupObjectPermission и состава групп (rental/signals.py), так что
+assign_perm и remove_perm сразу дают новые ключи. assign_perm для
+queryset пишет через bulk_create мимо сигналов — после него нужен
+invalidate(), иначе права обновятся по таймауту.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from guardian.core import ObjectPermissionChecker
+
+from .catalog_cache import get_version, new_version
+
+VERSION_KEY = "objperms:version"
+PERMS_KEY = "objperms:{}:{}:{}:{}"
+
+
+def invalidate():
+    """Новая версия: права всех пользователей перечитываются из базы"""
+    cache.set(VERSION_KEY, new_version(), None)
+
+
+class ObjectPermissions:
+    def __init__(self, user):
+        self.user = user
+        self.checker = ObjectPermissionChecker(user)
+        self.perms = {}
+        self.version = None
+
+    @property
+    def enabled(self):
+        # Суперпользователю можно всё, неактивному — ничего: база не нужна
+        return self.user.is_authenticated and self.user.is_active and not self.user.is_superuser
+
+    def local_key(self, obj):
+        return ContentType.objects.get_for_model(obj).pk, str(obj.pk)
+
+    def prefetch(self, objects):
+        """Права на objects: из памяти, из общего кеша, остальное — из базы"""
+        if not self.enabled:
+            return
+        missing = {}
+        for obj in objects:
+            key = self.local_key(obj)
+            if key not in self.perms:
+                missing[key] = obj
+        if not missing:
+            return
+
+        if self.version is None:
+            self.version = get_version(VERSION_KEY)
+        cache_keys = {PERMS_KEY.format(self.version, self.user.pk, *key): key for key in missing}
+        for cache_key, perms in cache.get_many(cache_keys).items():
+            key = cache_keys[cache_key]
+            self.perms[key] = frozenset(perms)
+            del missing[key]
+        if not missing:
+            return
+
+        # prefetch_perms работает с объектами одной модели
+        by_type = defaultdict(list)
+        for key, obj in missing.items():
+            by_type[key[0]].append(obj)
+        loaded = {}
+        for objects_of_type in by_type.values():
+            self.checker.prefetch_perms(objects_of_type)
+        for key, obj in missing.items():
+            perms = self.checker.get_perms(obj)
+            self.perms[key] = frozenset(perms)
+            loaded[PERMS_KEY.format(self.version, self.user.pk, *key)] = list(perms)
+        cache.set_many(loaded, settings.OBJECT_PERMS_CACHE_TIMEOUT)
+
+    def get_perms(self, obj):
+        """Коды прав, выданных на obj пользователю и его группам"""
+        if not self.enabled:
+            return frozenset()
+        key = self.local_key(obj)
+        if key not in self.perms:
+            self.prefetch([obj])
+        return self.perms[key]
+
+    def has_perm(self, perm, obj):
+        if not self.user.is_active:
+            return False
+        if self.user.is_superuser:
+            return True
+        return perm.split(".", 1)[-1] in self.get_perms(obj)
+
+
+def object_permissions(request):
+    """ObjectPermissions текущего запроса"""
+    perms = getattr(request, "_object_permissions", None)
+    if perms is None:
+        perms = request._object_permissions = ObjectPermissions(request.user)
+    return perms
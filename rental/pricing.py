@@ -0,0 +1,169 @@
+"""
+Расчёт цены аренды.
+
+Цена почасовая: оплачиваемые часы — длительность [start, end), округлённая
+вверх до часа. Каждый час стоит price_per_hour машины, умноженную на все
+подходящие правила PricingRule: по типу машины и дилеру (пустое поле —
+любой), по сезону (дата часа попадает в [season_start, season_end]) и по
+длительности (аренда не короче min_hours). Множители правил перемножаются.
+
+Правила компилируются в таблицу в памяти процесса: (тип, дилер) ->
+кортеж правил, так что расчёт не ходит в базу за правилами. Таблица
+перестраивается, только когда правила меняются: сигналы PricingRule
+записывают в кеш новую версию, и движок сверяет её перед расчётом.
+"""
+import math
+import threading
+from datetime import datetime, time, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from time import time_ns
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Car, PricingRule
+
+RULES_VERSION_KEY = "pricing:rules_version"
+HOUR = timedelta(hours=1)
+CENTS = Decimal("0.01")
+
+
+def bump_rules_version():
+    """Помечает таблицу правил устаревшей во всех процессах, разделяющих кеш"""
+    cache.set(RULES_VERSION_KEY, time_ns(), None)
+
+
+def get_rules_version():
+    """Текущая версия правил (время изменения, нс); заводится, если кеш пуст"""
+    version = cache.get(RULES_VERSION_KEY)
+    if version is None:
+        cache.add(RULES_VERSION_KEY, time_ns(), None)
+        version = cache.get(RULES_VERSION_KEY)
+    return version
+
+
+def billed_hours(start, end):
+    return max(1, math.ceil((end - start) / HOUR))
+
+
+def split_by_day(start, end):
+    """[(дата, доля часов в этой дате), ...] по местному времени"""
+    parts = []
+    current = timezone.localtime(start)
+    end = timezone.localtime(end)
+    while current < end:
+        midnight = timezone.make_aware(datetime.combine(current.date() + timedelta(days=1), time.min))
+        upper = min(end, midnight)
+        parts.append((current.date(), Decimal((upper - current).total_seconds()) / 3600))
+        current = upper
+    return parts
+
+
+class RuleTable:
+    """
+    Скомпилированные правила одной версии: (car_type или "", dealer_id или
+    None) -> правила, и запомненные подборки candidates. Таблица не
+    меняется после сборки, а подборки считаются только из неё, поэтому
+    поток, взявший старую таблицу во время rebuild(), не запишет её правила
+    в новую.
+    """
+
+    __slots__ = ("version", "_table", "_candidates")
+
+    def __init__(self, table=None, version=None):
+        self.version = version
+        self._table = table or {}
+        self._candidates = {}
+
+    def candidates(self, car_type, dealer_id):
+        key = (car_type, dealer_id)
+        rules = self._candidates.get(key)
+        if rules is None:
+            keys = [("", None), (car_type, None)]
+            if dealer_id is not None:
+                keys += [("", dealer_id), (car_type, dealer_id)]
+            rules = tuple(rule for lookup in keys for rule in self._table.get(lookup, ()))
+            self._candidates[key] = rules
+        return rules
+
+
+class PricingEngine:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rules = RuleTable()
+
+    def rebuild(self, version=None):
+        """Компилирует активные правила и подменяет ими текущие одним присваиванием"""
+        table = {}
+        rules = PricingRule.objects.filter(is_active=True).order_by("pk").values_list(
+            "name", "car_type", "dealer_id", "season_start", "season_end", "min_hours", "multiplier",
+        )
+        for name, car_type, dealer_id, season_start, season_end, min_hours, multiplier in rules:
+            table.setdefault((car_type, dealer_id), []).append(
+                (name, season_start, season_end, min_hours, multiplier)
+            )
+        compiled = RuleTable({key: tuple(items) for key, items in table.items()}, version)
+        with self._lock:
+            self._rules = compiled
+        return compiled
+
+    def ensure_current(self):
+        """Актуальная таблица правил; расчёт целиком идёт по одной версии"""
+        # Если кеш очищен, заводится новая версия и все процессы перестроятся один раз
+        version = get_rules_version()
+        with self._lock:
+            rules = self._rules
+        if version != rules.version or version is None:
+            rules = self.rebuild(version)
+        return rules
+
+    def candidates(self, car_type, dealer_id):
+        """Правила, применимые к машине с таким типом и дилером"""
+        with self._lock:
+            rules = self._rules
+        return rules.candidates(car_type, dealer_id)
+
+    def price(self, car_type, dealer_id, price_per_hour, start, end, table=None):
+        """Цена одной машины на [start, end); table — снимок правил из ensure_current()"""
+        hours = billed_hours(start, end)
+        candidates = (table or self).candidates(car_type, dealer_id)
+        rules = [rule for rule in candidates if hours >= rule[3]]
+        base = Decimal(price_per_hour) * hours
+        if not rules:
+            return {"hours": hours, "base": base.quantize(CENTS), "total": base.quantize(CENTS), "rules": []}
+
+        applied = set()
+        total = Decimal(0)
+        for day, day_hours in split_by_day(start, start + hours * HOUR):
+            factor = Decimal(1)
+            for name, season_start, season_end, _, multiplier in rules:
+                if (season_start is None or season_start <= day) and (season_end is None or day <= season_end):
+                    factor *= multiplier
+                    applied.add(name)
+            total += day_hours * factor
+        total = (total * Decimal(price_per_hour)).quantize(CENTS, ROUND_HALF_UP)
+        return {"hours": hours, "base": base.quantize(CENTS), "total": total, "rules": sorted(applied)}
+
+    def quote_cars(self, cars, start, end):
+        """{car_id: расчёт} для уже загруженных машин — без запросов к Car"""
+        table = self.ensure_current()
+        return {
+            car.pk: self.price(car.type, car.dealer_id, car.price_per_hour, start, end, table)
+            for car in cars
+        }
+
+    def quote_car_ids(self, car_ids, start, end):
+        """{car_id: расчёт}: один запрос за нужными полями всех машин"""
+        cars = Car.objects.filter(pk__in=car_ids).only("type", "dealer_id", "price_per_hour")
+        return self.quote_cars(cars, start, end)
+
+    def quote_rental(self, rental):
+        """Расчёт для аренды; машина берётся из экземпляра, если уже загружена"""
+        if type(rental).car.is_cached(rental):
+            car = rental.car
+        else:
+            car = Car.objects.only("type", "dealer_id", "price_per_hour").get(pk=rental.car_id)
+        return self.quote_cars([car], rental.start_time, rental.end_time)[car.pk]
+
+
+pricing_engine = PricingEngine()
@@ -0,0 +1,52 @@
+"""
+Денормализованные агрегаты отзывов на Car: review_count, rating_sum, rating_avg.
+
+Сигналы CarReview меняют их одним UPDATE с F()-выражениями, без чтения
+строки и без агрегатов по reviews. rebuild_car_ratings пересчитывает
+значения целиком (команда rebuild_ratings).
+"""
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Car, CarReview
+
+
+def apply_review_delta(car_id, count_delta, sum_delta):
+    """Сдвигает агрегаты машины на count_delta отзывов и sum_delta баллов"""
+    count = F("review_count") + count_delta
+    total = F("rating_sum") + sum_delta
+    Car.objects.filter(pk=car_id).update(
+        review_count=count,
+        rating_sum=total,
+        # В UPDATE все F() ссылаются на старые значения строки
+        rating_avg=Case(
+            When(review_count__lte=-count_delta, then=Value(0.0)),
+            default=total / count,
+            output_field=FloatField(),
+        ),
+    )
+
+
+def rebuild_car_ratings(batch_size=1000):
+    """Полный пересчёт агрегатов пачками по диапазонам pk. Возвращает число машин."""
+    reviews = CarReview.objects.filter(car=OuterRef("pk")).order_by().values("car")
+    review_count = Coalesce(Subquery(reviews.annotate(c=Count("pk")).values("c")), 0)
+    rating_sum = Coalesce(Subquery(reviews.annotate(s=Sum("rating")).values("s")), 0.0)
+
+    updated = 0
+    last_pk = 0
+    while True:
+        pks = list(
+            Car.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:batch_size]
+        )
+        if not pks:
+            return updated
+        batch = Car.objects.filter(pk__gte=pks[0], pk__lte=pks[-1])
+        batch.update(review_count=review_count, rating_sum=rating_sum)
+        batch.update(rating_avg=Case(
+            When(review_count=0, then=Value(0.0)),
+            default=F("rating_sum") / F("review_count"),
+            output_field=FloatField(),
+        ))
+        updated += len(pks)
+        last_pk = pks[-1]
@@ -0,0 +1,335 @@
+"""
+Выручка и загрузка парка по дням — отчёты из сводных таблиц.
+
+DailyFleetStats — строка на машину и день (дилер и тип машины рядом):
+начатые аренды и их выручка (в день начала), секунды в аренде (аренда
+раскладывается по дням, которые задевает) и штрафы (в день выписки).
+DailyLedgerStats — операции журнала по дням и типам. Дни считаются в
+TIME_ZONE.
+
+Обновление инкрементальное (refresh, команда refresh_rollups):
+- триггеры аренд и штрафов (миграция 0015) пишут в очередь RollupChange
+  машину и задетый период; refresh забирает очередь и пересчитывает только
+  эти ячейки (машина, день). Правки, удаления, update() и bulk_create
+  учитываются одинаково;
+- журнал операций только дополняется, поэтому для него хватает водяного
+  знака: учитываются операции с id больше сохранённого в RollupWatermark.
+
+Панель в админке и CSV читают только сводки и справочники машин и
+дилеров. FLEET_ROWS_SQL считает то же самое прямо из аренд и штрафов —
+им пользуются rebuild и bench_reports для сравнения.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from .models import Car, DailyFleetStats, DailyLedgerStats, RollupWatermark, Transaction
+
+FLEET_WATERMARK = "fleet"
+LEDGER_WATERMARK = "ledger"
+# Операция получает id до коммита: более старые id могут появиться позже
+# более новых. Операции моложе LEDGER_LAG ждут следующего обновления.
+LEDGER_LAG = timedelta(minutes=5)
+
+METRICS = ("rentals", "revenue", "rented_seconds", "fines", "fines_amount")
+FLEET_COLUMNS = ("day", "car_id", "dealer_id", "car_type") + METRICS
+
+# Строки DailyFleetStats за дни [start, end) прямо из аренд и штрафов
+FLEET_ROWS_SQL = """
+WITH bounds AS (
+    SELECT (%(start)s::date::timestamp AT TIME ZONE %(tz)s) AS range_start,
+           (%(end)s::date::timestamp AT TIME ZONE %(tz)s) AS range_end
+), rental_days AS (
+    SELECT r.car_id, d.day, r.start_time >= d.day_start AS started, r.total_price,
+           ROUND(EXTRACT(EPOCH FROM LEAST(r.end_time, d.day_end) - GREATEST(r.start_time, d.day_start)))::integer AS seconds
+    FROM rental_rental r
+    CROSS JOIN bounds b
+    CROSS JOIN LATERAL (
+        SELECT g::date AS day,
+               (g::date::timestamp AT TIME ZONE %(tz)s) AS day_start,
+               ((g::date + 1)::timestamp AT TIME ZONE %(tz)s) AS day_end
+        FROM generate_series(
+            (GREATEST(r.start_time, b.range_start) AT TIME ZONE %(tz)s)::date,
+            ((LEAST(r.end_time, b.range_end) - interval '1 microsecond') AT TIME ZONE %(tz)s)::date,
+            interval '1 day'
+        ) AS g
+    ) d
+    WHERE r.end_time > b.range_start AND r.start_time < b.range_end
+), rentals AS (
+    SELECT car_id, day,
+           COUNT(*) FILTER (WHERE started) AS rentals,
+           COALESCE(SUM(total_price) FILTER (WHERE started), 0) AS revenue,
+           SUM(seconds) AS rented_seconds
+    FROM rental_days
+    GROUP BY car_id, day
+), fines AS (
+    SELECT r.car_id, (f.issued_at AT TIME ZONE %(tz)s)::date AS day, COUNT(*) AS fines, SUM(f.amount) AS fines_amount
+    FROM rental_fine f
+    JOIN rental_rental r ON r.id = f.rental_id
+    CROSS JOIN bounds b
+    WHERE f.issued_at >= b.range_start AND f.issued_at < b.range_end
+    GROUP BY 1, 2
+)
+SELECT COALESCE(r.day, f.day) AS day, c.id AS car_id, c.dealer_id, c.type AS car_type,
+       COALESCE(r.rentals, 0) AS rentals, COALESCE(r.revenue, 0) AS revenue,
+       COALESCE(r.rented_seconds, 0) AS rented_seconds,
+       COALESCE(f.fines, 0) AS fines, COALESCE(f.fines_amount, 0) AS fines_amount
+FROM rentals r
+FULL JOIN fines f ON f.car_id = r.car_id AND f.day = r.day
+JOIN rental_car c ON c.id = COALESCE(r.car_id, f.car_id)
+WHERE r.rentals > 0 OR r.rented_seconds > 0 OR f.fines > 0
+"""
+
+# Забирает очередь и пересчитывает задетые ячейки (машина, день) одним
+# запросом. Аренды машины за день ищутся условием ограничения
+# rental_no_overlap — по его GiST-индексу, штрафы — по fine_issued_idx.
+REFRESH_FLEET_SQL = """
+WITH taken AS (
+    DELETE FROM rental_rollupchange RETURNING id, car_id, start_time, end_time
+), cells AS (
+    SELECT DISTINCT t.car_id, g::date AS day
+    FROM taken t, generate_series(
+        (t.start_time AT TIME ZONE %(tz)s)::date, (t.end_time AT TIME ZONE %(tz)s)::date, interval '1 day'
+    ) AS g
+), computed AS (
+    SELECT b.car_id, b.day, c.dealer_id, c.type AS car_type,
+           r.rentals, COALESCE(r.revenue, 0) AS revenue, COALESCE(r.rented_seconds, 0) AS rented_seconds,
+           f.fines, COALESCE(f.fines_amount, 0) AS fines_amount
+    FROM (
+        SELECT car_id, day,
+               (day::timestamp AT TIME ZONE %(tz)s) AS day_start,
+               ((day + 1)::timestamp AT TIME ZONE %(tz)s) AS day_end
+        FROM cells
+    ) b
+    LEFT JOIN rental_car c ON c.id = b.car_id
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) FILTER (WHERE r.start_time >= b.day_start) AS rentals,
+               SUM(r.total_price) FILTER (WHERE r.start_time >= b.day_start) AS revenue,
+               SUM(ROUND(EXTRACT(EPOCH FROM LEAST(r.end_time, b.day_end) - GREATEST(r.start_time, b.day_start)))::integer)
+                   AS rented_seconds
+        FROM rental_rental r
+        WHERE int8range(r.car_id, r.car_id + 1) && int8range(b.car_id, b.car_id + 1)
+          AND tstzrange(r.start_time, r.end_time) && tstzrange(b.day_start, b.day_end)
+    ) r
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) AS fines, SUM(f.amount) AS fines_amount
+        FROM rental_fine f
+        JOIN rental_rental fr ON fr.id = f.rental_id
+        WHERE fr.car_id = b.car_id AND f.issued_at >= b.day_start AND f.issued_at < b.day_end
+    ) f
+), upserted AS (
+    INSERT INTO rental_dailyfleetstats (day, car_id, dealer_id, car_type, rentals, revenue, rented_seconds, fines, fines_amount)
+    SELECT day, car_id, dealer_id, car_type, rentals, revenue, rented_seconds, fines, fines_amount
+    FROM computed
+    WHERE car_type IS NOT NULL AND (rentals > 0 OR rented_seconds > 0 OR fines > 0)
+    ON CONFLICT (day, car_id) DO UPDATE SET
+        dealer_id = EXCLUDED.dealer_id, car_type = EXCLUDED.car_type,
+        rentals = EXCLUDED.rentals, revenue = EXCLUDED.revenue, rented_seconds = EXCLUDED.rented_seconds,
+        fines = EXCLUDED.fines, fines_amount = EXCLUDED.fines_amount
+    RETURNING 1
+), removed AS (
+    -- Пустые ячейки и ячейки удалённых машин
+    DELETE FROM rental_dailyfleetstats s USING computed c
+    WHERE s.car_id = c.car_id AND s.day = c.day
+      AND (c.car_type IS NULL OR NOT (c.rentals > 0 OR c.rented_seconds > 0 OR c.fines > 0))
+    RETURNING 1
+)
+SELECT (SELECT max(id) FROM taken), (SELECT count(*) FROM cells)
+"""
+
+LEDGER_ROWS_SQL = """
+SELECT ("timestamp" AT TIME ZONE %(tz)s)::date, transaction_type, SUM(amount), COUNT(*)
+FROM rental_transaction
+WHERE id > %(after)s AND id <= %(upto)s
+GROUP BY 1, 2
+"""
+
+ADD_LEDGER_SQL = f"""
+INSERT INTO rental_dailyledgerstats (day, transaction_type, amount, operations)
+{LEDGER_ROWS_SQL}
+ON CONFLICT (day, transaction_type) DO UPDATE SET
+    amount = rental_dailyledgerstats.amount + EXCLUDED.amount,
+    operations = rental_dailyledgerstats.operations + EXCLUDED.operations
+"""
+
+
+def set_watermark(name, value=None):
+    defaults = {} if value is None else {"value": value}
+    RollupWatermark.objects.update_or_create(name=name, defaults=defaults)
+
+
+def refresh_fleet():
+    """Пересчитывает ячейки из очереди -> число пересчитанных ячеек"""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(REFRESH_FLEET_SQL, {"tz": settings.TIME_ZONE})
+        last_change, cells = cursor.fetchone()
+        set_watermark(FLEET_WATERMARK, last_change)
+    return cells
+
+
+def refresh_ledger(now=None):
+    """Добавляет к сводке операции после водяного знака -> число операций"""
+    cutoff = (now or timezone.now()) - LEDGER_LAG
+    with transaction.atomic():
+        mark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=LEDGER_WATERMARK)
+        upto = (
+            Transaction.objects.filter(pk__gt=mark.value, timestamp__lt=cutoff).aggregate(upto=Max("pk"))["upto"]
+        )
+        if upto is None:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(ADD_LEDGER_SQL, {"tz": settings.TIME_ZONE, "after": mark.value, "upto": upto})
+        added = Transaction.objects.filter(pk__gt=mark.value, pk__lte=upto).count()
+        mark.value = upto
+        mark.save()
+    return added
+
+
+def refresh(now=None):
+    return refresh_fleet(), refresh_ledger(now)
+
+
+def rebuild(now=None):
+    """Сводки заново из исходных таблиц целиком (первый запуск, проверка)"""
+    cutoff = (now or timezone.now()) - LEDGER_LAG
+    columns = ", ".join(FLEET_COLUMNS)
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Очередь чистится вместе со сводкой: всё в ней уже учтено пересчётом
+        cursor.execute("TRUNCATE rental_dailyfleetstats, rental_dailyledgerstats, rental_rollupchange")
+        cursor.execute(
+            f"INSERT INTO rental_dailyfleetstats ({columns}) SELECT {columns} FROM ({FLEET_ROWS_SQL}) rows",
+            {"tz": settings.TIME_ZONE, "start": date.min, "end": date.max},
+        )
+        upto = Transaction.objects.filter(timestamp__lt=cutoff).aggregate(upto=Max("pk"))["upto"] or 0
+        cursor.execute(ADD_LEDGER_SQL, {"tz": settings.TIME_ZONE, "after": 0, "upto": upto})
+        set_watermark(FLEET_WATERMARK)
+        set_watermark(LEDGER_WATERMARK, upto)
+
+
+# Группировки отчёта: поля сводки для GROUP BY и подпись строки
+GROUPS = {
+    "dealer": ("dealer_id", "dealer__name"),
+    "type": ("car_type",),
+    "car": ("car_id", "car__brand", "car__model"),
+    "day": ("day",),
+}
+GROUP_LABELS = {"dealer": "Дилер", "type": "Тип машины", "car": "Машина", "day": "День"}
+CAR_TYPES = dict(Car.CarType.choices)
+
+
+def group_label(group_by, row):
+    if group_by == "dealer":
+        return row["dealer__name"] or "Без дилера"
+    if group_by == "type":
+        return CAR_TYPES.get(row["car_type"], row["car_type"])
+    if group_by == "car":
+        return f"{row['car__brand']} {row['car__model']}"
+    return row["day"].isoformat()
+
+
+def fleet_size(group_by):
+    """-> функция: ключ группы -> машин в ней сейчас (знаменатель загрузки)"""
+    if group_by == "dealer":
+        counts = dict(Car.objects.values_list("dealer_id").annotate(Count("pk")).order_by())
+    elif group_by == "type":
+        counts = dict(Car.objects.values_list("type").annotate(Count("pk")).order_by())
+    elif group_by == "car":
+        return lambda key: 1
+    else:
+        total = Car.objects.count()
+        return lambda key: total
+    return lambda key: counts.get(key, 0)
+
+
+def fleet_report(start, end, group_by="dealer"):
+    """
+    Строки отчёта за дни [start, end) из DailyFleetStats:
+    {"key", "label", метрики..., "utilization"} — загрузка как доля
+    машино-часов периода, проведённых в аренде.
+    """
+    fields = GROUPS[group_by]
+    rows = (
+        DailyFleetStats.objects.filter(day__gte=start, day__lt=end)
+        .values(*fields)
+        .annotate(**{metric: Sum(metric) for metric in METRICS})
+        .order_by(*fields)
+    )
+    size = fleet_size(group_by)
+    days = 1 if group_by == "day" else (end - start).days
+    report = []
+    for row in rows:
+        key = row[fields[0]]
+        capacity = size(key) * days * 86400
+        report.append({
+            "key": key,
+            "label": group_label(group_by, row),
+            **{metric: row[metric] for metric in METRICS},
+            "utilization": row["rented_seconds"] / capacity if capacity else 0.0,
+        })
+    return report
+
+
+def adhoc_fleet_totals(start, end, group_by="dealer"):
+    """
+    {ключ группы: (метрики...)} за [start, end), посчитанные из аренд и
+    штрафов без сводок — для сравнения в bench_reports и тестах
+    """
+    column = {"dealer": "dealer_id", "type": "car_type", "car": "car_id", "day": "day"}[group_by]
+    sums = ", ".join(f"SUM({metric})" for metric in METRICS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {column}, {sums} FROM ({FLEET_ROWS_SQL}) rows GROUP BY 1",
+            {"tz": settings.TIME_ZONE, "start": start, "end": end},
+        )
+        return {row[0]: normalize(row[1:]) for row in cursor.fetchall()}
+
+
+def fleet_totals(start, end, group_by="dealer"):
+    """То же, что adhoc_fleet_totals, из сводки"""
+    return {row["key"]: normalize(row[metric] for metric in METRICS) for row in fleet_report(start, end, group_by)}
+
+
+def normalize(values):
+    return tuple(Decimal(value).quantize(Decimal("0.01")) for value in values)
+
+
+def ledger_report(start, end):
+    """{тип операции: (сумма, операций)} за [start, end)"""
+    rows = (
+        DailyLedgerStats.objects.filter(day__gte=start, day__lt=end)
+        .values("transaction_type")
+        .annotate(amount=Sum("amount"), operations=Sum("operations"))
+        .order_by("transaction_type")
+    )
+    return {row["transaction_type"]: (row["amount"], row["operations"]) for row in rows}
+
+
+def export_rows(start, end):
+    """Строки CSV: день × дилер × тип машины"""
+    sizes = dict(
+        ((dealer_id, car_type), count)
+        for dealer_id, car_type, count in Car.objects.values_list("dealer_id", "type").annotate(Count("pk")).order_by()
+    )
+    rows = (
+        DailyFleetStats.objects.filter(day__gte=start, day__lt=end)
+        .values("day", "dealer_id", "dealer__name", "car_type")
+        .annotate(**{metric: Sum(metric) for metric in METRICS})
+        .order_by("day", "dealer__name", "car_type")
+    )
+    for row in rows:
+        capacity = sizes.get((row["dealer_id"], row["car_type"]), 0) * 86400
+        yield (
+            row["day"].isoformat(), row["dealer__name"] or "", row["car_type"],
+            row["rentals"], row["revenue"], round(row["rented_seconds"] / 3600, 2),
+            round(row["rented_seconds"] / capacity, 4) if capacity else "",
+            row["fines"], row["fines_amount"],
+        )
+
+
+EXPORT_HEADER = (
+    "day", "dealer", "car_type", "rentals", "revenue", "rented_hours", "utilization", "fines", "fines_amount",
+)
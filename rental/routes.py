@@ -0,0 +1,154 @@
+"""
+Упрощение маршрута аренды для отрисовки.
+
+Точки проецируются в локальные метры (равнопромежуточная проекция вокруг
+средней широты трека) — на масштабе поездки этого достаточно, и допуск
+можно задавать в метрах. Douglas–Peucker отбрасывает точки, отстоящие от
+упрощённой линии меньше чем на tolerance; Visvalingam–Whyatt — точки,
+образующие с соседями треугольник площадью меньше tolerance².
+"""
+import heapq
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .geo import KM_PER_DEGREE
+from .tracking import iter_track
+
+METERS_PER_DEGREE = KM_PER_DEGREE * 1000
+
+
+def project(points):
+    """[(lat, lon), ...] -> [(x, y), ...] в метрах"""
+    if not points:
+        return []
+    mean_latitude = sum(latitude for latitude, _ in points) / len(points)
+    scale_x = METERS_PER_DEGREE * math.cos(math.radians(mean_latitude))
+    return [(longitude * scale_x, latitude * METERS_PER_DEGREE) for latitude, longitude in points]
+
+
+def radial_filter(xy, tolerance):
+    """
+    Предварительный проход: отбрасывает точки ближе tolerance к последней
+    оставленной. Плотный GPS-трек (точка в секунду) сокращается в разы
+    дешёвым линейным проходом до квадратичного в худшем случае DP.
+    """
+    if len(xy) < 3 or tolerance <= 0:
+        return list(range(len(xy)))
+    limit = tolerance * tolerance
+    kept = [0]
+    last_x, last_y = xy[0]
+    for i in range(1, len(xy) - 1):
+        x, y = xy[i]
+        if (x - last_x) ** 2 + (y - last_y) ** 2 > limit:
+            kept.append(i)
+            last_x, last_y = x, y
+    kept.append(len(xy) - 1)
+    return kept
+
+
+def douglas_peucker(xy, tolerance):
+    """Индексы сохранённых точек. Итеративно — длинные треки не упираются в глубину рекурсии."""
+    count = len(xy)
+    if count < 3:
+        return list(range(count))
+    limit = tolerance * tolerance
+    keep = [False] * count
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        ax, ay = xy[first]
+        bx, by = xy[last]
+        dx, dy = bx - ax, by - ay
+        length = dx * dx + dy * dy
+        max_distance, index = 0.0, None
+        for i in range(first + 1, last):
+            px, py = xy[i]
+            # Квадрат расстояния от точки до отрезка [first, last], без корня
+            t = ((px - ax) * dx + (py - ay) * dy) / length if length else 0.0
+            t = 0.0 if t < 0 else 1.0 if t > 1 else t
+            ex, ey = px - ax - t * dx, py - ay - t * dy
+            distance = ex * ex + ey * ey
+            if distance > max_distance:
+                max_distance, index = distance, i
+        if index is not None and max_distance > limit:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [i for i, kept in enumerate(keep) if kept]
+
+
+def triangle_area(a, b, c):
+    return abs((b[0] - a[0]) * (c[1] - a[1]) - (c[0] - a[0]) * (b[1] - a[1])) / 2
+
+
+def visvalingam(xy, tolerance):
+    """Индексы сохранённых точек; порог площади — tolerance²"""
+    count = len(xy)
+    if count < 3:
+        return list(range(count))
+    threshold = tolerance * tolerance
+    previous = list(range(-1, count - 1))
+    following = list(range(1, count + 1))
+    removed = [False] * count
+    areas = [math.inf] * count
+    heap = []
+    for i in range(1, count - 1):
+        areas[i] = triangle_area(xy[i - 1], xy[i], xy[i + 1])
+        heap.append((areas[i], i))
+    heapq.heapify(heap)
+
+    while heap:
+        area, i = heapq.heappop(heap)
+        if removed[i] or area != areas[i]:
+            continue  # устаревшая запись
+        if area >= threshold:
+            break
+        removed[i] = True
+        before, after = previous[i], following[i]
+        following[before], previous[after] = after, before
+        for j in (before, after):
+            if 0 < j < count - 1:
+                # Площадь соседа не может стать меньше только что удалённой
+                areas[j] = max(area, triangle_area(xy[previous[j]], xy[j], xy[following[j]]))
+                heapq.heappush(heap, (areas[j], j))
+    return [i for i in range(count) if not removed[i]]
+
+
+ALGORITHMS = {
+    "dp": douglas_peucker,
+    "vw": visvalingam,
+}
+
+
+def simplify(points, tolerance, algorithm="dp"):
+    """[(lat, lon), ...] -> упрощённый [(lat, lon), ...]"""
+    xy = project(points)
+    candidates = radial_filter(xy, tolerance)
+    indices = ALGORITHMS[algorithm]([xy[i] for i in candidates], tolerance)
+    return [points[candidates[i]] for i in indices]
+
+
+def get_simplified_route(rental, tolerance, algorithm="dp"):
+    """
+    Упрощённый маршрут аренды. Для закончившихся аренд результат кешируется:
+    трек уже не меняется.
+    """
+    key = f"route:{rental.pk}:{algorithm}:{tolerance:g}"
+    finished = rental.end_time and rental.end_time <= timezone.now()
+    if finished:
+        route = cache.get(key)
+        if route is not None:
+            return route
+
+    points = [(float(latitude), float(longitude)) for _, latitude, longitude in iter_track(rental.pk)]
+    route = {
+        "points": len(points),
+        "route": [[round(latitude, 6), round(longitude, 6)] for latitude, longitude in simplify(points, tolerance, algorithm)],
+    }
+    if finished:
+        cache.set(key, route, settings.ROUTE_CACHE_TIMEOUT)
+    return route
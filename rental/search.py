@@ -0,0 +1,78 @@
+"""
+Поиск машин по марке, модели, описанию и названию дилера.
+
+Car.search_vector заполняет триггер в базе (миграции 0012, 0016): марка
+и модель с весом A, описание — B, дилер — C; текст приводится к нижнему
+регистру независимо от локали базы. Триггер на rental_dealer
+обновляет машины при переименовании дилера, так что вектор верен и после
+bulk_create и update(), мимо которых прошли бы сигналы.
+
+Совпадения ищутся по GIN-индексу вектора; опечатки в марке и модели
+ловит триграммное сходство (оператор %) по индексам на UPPER(brand) и
+UPPER(model) из миграции 0011. Результат упорядочен по рангу.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db.models import F, Q
+from django.db.models.functions import Greatest, Upper
+
+from .models import Car
+
+# Марки и модели — имена собственные, описание — русский текст со словоформами
+SEARCH_CONFIGS = ("simple", "russian")
+# Короткие слова дают слишком мало триграмм для осмысленного сходства
+MIN_FUZZY_WORD = 3
+MAX_WORDS = 5
+# Поля Car, которые покрывает search_vector (для поиска в админке)
+CAR_SEARCH_FIELDS = ("brand", "model", "description", "dealer__name")
+
+WORD_RE = re.compile(r"\w+")
+
+
+def search_words(text):
+    return WORD_RE.findall(text.upper())[:MAX_WORDS]
+
+
+def search_query(text):
+    # Вектор хранится в нижнем регистре (миграция 0016): регистр приводим
+    # здесь, а не в базе — с локалью C она кириллицу не понижает
+    text = text.lower()
+    query = None
+    for config in SEARCH_CONFIGS:
+        part = SearchQuery(text, config=config, search_type="websearch")
+        query = part if query is None else query | part
+    return query
+
+
+def filter_cars(queryset, text):
+    """
+    Машины из queryset, подходящие под text, с рангом в search_rank.
+    Порядок не меняется — его выбирает вызывающий (см. search_cars).
+    """
+    words = search_words(text)
+    if not words:
+        return queryset.none()
+    query = search_query(text)
+    condition = Q(search_vector=query)
+    for word in words:
+        if len(word) >= MIN_FUZZY_WORD:
+            condition |= Q(search_brand__trigram_similar=word) | Q(search_model__trigram_similar=word)
+    phrase = " ".join(words)
+    return (
+        queryset.alias(search_brand=Upper("brand"), search_model=Upper("model"))
+        .filter(condition)
+        .annotate(search_rank=SearchRank(F("search_vector"), query) + Greatest(
+            TrigramSimilarity("search_brand", phrase), TrigramSimilarity("search_model", phrase),
+        ))
+    )
+
+
+def search_cars(queryset, text):
+    """Подходящие машины, самые релевантные первыми"""
+    return filter_cars(queryset, text).order_by("-search_rank", "pk")
+
+
+def matching_car_ids(text):
+    """Подзапрос id подходящих машин — для фильтра по связанным моделям"""
+    return filter_cars(Car.objects.order_by(), text).values("pk")
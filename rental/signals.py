@@ -0,0 +1,157 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from guardian.models import GroupObjectPermission, UserObjectPermission
+
+from accounts.models import UserModel
+from . import images, permissions
+from .availability import availability_index
+from .catalog_cache import bump_availability, bump_car, forget_car
+from .models import Car, CarReview, PricingRule, Rental
+from .pricing import bump_rules_version
+from .ratings import apply_review_delta
+from .stats import (
+    FEATURED_CARS_KEY, TOTAL_BRANDS_KEY, TOTAL_CARS_KEY, TOTAL_REVIEWS_KEY, adjust_counter, invalidate,
+)
+
+
+# Значения снимаются сразу: после удаления Django обнуляет pk у экземпляра,
+# а колбэки on_commit выполняются позже.
+
+@receiver(post_save, sender=Car)
+def index_car(sender, instance, **kwargs):
+    """Обновляем тип/дилера/доступность машины в индексе занятости"""
+    transaction.on_commit(partial(
+        availability_index.update_car,
+        instance.pk, instance.type, instance.dealer_id, instance.is_available,
+    ))
+
+
+@receiver(post_delete, sender=Car)
+def unindex_car(sender, instance, **kwargs):
+    transaction.on_commit(partial(availability_index.remove_car, instance.pk))
+
+
+@receiver(post_save, sender=Car)
+def update_home_stats_on_car_save(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(adjust_counter, TOTAL_CARS_KEY, 1))
+    # Марка могла смениться или появиться новая — число марок пересчитаем
+    transaction.on_commit(partial(invalidate, FEATURED_CARS_KEY, TOTAL_BRANDS_KEY))
+
+
+@receiver(post_delete, sender=Car)
+def update_home_stats_on_car_delete(sender, instance, **kwargs):
+    transaction.on_commit(partial(adjust_counter, TOTAL_CARS_KEY, -1))
+    transaction.on_commit(partial(invalidate, FEATURED_CARS_KEY, TOTAL_BRANDS_KEY))
+
+
+@receiver(post_save, sender=Rental)
+def index_rental(sender, instance, **kwargs):
+    """Добавляем бронь в календарь машины после коммита"""
+    transaction.on_commit(partial(
+        availability_index.update_rental,
+        instance.pk, instance.car_id, instance.start_time, instance.end_time,
+    ))
+
+
+@receiver(post_delete, sender=Rental)
+def unindex_rental(sender, instance, **kwargs):
+    transaction.on_commit(partial(availability_index.remove_rental, instance.pk))
+
+
+@receiver(pre_save, sender=CarReview)
+def remember_review_rating(sender, instance, **kwargs):
+    """Запоминаем прежние машину и оценку, чтобы при правке сдвинуть агрегаты на разницу"""
+    instance._previous_rating = None
+    if instance.pk and not instance._state.adding:
+        instance._previous_rating = (
+            CarReview.objects.filter(pk=instance.pk).values_list("car_id", "rating").first()
+        )
+
+
+@receiver(post_save, sender=CarReview)
+def update_car_rating(sender, instance, created, **kwargs):
+    previous = getattr(instance, "_previous_rating", None)
+    if created or previous is None:
+        apply_review_delta(instance.car_id, 1, instance.rating)
+    elif previous[0] != instance.car_id:
+        apply_review_delta(previous[0], -1, -previous[1])
+        apply_review_delta(instance.car_id, 1, instance.rating)
+    elif previous[1] != instance.rating:
+        apply_review_delta(instance.car_id, 0, instance.rating - previous[1])
+    if created:
+        transaction.on_commit(partial(adjust_counter, TOTAL_REVIEWS_KEY, 1))
+
+
+@receiver(post_delete, sender=CarReview)
+def remove_car_rating(sender, instance, **kwargs):
+    apply_review_delta(instance.car_id, -1, -instance.rating)
+    transaction.on_commit(partial(adjust_counter, TOTAL_REVIEWS_KEY, -1))
+
+
+@receiver(post_save, sender=PricingRule)
+@receiver(post_delete, sender=PricingRule)
+def invalidate_pricing_rules(sender, **kwargs):
+    """Таблица правил перестроится при следующем расчёте цены"""
+    transaction.on_commit(bump_rules_version)
+
+
+@receiver(post_save, sender=Car)
+def bump_car_version(sender, instance, **kwargs):
+    """Новая версия машины: её фрагменты и ETag страниц каталога устаревают"""
+    transaction.on_commit(partial(bump_car, instance.pk))
+
+
+@receiver(post_delete, sender=Car)
+def forget_car_version(sender, instance, **kwargs):
+    transaction.on_commit(partial(forget_car, instance.pk))
+
+
+@receiver(post_save, sender=CarReview)
+@receiver(post_delete, sender=CarReview)
+def bump_car_version_on_review(sender, instance, **kwargs):
+    previous = getattr(instance, "_previous_rating", None)
+    if previous is not None and previous[0] != instance.car_id:
+        transaction.on_commit(partial(bump_car, previous[0]))
+    transaction.on_commit(partial(bump_car, instance.car_id))
+
+
+@receiver(post_save, sender=Rental)
+@receiver(post_delete, sender=Rental)
+def bump_availability_version(sender, **kwargs):
+    transaction.on_commit(bump_availability)
+
+
+def car_variants_saved(car_id):
+    bump_car(car_id)
+    # Витрина главной хранит экземпляры машин вместе с image_variants
+    invalidate(FEATURED_CARS_KEY)
+
+
+@receiver(post_save, sender=Car)
+def process_car_image(sender, instance, **kwargs):
+    images.schedule(instance, "image", "image_variants", ("card", "detail"), on_saved=car_variants_saved)
+
+
+@receiver(post_save, sender=UserModel)
+def process_avatar(sender, instance, **kwargs):
+    images.schedule(instance, "avatar", "avatar_variants", ("avatar",))
+
+
+@receiver(post_save, sender=UserObjectPermission)
+@receiver(post_delete, sender=UserObjectPermission)
+@receiver(post_save, sender=GroupObjectPermission)
+@receiver(post_delete, sender=GroupObjectPermission)
+def invalidate_object_permissions(sender, **kwargs):
+    """Права на объекты в кеше (rental/permissions.py) устарели"""
+    transaction.on_commit(permissions.invalidate)
+
+
+@receiver(m2m_changed, sender=UserModel.groups.through)
+def invalidate_object_permissions_on_groups(sender, action, **kwargs):
+    # Вместе с группами у пользователя меняются и права их объектов
+    if action.startswith("post_"):
+        transaction.on_commit(permissions.invalidate)
@@ -0,0 +1,75 @@
+"""
+Счётчики главной страницы в кеше Django.
+
+Каждая цифра лежит под своим ключом: сигналы Car/CarReview сдвигают
+счётчики через incr/decr, а то, что нельзя пересчитать по дельте
+(число марок, витрина машин), сбрасывают — оно досчитается при следующем
+запросе. В установившемся режиме главная не ходит в базу.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .aio import gather_queries
+from .models import Car, CarReview
+
+FEATURED_CARS_KEY = "home:featured_cars"
+TOTAL_CARS_KEY = "home:total_cars"
+TOTAL_BRANDS_KEY = "home:total_brands"
+TOTAL_REVIEWS_KEY = "home:total_reviews"
+
+HOME_STATS_KEYS = {
+    "cars": FEATURED_CARS_KEY,
+    "total_cars": TOTAL_CARS_KEY,
+    "total_brands": TOTAL_BRANDS_KEY,
+    "total_reviews": TOTAL_REVIEWS_KEY,
+}
+
+COMPUTE = {
+    "cars": lambda: list(Car.objects.filter(is_available=True)[:5]),
+    "total_cars": lambda: Car.objects.count(),
+    "total_brands": lambda: Car.objects.values("brand").distinct().count(),
+    "total_reviews": lambda: CarReview.objects.count(),
+}
+
+
+def get_timeout():
+    return getattr(settings, "HOME_STATS_TIMEOUT", 300)
+
+
+def get_home_stats():
+    """Словарь для контекста главной: один get_many, в базу — только за промахами"""
+    cached = cache.get_many(HOME_STATS_KEYS.values())
+    stats = {}
+    missing = {}
+    for name, key in HOME_STATS_KEYS.items():
+        if key in cached:
+            stats[name] = cached[key]
+        else:
+            stats[name] = missing[key] = COMPUTE[name]()
+    if missing:
+        cache.set_many(missing, get_timeout())
+    return stats
+
+
+async def aget_home_stats():
+    """То же для async-представлений: промахи досчитываются параллельно"""
+    cached = cache.get_many(HOME_STATS_KEYS.values())
+    stats = {name: cached[key] for name, key in HOME_STATS_KEYS.items() if key in cached}
+    missing = [name for name in HOME_STATS_KEYS if name not in stats]
+    if missing:
+        values = await gather_queries(*(COMPUTE[name] for name in missing))
+        stats.update(zip(missing, values))
+        cache.set_many({HOME_STATS_KEYS[name]: stats[name] for name in missing}, get_timeout())
+    return stats
+
+
+def adjust_counter(key, delta):
+    """Сдвигает счётчик, если он в кеше; иначе он досчитается при следующем запросе"""
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        pass
+
+
+def invalidate(*keys):
+    cache.delete_many(keys)
@@ -0,0 +1,190 @@
+"""
+Пакетная загрузка GPS-точек.
+
+Точки копятся в TelemetryBuffer и пишутся пачками: в PostgreSQL через
+COPY, на других базах через bulk_create. Последняя позиция каждой машины
+из пачки обновляется в CarLocation одним INSERT ... ON CONFLICT, если она
+новее сохранённой.
+"""
+import csv
+import io
+import json
+from datetime import timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .geo import grid_cell
+from .models import CarLocation, Rental, TripTracking
+
+CSV_FIELDS = ("rental_id", "latitude", "longitude", "timestamp")
+
+
+class InvalidPoint(ValueError):
+    pass
+
+
+def parse_point(data):
+    """dict -> (rental_id, timestamp, latitude, longitude)"""
+    try:
+        rental_id = int(data["rental_id"])
+        latitude = Decimal(str(data["latitude"])).quantize(Decimal("0.000001"))
+        longitude = Decimal(str(data["longitude"])).quantize(Decimal("0.000001"))
+        # json.loads принимает NaN: сравнение с ним бросило бы InvalidOperation
+        if not (latitude.is_finite() and longitude.is_finite()):
+            raise InvalidPoint(f"Некорректные координаты: {data!r}")
+    except (KeyError, TypeError, ValueError, InvalidOperation) as e:
+        raise InvalidPoint(f"Некорректная точка: {data!r}") from e
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise InvalidPoint(f"Координаты вне диапазона: {data!r}")
+
+    raw_timestamp = data.get("timestamp")
+    if raw_timestamp:
+        try:
+            # Несуществующая дата (2024-02-30) — ValueError, а не None
+            timestamp = parse_datetime(str(raw_timestamp))
+        except ValueError as e:
+            raise InvalidPoint(f"Некорректное время: {raw_timestamp!r}") from e
+        if timestamp is None:
+            raise InvalidPoint(f"Некорректное время: {raw_timestamp!r}")
+        if timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp, dt_timezone.utc)
+    else:
+        timestamp = timezone.now()
+    return rental_id, timestamp, latitude, longitude
+
+
+def read_ndjson(lines):
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode()
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                yield {}
+
+
+def read_csv(lines):
+    """CSV с заголовком rental_id,latitude,longitude[,timestamp]"""
+    lines = (line.decode() if isinstance(line, bytes) else line for line in lines)
+    yield from csv.DictReader(lines)
+
+
+READERS = {
+    "ndjson": read_ndjson,
+    "csv": read_csv,
+}
+
+
+class TelemetryBuffer:
+    """Буфер точек трекинга. Использовать как контекстный менеджер или вызвать flush()."""
+
+    def __init__(self, batch_size=5000, use_copy=None):
+        self.batch_size = batch_size
+        if use_copy is None:
+            use_copy = connection.vendor == "postgresql"
+        self.use_copy = use_copy
+        self.points = []
+        self.accepted = 0
+        self.rejected = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, data):
+        try:
+            self.points.append(parse_point(data))
+        except InvalidPoint:
+            self.rejected += 1
+            return
+        if len(self.points) >= self.batch_size:
+            self.flush()
+
+    def extend(self, rows):
+        for data in rows:
+            self.add(data)
+        return self
+
+    def flush(self):
+        points, self.points = self.points, []
+        if not points:
+            return
+        rental_cars = dict(
+            Rental.objects.filter(pk__in={point[0] for point in points}).values_list("pk", "car_id")
+        )
+        valid = [point for point in points if point[0] in rental_cars]
+        self.rejected += len(points) - len(valid)
+        if not valid:
+            return
+
+        with transaction.atomic():
+            if self.use_copy:
+                self._copy(valid)
+            else:
+                TripTracking.objects.bulk_create(
+                    [TripTracking(rental_id=r, timestamp=t, latitude=lat, longitude=lon) for r, t, lat, lon in valid],
+                    batch_size=self.batch_size,
+                )
+            self._upsert_locations(valid, rental_cars)
+        self.accepted += len(valid)
+
+    def _copy(self, points):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for rental_id, timestamp, latitude, longitude in points:
+            writer.writerow((rental_id, timestamp.isoformat(), latitude, longitude))
+        buffer.seek(0)
+
+        opts = TripTracking._meta
+        columns = ", ".join(
+            connection.ops.quote_name(opts.get_field(name).column)
+            for name in ("rental", "timestamp", "latitude", "longitude")
+        )
+        sql = f"COPY {connection.ops.quote_name(opts.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv)"
+        with connection.cursor() as cursor:
+            cursor.copy_expert(sql, buffer)
+
+    @staticmethod
+    def _upsert_locations(points, rental_cars):
+        latest = {}
+        for rental_id, timestamp, latitude, longitude in points:
+            car_id = rental_cars[rental_id]
+            if car_id not in latest or latest[car_id][0] <= timestamp:
+                latest[car_id] = (timestamp, latitude, longitude)
+
+        # updated_at — время точки: запоздавшая или повторная пачка не
+        # затирает более свежую позицию (условие WHERE у DO UPDATE)
+        opts = CarLocation._meta
+        quote = connection.ops.quote_name
+        table = quote(opts.db_table)
+        columns = [quote(opts.get_field(name).column)
+                   for name in ("car", "latitude", "longitude", "grid_cell", "updated_at")]
+        updated_at = columns[-1]
+        values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(latest))
+        params = []
+        for car_id, (timestamp, latitude, longitude) in latest.items():
+            params += [car_id, latitude, longitude, grid_cell(latitude, longitude), timestamp]
+        sql = (
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES {values} "
+            f"ON CONFLICT ({columns[0]}) DO UPDATE SET "
+            + ", ".join(f"{column} = EXCLUDED.{column}" for column in columns[1:])
+            + f" WHERE EXCLUDED.{updated_at} > {table}.{updated_at}"
+        )
+        # Позиция в каталоге не выводится — версии машин не сдвигаются
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+
+def ingest(lines, fmt="ndjson", batch_size=5000):
+    """Загружает точки из строк NDJSON/CSV, возвращает (принято, отклонено)"""
+    with TelemetryBuffer(batch_size=batch_size) as buffer:
+        buffer.extend(READERS[fmt](lines))
+    return buffer.accepted, buffer.rejected
@@ -0,0 +1,44 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from rental.images import MIME_TYPES, SIZES, variant_set
+
+register = template.Library()
+
+# Порядок <source>: браузер берёт первый поддерживаемый формат
+SOURCE_FORMATS = ("avif", "webp")
+
+
+def srcset(items):
+    return ", ".join(f"{url} {width}w" for url, width, _ in items)
+
+
+@register.simple_tag
+def picture(field, variants, size, alt="", width=None, css_class=""):
+    """
+    <picture> с копиями размера size (rental/images.py) в AVIF/WebP и JPEG
+    через srcset. width — ширина на странице в CSS-пикселях (по умолчанию
+    SIZES[size]). Пока копий нет, отдаёт исходный файл.
+
+        {% picture car.image car.image_variants "card" alt=car.model width=200 %}
+    """
+    if not field:
+        return ""
+    width = int(width or SIZES[size])
+    formats = variant_set(field, variants, size)
+    if formats is None:
+        return format_html(
+            '<img src="{}" alt="{}" width="{}" class="{}" loading="lazy">', field.url, alt, width, css_class,
+        )
+    fallback = formats.get("jpeg") or next(iter(formats.values()))
+    url, base_width, base_height = fallback[0]
+    sizes = f"{width}px"
+    sources = format_html_join(
+        "", '<source type="{}" srcset="{}" sizes="{}">',
+        ((MIME_TYPES[fmt], srcset(formats[fmt]), sizes) for fmt in SOURCE_FORMATS if fmt in formats),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}" '
+        'loading="lazy" decoding="async"></picture>',
+        sources, url, srcset(fallback), sizes, width, round(base_height * width / base_width), alt, css_class,
+    )
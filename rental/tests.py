@@ -1,3 +1,1473 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import random
+import string
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser, Permission
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.http import Http404
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from guardian.shortcuts import assign_perm, remove_perm
+import numpy as np
+from PIL import Image
+from prometheus_client import REGISTRY
+
+from accounts.models import UserModel
+from .aio import gather_queries
+from .analytics import analyze_track, issue_trip_fines
+from .async_views import AsyncCarDetailView, AsyncCarListView, AsyncHomePageView, AsyncRentalHistoryView
+from .availability import AvailabilityIndex, availability_index, get_available_car_ids
+from .booking import BookingConflict, book_car
+from .catalog_cache import CAR_VERSION_KEY, bump_availability, get_car_versions, get_catalog_version
+from .templatetags.pictures import picture
+from .fixtures import FixtureGenerator, FixtureSizes
+from .geo import KM_PER_DEGREE, grid_cell, haversine_km, nearest
+from .images import available_formats
+from .ledger import ledger_balance
+from .metrics import ViewMetricsMiddleware
+from . import exports, ledger, metrics, reports, stats
+from .models import (
+    Car, CarLocation, CarReview, DailyFleetStats, Dealer, Fine, PricingRule, Rental, TrackArchive, Transaction,
+    TripTracking,
+)
+from .permissions import ObjectPermissions
+from .pricing import PricingEngine
+from .ratings import rebuild_car_ratings
+from .routes import douglas_peucker, get_simplified_route, project, simplify, visvalingam
+from .search import search_cars
+from .views import CarListView
+from .telemetry import ingest
+from .tracking import (
+    archive_partition, archived_points, create_partition, is_partitioned, iter_track, list_partitions, read_archive,
+    write_archive,
+)
+
+
+def make_rental(user, car, start, end, **fields):
+    """Несохранённая аренда: обязательные поля формы заполнены заглушками"""
+    values = {
+        "full_name": "-", "phone_number": "0", "address": "-", "city": "-",
+        "pickup_location": "-", "pickup_date": start.date(), "pickup_time": start.time(),
+        "dropoff_location": "-", "dropoff_date": end.date(), "dropoff_time": end.time(),
+        "payment_method": "CARD",
+    }
+    values.update(fields)
+    return Rental(user=user, car=car, start_time=start, end_time=end, **values)
+
+
+class CarRatingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserModel.objects.create_user(username="reviewer", password="x")
+        cls.car = Car.objects.create(brand="Kia", model="Rio", year=2021, price_per_hour=10)
+        cls.other = Car.objects.create(brand="Kia", model="Ceed", year=2022, price_per_hour=12)
+
+    def aggregates(self, car):
+        car.refresh_from_db()
+        return car.review_count, car.rating_sum, car.rating_avg
+
+    def test_create_edit_move_delete(self):
+        first = CarReview.objects.create(user=self.user, car=self.car, rating=5)
+        CarReview.objects.create(user=self.user, car=self.car, rating=3)
+        self.assertEqual(self.aggregates(self.car), (2, 8, 4))
+
+        first.rating = 4
+        first.save()
+        self.assertEqual(self.aggregates(self.car), (2, 7, 3.5))
+
+        first.car = self.other
+        first.save()
+        self.assertEqual(self.aggregates(self.car), (1, 3, 3))
+        self.assertEqual(self.aggregates(self.other), (1, 4, 4))
+
+        first.delete()
+        self.assertEqual(self.aggregates(self.other), (0, 0, 0))
+
+    def test_delta_does_not_read_stale_instance(self):
+        # Экземпляр в памяти устарел: UPDATE сдвигает значения в базе, а не его копию
+        stale = Car.objects.get(pk=self.car.pk)
+        CarReview.objects.create(user=self.user, car=self.car, rating=5)
+        stale.save()
+        CarReview.objects.create(user=self.user, car=self.car, rating=2)
+        self.assertEqual(self.aggregates(self.car), (2, 7, 3.5))
+
+    def test_rebuild_matches_deltas(self):
+        CarReview.objects.create(user=self.user, car=self.car, rating=5)
+        CarReview.objects.create(user=self.user, car=self.other, rating=1)
+        expected = [self.aggregates(self.car), self.aggregates(self.other)]
+        Car.objects.update(review_count=0, rating_sum=0, rating_avg=0)
+        self.assertEqual(rebuild_car_ratings(batch_size=1), 2)
+        self.assertEqual([self.aggregates(self.car), self.aggregates(self.other)], expected)
+
+
+class HomeStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserModel.objects.create_user(username="reviewer", password="x")
+        cls.car = Car.objects.create(brand="Kia", model="Rio", year=2021, price_per_hour=10)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_warm_cache_skips_database(self):
+        expected = stats.get_home_stats()
+        with self.assertNumQueries(0):
+            self.assertEqual(stats.get_home_stats(), expected)
+
+    def test_counters_follow_signals(self):
+        stats.get_home_stats()
+        with self.captureOnCommitCallbacks(execute=True):
+            Car.objects.create(brand="Lada", model="Vesta", year=2023, price_per_hour=8)
+            CarReview.objects.create(user=self.user, car=self.car, rating=5)
+        current = stats.get_home_stats()
+        self.assertEqual((current["total_cars"], current["total_brands"], current["total_reviews"]), (2, 2, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Car.objects.filter(brand="Lada").delete()
+        current = stats.get_home_stats()
+        self.assertEqual((current["total_cars"], current["total_brands"], current["total_reviews"]), (1, 1, 1))
+
+    def test_missing_counter_is_not_created_by_delta(self):
+        # Счётчика нет в кеше — incr не заводит его с неверным значением
+        stats.adjust_counter(stats.TOTAL_CARS_KEY, 1)
+        self.assertIsNone(cache.get(stats.TOTAL_CARS_KEY))
+        self.assertEqual(stats.get_home_stats()["total_cars"], 1)
+
+
+class NearestSearchTests(TestCase):
+    center = (43.238, 76.945)
+
+    @classmethod
+    def setUpTestData(cls):
+        rnd = random.Random(6)
+        points = [
+            (round(cls.center[0] + rnd.uniform(-0.5, 0.5), 6), round(cls.center[1] + rnd.uniform(-0.5, 0.5), 6))
+            for _ in range(200)
+        ]
+        # bulk_create обходит save(), поэтому ячейка сетки задаётся явно
+        Dealer.objects.bulk_create([
+            Dealer(name=f"Дилер {i}", address="-", latitude=lat, longitude=lon, grid_cell=grid_cell(lat, lon))
+            for i, (lat, lon) in enumerate(points)
+        ])
+
+    def brute_force(self, latitude, longitude, k, radius):
+        found = sorted(
+            (haversine_km(latitude, longitude, dealer.latitude, dealer.longitude), dealer.pk)
+            for dealer in Dealer.objects.all()
+        )
+        return [pk for distance, pk in found if distance <= radius][:k]
+
+    def test_matches_brute_force(self):
+        for k, radius in ((1, 50), (10, 50), (50, 20), (500, 5)):
+            found = nearest(Dealer.objects.all(), *self.center, k=k, max_radius_km=radius)
+            self.assertEqual([dealer.pk for _, dealer in found], self.brute_force(*self.center, k, radius))
+
+    def test_crosses_antimeridian(self):
+        east = Dealer.objects.create(name="Восток", address="-", latitude=65.0, longitude=179.995)
+        west = Dealer.objects.create(name="Запад", address="-", latitude=65.0, longitude=-179.995)
+        found = nearest(Dealer.objects.all(), 65.0, 179.999, k=2, max_radius_km=5)
+        self.assertEqual([dealer for _, dealer in found], [east, west])
+
+    def test_view(self):
+        response = self.client.get(reverse("nearest_dealers"), {"lat": self.center[0], "lon": self.center[1], "k": 3})
+        results = response.json()["results"]
+        self.assertEqual([row["id"] for row in results], self.brute_force(*self.center, 3, 50))
+        self.assertEqual(results, sorted(results, key=lambda row: row["distance_km"]))
+        self.assertEqual(self.client.get(reverse("nearest_dealers"), {"lat": 91, "lon": 0}).status_code, 400)
+
+
+class RouteSimplificationTests(TestCase):
+    def segment_distance(self, p, a, b):
+        dx, dy = b[0] - a[0], b[1] - a[1]
+        length = dx * dx + dy * dy
+        t = max(0.0, min(1.0, ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / length)) if length else 0.0
+        return ((p[0] - a[0] - t * dx) ** 2 + (p[1] - a[1] - t * dy) ** 2) ** 0.5
+
+    def test_noisy_straight_line_collapses(self):
+        rnd = random.Random(8)
+        points = [(43.2 + i * 1e-4 + rnd.uniform(-1e-5, 1e-5), 76.9) for i in range(500)]
+        for algorithm in ("dp", "vw"):
+            self.assertEqual(simplify(points, 5, algorithm), [points[0], points[-1]])
+
+    def test_corner_is_kept(self):
+        points = [(43.2 + i * 1e-4, 76.9) for i in range(50)] + [(43.2049, 76.9 + i * 1e-4) for i in range(1, 50)]
+        for algorithm in ("dp", "vw"):
+            self.assertEqual(simplify(points, 5, algorithm), [points[0], points[49], points[-1]])
+
+    def test_douglas_peucker_stays_within_tolerance(self):
+        rnd = random.Random(8)
+        latitude, longitude, points = 43.2, 76.9, []
+        for _ in range(20_000):
+            latitude += rnd.uniform(-1e-4, 1e-4)
+            longitude += rnd.uniform(-1e-4, 1e-4)
+            points.append((latitude, longitude))
+        xy = project(points)
+        kept = douglas_peucker(xy, 10)
+        self.assertLess(len(kept), len(xy) // 2)
+        for first, last in zip(kept, kept[1:]):
+            for i in range(first + 1, last):
+                self.assertLessEqual(self.segment_distance(xy[i], xy[first], xy[last]), 10 + 1e-6)
+        self.assertEqual(visvalingam(xy, 0), list(range(len(xy))))
+
+    def test_finished_route_is_cached(self):
+        cache.clear()
+        rental = Rental(pk=10**9, end_time=timezone.now() - timedelta(hours=1))
+        track = [(None, 43.2 + i * 1e-4, 76.9) for i in range(10)]
+        with mock.patch("rental.routes.iter_track", return_value=track) as iter_track:
+            first = get_simplified_route(rental, 5)
+            self.assertEqual(get_simplified_route(rental, 5), first)
+            get_simplified_route(rental, 5, "vw")
+        self.assertEqual(iter_track.call_count, 2)
+        self.assertEqual(first, {"points": 10, "route": [[43.2, 76.9], [43.2009, 76.9]]})
+
+
+class TripAnalyticsTests(TestCase):
+    start = datetime(2026, 4, 1, 10, tzinfo=dt_timezone.utc)
+    options = {
+        "speed_limit_kmh": 100, "speeding_min_seconds": 60, "idle_speed_kmh": 3,
+        "max_gap_seconds": 300, "max_plausible_speed_kmh": 300, "geofence_radius_km": 5,
+    }
+
+    def track(self, legs):
+        """legs — [(число отрезков, секунд на отрезок, км/ч), ...] -> массивы трека на север"""
+        times, latitudes = [0.0], [43.0]
+        for count, seconds, speed in legs:
+            for _ in range(count):
+                times.append(times[-1] + seconds)
+                latitudes.append(latitudes[-1] + speed * seconds / 3600 / KM_PER_DEGREE)
+        times = np.array(times) + self.start.timestamp()
+        return times, np.array(latitudes), np.full(len(times), 76.9)
+
+    def test_metrics(self):
+        times, latitudes, longitudes = self.track([(10, 10, 36), (12, 10, 150), (10, 10, 0), (1, 1000, 0.36)])
+        stats = analyze_track(times, latitudes, longitudes, center=(43.0, 76.9), options=self.options)
+        self.assertAlmostEqual(stats["distance_km"], 1 + 5 + 0.1, places=6)
+        self.assertAlmostEqual(stats["max_speed_kmh"], 150, places=6)
+        # Разрыв связи в 1000 с не считается простоем
+        self.assertEqual(stats["idle_seconds"], 100)
+        self.assertEqual([episode["seconds"] for episode in stats["speeding"]], [120])
+        self.assertEqual(len(stats["geofence_exits"]), 1)
+        self.assertEqual(stats["geofence_exits"][0]["end"], times[-1])
+
+    def test_gps_glitch_is_ignored(self):
+        times, latitudes, longitudes = self.track([(20, 10, 36)])
+        latitudes[10] += 1
+        stats = analyze_track(times, latitudes, longitudes, options=self.options)
+        self.assertAlmostEqual(stats["distance_km"], 1.8, places=6)
+        self.assertAlmostEqual(stats["max_speed_kmh"], 36, places=6)
+        self.assertEqual(stats["speeding"], [])
+
+    def test_issue_fines_once(self):
+        user = UserModel.objects.create_user(username="driver", password="x")
+        car = Car.objects.create(brand="Kia", model="Rio", year=2021, price_per_hour=10)
+        times, latitudes, longitudes = self.track([(12, 10, 150)])
+        end = datetime.fromtimestamp(times[-1], dt_timezone.utc)
+        rental = Rental.objects.bulk_create([make_rental(user, car, self.start, end)])[0]
+        TripTracking.objects.bulk_create([
+            TripTracking(
+                rental=rental, timestamp=datetime.fromtimestamp(t, dt_timezone.utc),
+                latitude=round(lat, 6), longitude=lon,
+            )
+            for t, lat, lon in zip(times, latitudes, longitudes)
+        ])
+        window = (self.start, end + timedelta(minutes=1))
+        with self.settings(TRIP_SPEED_LIMIT_KMH=100, TRIP_SPEEDING_MIN_SECONDS=60):
+            self.assertEqual(issue_trip_fines(*window), (1, 1))
+            self.assertEqual(issue_trip_fines(*window), (0, 0))
+        fine = Fine.objects.get(rental=rental)
+        self.assertEqual((fine.kind, fine.user_id), (Fine.Kind.SPEEDING, user.pk))
+
+
+class CatalogApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cars = Car.objects.bulk_create([
+            Car(brand="Kia", model=f"Rio {i}", year=2021, price_per_hour=10 + i, type="SUV" if i % 2 else "Sedan")
+            for i in range(7)
+        ])
+
+    def setUp(self):
+        availability_index.invalidate()
+
+    def collect(self, url, params):
+        """Все страницы по ссылкам next: (строки, число страниц)"""
+        rows, pages = [], 0
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            rows += data["results"]
+            pages += 1
+            if data["next"] is None:
+                return rows, pages
+            response = self.client.get(data["next"])
+
+    def test_sparse_fields(self):
+        response = self.client.get(reverse("api_cars"), {"fields": "id,price_per_hour", "limit": 1})
+        self.assertEqual(response.json()["results"], [{"id": self.cars[0].pk, "price_per_hour": "10.00"}])
+        response = self.client.get(reverse("api_cars"), {"fields": "id,secret"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("secret", response.json()["errors"])
+
+    def test_cursor_walks_all_pages(self):
+        rows, pages = self.collect(reverse("api_cars"), {"fields": "id", "limit": 2, "type": "SUV"})
+        self.assertEqual([row["id"] for row in rows], [car.pk for car in self.cars if car.type == "SUV"])
+        self.assertEqual(pages, 2)
+        self.assertEqual(self.client.get(reverse("api_cars"), {"limit": 0}).status_code, 400)
+
+    def test_availability_cursor(self):
+        start = timezone.now() + timedelta(days=1)
+        params = {"start": start.isoformat(), "end": (start + timedelta(hours=2)).isoformat(), "limit": 2}
+        user = UserModel.objects.create_user(username="renter", password="x")
+        with self.captureOnCommitCallbacks(execute=True):
+            make_rental(user, self.cars[3], start, start + timedelta(hours=1)).save()
+        get_available_car_ids(start, start)
+        # Индекс построен: страницы отдаются без запросов к базе
+        with self.assertNumQueries(0):
+            ids, pages = self.collect(reverse("api_availability"), params)
+        self.assertEqual(ids, [car.pk for car in self.cars if car != self.cars[3]])
+        self.assertEqual(pages, 3)
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserModel.objects.create_user(username="async", password="x")
+        cls.cars = Car.objects.bulk_create(
+            [Car(brand="Kia", model=f"Rio {i}", year=2021, price_per_hour=10 + i) for i in range(3)]
+        )
+        start = timezone.now() - timedelta(days=3)
+        Rental.objects.bulk_create([make_rental(cls.user, cls.cars[0], start, start + timedelta(hours=2))])
+
+    def setUp(self):
+        cache.clear()
+        availability_index.invalidate()
+        self.factory = AsyncRequestFactory()
+
+    async def render(self, view, request, **kwargs):
+        response = await view.as_view()(request, **kwargs)
+        if hasattr(response, "render"):
+            await sync_to_async(response.render)()
+        return response
+
+    async def test_car_list_and_conditional_get(self):
+        request = self.factory.get("/cars/", {"ordering": "-price_per_hour"})
+        response = await self.render(AsyncCarListView, request)
+        self.assertEqual([car.pk for car in response.context_data["cars"]], [car.pk for car in reversed(self.cars)])
+
+        request = self.factory.get("/cars/", {"ordering": "-price_per_hour"}, headers={"if-none-match": response["ETag"]})
+        self.assertEqual((await self.render(AsyncCarListView, request)).status_code, 304)
+
+    async def test_car_detail(self):
+        response = await self.render(AsyncCarDetailView, self.factory.get("/"), pk=self.cars[1].pk)
+        self.assertEqual(response.context_data["car"], self.cars[1])
+        with self.assertRaises(Http404):
+            await self.render(AsyncCarDetailView, self.factory.get("/"), pk=10**9)
+
+    async def test_home_matches_sync_stats(self):
+        expected = await sync_to_async(stats.get_home_stats)()
+        response = await self.render(AsyncHomePageView, self.factory.get("/"))
+        self.assertEqual(response.context_data["total_cars"], expected["total_cars"])
+
+    async def test_history_requires_login(self):
+        async def auser(user):
+            return user
+
+        request = self.factory.get("/rental-history/")
+        request.auser = lambda: auser(AnonymousUser())
+        self.assertEqual((await self.render(AsyncRentalHistoryView, request)).status_code, 302)
+        request = self.factory.get("/rental-history/")
+        request.auser = lambda: auser(self.user)
+        response = await self.render(AsyncRentalHistoryView, request)
+        self.assertEqual([rental.car_id for rental in response.context_data["rentals"]], [self.cars[0].pk])
+
+    async def test_gather_keeps_order(self):
+        self.assertEqual(await gather_queries(lambda: 1, lambda: 2, lambda: 3), [1, 2, 3])
+
+
+class HistoryPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserModel.objects.create_user(username="history", password="x")
+
+    def create_history(self, count):
+        start = timezone.now() - timedelta(days=2 * count)
+        cars = Car.objects.bulk_create(
+            [Car(brand="Toyota", model=f"Camry {i}", year=2020, price_per_hour=10) for i in range(count)]
+        )
+        Rental.objects.bulk_create([
+            make_rental(self.user, car, start + timedelta(days=2 * i), start + timedelta(days=2 * i + 1))
+            for i, car in enumerate(cars)
+        ])
+        Transaction.objects.bulk_create(
+            [Transaction(user=self.user, transaction_type="RENTAL", amount=10) for _ in range(count)]
+        )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_history_length(self):
+        self.client.force_login(self.user)
+        self.create_history(3)
+        small = {name: self.count_queries(reverse(name)) for name in ("rental_history", "payment_history")}
+        self.create_history(60)
+        large = {name: self.count_queries(reverse(name)) for name in ("rental_history", "payment_history")}
+        self.assertEqual(small, large)
+
+    def test_pages_cover_history_once(self):
+        self.client.force_login(self.user)
+        self.create_history(45)
+        seen, url = [], reverse("rental_history")
+        while url:
+            response = self.client.get(url)
+            seen.extend(rental.pk for rental in response.context["rentals"])
+            cursor = response.context["next_cursor"]
+            url = f"{reverse('rental_history')}?cursor={cursor}" if cursor else None
+        expected = list(Rental.objects.filter(user=self.user).order_by("-start_time", "-pk").values_list("pk", flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_active_rentals_cover_now(self):
+        self.client.force_login(self.user)
+        self.create_history(5)
+        current = Rental.objects.filter(user=self.user).latest("start_time")
+        Rental.objects.filter(pk=current.pk).update(end_time=timezone.now() + timedelta(days=1))
+        response = self.client.get(reverse("active_rentals"))
+        self.assertEqual([rental.pk for rental in response.context["rentals"]], [current.pk])
+
+    def test_bad_cursor_is_404(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("rental_history") + "?cursor=garbage")
+        self.assertEqual(response.status_code, 404)
+
+
+class HotQueryPlanTests(TestCase):
+    """
+    Горячие запросы не должны скатываться в последовательное чтение таблицы.
+    Данные заполняются так, чтобы условия были избирательными, как в
+    рабочей базе: мало доступных машин, у пользователя малая доля истории.
+    """
+    USERS = 2000
+    CARS = 4000
+    RENTALS = 20000
+    TRANSACTIONS = 20000
+    TRACKED_RENTALS = 200
+    POINTS_PER_RENTAL = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        rnd = random.Random(17)
+
+        def word():
+            return "".join(rnd.choices(string.ascii_lowercase, k=8)).capitalize()
+
+        users = UserModel.objects.bulk_create(
+            [UserModel(username=f"user{i}_{word()}", email=f"{word()}@example.com", password="!") for i in range(cls.USERS)]
+        )
+        cars = Car.objects.bulk_create([
+            Car(
+                brand=word(), model=word(), year=2020, price_per_hour=10,
+                type=rnd.choice(Car.CarType.values), is_available=i % 50 == 0,
+            )
+            for i in range(cls.CARS)
+        ])
+        start = timezone.now() - timedelta(days=2 * (cls.RENTALS // cls.CARS))
+        rentals = Rental.objects.bulk_create([
+            make_rental(
+                users[i % cls.USERS], cars[i % cls.CARS],
+                start + timedelta(days=2 * (i // cls.CARS)), start + timedelta(days=2 * (i // cls.CARS) + 1),
+            )
+            for i in range(cls.RENTALS)
+        ], batch_size=5000)
+        Transaction.objects.bulk_create(
+            [Transaction(user=users[i % cls.USERS], transaction_type="RENTAL", amount=10) for i in range(cls.TRANSACTIONS)],
+            batch_size=5000,
+        )
+        tracked_at = timezone.now()
+        TripTracking.objects.bulk_create([
+            TripTracking(
+                rental=rental, timestamp=tracked_at + timedelta(seconds=j),
+                latitude=43.2 + j / 10000, longitude=76.9 + j / 10000,
+            )
+            for rental in rentals[:cls.TRACKED_RENTALS]
+            for j in range(cls.POINTS_PER_RENTAL)
+        ], batch_size=5000)
+        cls.user, cls.car, cls.rental = users[7], cars[7], rentals[7]
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def assertNoSeqScan(self, queryset):
+        plan = json.loads(queryset.explain(analyze=True, format="json"))[0]["Plan"]
+        nodes, scans = [plan], []
+        while nodes:
+            node = nodes.pop()
+            # Пустые секции (будущие месяцы, _default) читать дешевле без индекса
+            empty = node.get("Actual Rows") == 0 and not node.get("Rows Removed by Filter")
+            if node["Node Type"] == "Seq Scan" and not empty:
+                scans.append(node["Relation Name"])
+            nodes.extend(node.get("Plans", []))
+        self.assertEqual(scans, [], f"Seq Scan в плане запроса:\n{queryset.query}")
+
+    def assertIndexUsable(self, queryset):
+        """
+        Индекс подходит к выражению запроса. Выберет ли его планировщик,
+        зависит от размера таблиц и настроек стоимости, поэтому Seq Scan
+        здесь запрещён: он останется в плане, только если индекса нет.
+        """
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            self.assertNoSeqScan(queryset)
+
+    def test_catalog_by_type(self):
+        self.assertNoSeqScan(Car.objects.filter(type=self.car.type, is_available=True).order_by("pk")[:20])
+
+    def test_available_cars(self):
+        self.assertNoSeqScan(Car.objects.filter(is_available=True).order_by("pk")[:20])
+
+    def test_rental_history(self):
+        self.assertNoSeqScan(Rental.objects.filter(user=self.user).order_by("-start_time", "-pk")[:20])
+
+    def test_active_rentals(self):
+        current = timezone.now()
+        self.assertNoSeqScan(Rental.objects.filter(user=self.user, start_time__lte=current, end_time__gt=current))
+
+    def test_payment_history(self):
+        self.assertNoSeqScan(Transaction.objects.filter(user=self.user).order_by("-timestamp", "-pk")[:20])
+
+    def test_trip_track(self):
+        self.assertNoSeqScan(TripTracking.objects.filter(rental=self.rental).order_by("timestamp"))
+
+    def test_admin_car_search(self):
+        term = self.car.brand[2:6]
+        self.assertIndexUsable(Car.objects.filter(Q(brand__icontains=term) | Q(model__icontains=term)))
+
+    def test_admin_user_search(self):
+        term = self.user.username.split("_")[1][:5]
+        self.assertIndexUsable(UserModel.objects.filter(Q(username__icontains=term) | Q(email__icontains=term)))
+
+
+class CarSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.dealer = Dealer.objects.create(name="Алматы Моторс", address="-", latitude=43.2, longitude=76.9)
+        cls.camry = Car.objects.create(brand="Toyota", model="Camry", year=2020, price_per_hour=10, dealer=cls.dealer)
+        cls.x5 = Car.objects.create(
+            brand="BMW", model="X5", year=2021, price_per_hour=20,
+            description="Просторный внедорожник для поездок в горы, понравится и поклонникам Toyota",
+        )
+        # bulk_create мимо save(): вектор всё равно заполняет триггер
+        cls.prius, = Car.objects.bulk_create([Car(brand="Toyota", model="Prius", year=2019, price_per_hour=8)])
+
+    def search(self, text):
+        return list(search_cars(Car.objects.all(), text))
+
+    def test_brand_ranks_above_description(self):
+        found = self.search("toyota")
+        self.assertEqual(set(found[:2]), {self.camry, self.prius})
+        self.assertEqual(found[2:], [self.x5])
+
+    def test_typo_in_brand(self):
+        self.assertIn(self.camry, self.search("toyta"))
+
+    def test_description_word_forms(self):
+        self.assertEqual(self.search("горах"), [self.x5])
+
+    def test_dealer_rename_updates_vector(self):
+        Dealer.objects.filter(pk=self.dealer.pk).update(name="Астана Авто")
+        self.assertEqual(self.search("астана"), [self.camry])
+        self.assertEqual(self.search("моторс"), [])
+
+    def test_site_search(self):
+        # Машины из setUpTestData не попали в индекс занятости: on_commit в тестах не срабатывает
+        availability_index.invalidate()
+        response = self.client.get(reverse("car_search"), {"q": "camry"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["cars"], [self.camry])
+
+
+class FixtureGeneratorTests(TestCase):
+    SIZES = FixtureSizes(
+        dealers=3, cars=20, users=15, rentals=200, reviews=50, fines=10, tracked_rentals=5, points=500, days=60,
+    )
+    NOW = timezone.now()
+
+    def generate(self, seed):
+        FixtureGenerator(self.SIZES, seed=seed, now=self.NOW).generate()
+
+    def test_sizes_and_ledger(self):
+        self.generate(seed=1)
+        self.assertEqual(Car.objects.count(), 20)
+        self.assertEqual(Rental.objects.count(), 200)
+        self.assertEqual(CarReview.objects.count(), 50)
+        self.assertEqual(Fine.objects.count(), 10)
+        self.assertEqual(TripTracking.objects.count(), 500)
+        # Отзывы без текста приходят через COPY пустой строкой, а не NULL
+        self.assertTrue(CarReview.objects.filter(comment="").exists())
+        for user in UserModel.objects.all():
+            self.assertEqual(ledger_balance(user.pk), user.balance)
+
+    def test_same_seed_same_data(self):
+        def snapshot():
+            return list(
+                Rental.objects.order_by("car__brand", "car__model", "start_time")
+                .values_list("car__brand", "car__model", "start_time", "end_time", "total_price")
+            )
+
+        self.generate(seed=2)
+        first = snapshot()
+        Car.objects.all().delete()
+        UserModel.objects.all().delete()
+        Dealer.objects.all().delete()
+        self.generate(seed=2)
+        self.assertEqual(snapshot(), first)
+
+
+class ViewMetricsTests(TestCase):
+    def sample(self, name, view):
+        return REGISTRY.get_sample_value(name, {"view": view}) or 0
+
+    def test_queries_and_sql_time_by_view(self):
+        user = UserModel.objects.create_user(username="metrics", password="x")
+        self.client.force_login(user)
+        count = self.sample("rental_view_db_queries_count", "rental_history")
+        queries = self.sample("rental_view_db_queries_sum", "rental_history")
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(reverse("rental_history"))
+        self.assertEqual(self.sample("rental_view_db_queries_count", "rental_history"), count + 1)
+        self.assertEqual(self.sample("rental_view_db_queries_sum", "rental_history"), queries + len(captured))
+        self.assertGreater(self.sample("rental_view_template_seconds_count", "rental_history"), 0)
+
+    def test_cache_hits_by_view(self):
+        cache.clear()
+        self.client.get(reverse("home"))
+        hits = self.sample("rental_view_cache_hits_total", "home")
+        misses = self.sample("rental_view_cache_misses_total", "home")
+        # Пустой каталог: в кеше нули и пустой список — это тоже попадания
+        with self.assertNumQueries(0):
+            self.client.get(reverse("home"))
+        self.assertGreater(self.sample("rental_view_cache_hits_total", "home"), hits)
+        self.assertEqual(self.sample("rental_view_cache_misses_total", "home"), misses)
+
+    def test_falsy_values_and_get_many_counted_once(self):
+        cache.set_many({"metrics:zero": 0, "metrics:empty": []})
+        stats, token, _ = ViewMetricsMiddleware(lambda request: None).start()
+        try:
+            self.assertEqual(cache.get("metrics:zero", "default"), 0)
+            self.assertEqual(cache.get("metrics:absent", "default"), "default")
+            values = cache.get_many(["metrics:zero", "metrics:empty", "metrics:absent"])
+        finally:
+            metrics._current.reset(token)
+        self.assertEqual(values, {"metrics:zero": 0, "metrics:empty": []})
+        self.assertEqual((stats.cache_hits, stats.cache_misses), (3, 2))
+
+    @override_settings(SLOW_REQUEST_SECONDS=1e-9)
+    def test_slow_request_logs_sql(self):
+        self.client.force_login(UserModel.objects.create_user(username="slow", password="x"))
+        with self.assertLogs("rental.slow_requests", "WARNING") as logs:
+            self.client.get(reverse("rental_history"))
+        self.assertIn("rental_history", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_PROCESSING_SYNC=True)
+class ImageVariantsTests(TestCase):
+    def photo(self, size=(1600, 1200)):
+        buffer = io.BytesIO()
+        Image.new("RGB", size, "navy").save(buffer, "JPEG")
+        return ContentFile(buffer.getvalue(), name="photo.jpg")
+
+    def create_car(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            car = Car.objects.create(brand="Kia", model="Rio", year=2022, price_per_hour=10, image=self.photo())
+        car.refresh_from_db()
+        return car
+
+    def test_variants_on_upload(self):
+        car = self.create_car()
+        info = car.image_variants
+        self.assertEqual((info["source"], info["width"], info["height"]), (car.image.name, 1600, 1200))
+        widths = [width for width, _, _ in info["variants"]["card"]["jpeg"]]
+        self.assertEqual(widths, [400, 800])
+        width, height, name = info["variants"]["detail"]["jpeg"][0]
+        self.assertEqual((width, height), (800, 600))
+        self.assertTrue(default_storage.exists(name))
+        with default_storage.open(name) as file, Image.open(file) as image:
+            self.assertEqual(image.size, (800, 600))
+
+    def test_save_keeps_variants(self):
+        car = self.create_car()
+        # Экземпляр, прочитанный до готовности копий
+        stale = Car.objects.get(pk=car.pk)
+        stale.image_variants = {}
+        stale.price_per_hour = 12
+        stale.save()
+        car.refresh_from_db()
+        self.assertTrue(car.image_variants["variants"])
+
+    def test_picture_tag(self):
+        car = self.create_car()
+        html = picture(car.image, car.image_variants, "card", alt="Kia", width=200)
+        self.assertIn("srcset=", html)
+        self.assertIn(" 800w", html)
+        self.assertIn('width="200" height="150"', html)
+        # Копии другого файла не подходят — отдаётся исходник
+        html = picture(car.image, {**car.image_variants, "source": "cars/other.jpg"}, "card")
+        self.assertNotIn("srcset", html)
+
+    @skipUnless("avif" in available_formats(), "Pillow без кодировщика AVIF")
+    def test_avif_variants(self):
+        car = self.create_car()
+        widths = [width for width, _, _ in car.image_variants["variants"]["card"]["avif"]]
+        self.assertEqual(widths, [400, 800])
+        _, _, name = car.image_variants["variants"]["detail"]["avif"][0]
+        self.assertTrue(name.endswith(".avif"))
+        with default_storage.open(name) as file, Image.open(file) as image:
+            self.assertEqual((image.format, image.size), ("AVIF", (800, 600)))
+        self.assertIn('type="image/avif"', picture(car.image, car.image_variants, "card"))
+
+
+class CatalogVersionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_missing_car_is_404(self):
+        url = reverse("car_detail", args=[987654])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH="*")
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(cache.get(CAR_VERSION_KEY.format(987654)))
+
+    def test_deleted_car_is_404(self):
+        car = Car.objects.create(brand="Kia", model="Rio", year=2021, price_per_hour=10)
+        url = reverse("car_detail", args=[car.pk])
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            car.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+    def test_location_does_not_invalidate_catalog(self):
+        car = Car.objects.create(brand="Kia", model="Rio", year=2021, price_per_hour=10)
+        versions = get_catalog_version(), get_car_versions([car.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            CarLocation.objects.create(car=car, latitude=43.25, longitude=76.9)
+        self.assertEqual((get_catalog_version(), get_car_versions([car.pk])), versions)
+
+
+class ObjectPermissionCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = UserModel.objects.create_user(username="manager", password="x", is_staff=True)
+        cls.manager.user_permissions.add(Permission.objects.get(codename="view_car"))
+        cls.cars = Car.objects.bulk_create(
+            [Car(brand="Hyundai", model=f"Solaris {i}", year=2021, price_per_hour=10) for i in range(20)]
+        )
+        for car in cls.cars:
+            assign_perm("rental.change_car", cls.manager, car)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.manager)
+
+    def changelist_queries(self, per_page):
+        cache.clear()
+        with mock.patch.object(admin.site._registry[Car], "list_per_page", per_page):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse("admin:rental_car_changelist"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["cl"].result_list), per_page)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.assertEqual(self.changelist_queries(5), self.changelist_queries(20))
+
+    def test_changelist_shows_object_access(self):
+        response = self.client.get(reverse("admin:rental_car_changelist"))
+        self.assertContains(response, "Ваш доступ")
+        self.assertContains(response, "изменение", count=len(self.cars))
+
+    def test_object_permissions_do_not_grant_admin_access(self):
+        clerk = UserModel.objects.create_user(username="clerk", password="x", is_staff=True)
+        assign_perm("rental.change_car", clerk, self.cars[0])
+        self.client.force_login(clerk)
+        self.assertEqual(self.client.get(reverse("admin:rental_car_changelist")).status_code, 403)
+        self.assertEqual(
+            self.client.get(reverse("admin:rental_car_change", args=[self.cars[0].pk])).status_code, 403,
+        )
+
+    def test_cross_request_cache(self):
+        car = self.cars[0]
+        self.assertTrue(ObjectPermissions(self.manager).has_perm("rental.change_car", car))
+        with self.assertNumQueries(0):
+            self.assertTrue(ObjectPermissions(self.manager).has_perm("rental.change_car", car))
+        with self.captureOnCommitCallbacks(execute=True):
+            remove_perm("rental.change_car", self.manager, car)
+        self.assertFalse(ObjectPermissions(self.manager).has_perm("rental.change_car", car))
+
+
+class LargeTableAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = UserModel.objects.create_superuser("root", password="x")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def create_rows(self, count, name):
+        user = UserModel.objects.create_user(username=name, password="x")
+        start = timezone.now() - timedelta(days=2 * count)
+        cars = Car.objects.bulk_create(
+            [Car(brand="Lada", model=f"{name} {i}", year=2019, price_per_hour=5) for i in range(count)]
+        )
+        rentals = Rental.objects.bulk_create([
+            make_rental(user, car, start + timedelta(days=2 * i), start + timedelta(days=2 * i + 1))
+            for i, car in enumerate(cars)
+        ])
+        TripTracking.objects.bulk_create(
+            [TripTracking(rental=rental, timestamp=rental.start_time, latitude=43, longitude=76) for rental in rentals]
+        )
+        Fine.objects.bulk_create([Fine(user=user, rental=rental, amount=5, reason="-") for rental in rentals])
+        CarReview.objects.bulk_create([CarReview(user=user, car=car, rating=5) for car in cars])
+        Transaction.objects.bulk_create(
+            [Transaction(user=user, transaction_type="RENTAL", amount=5) for _ in range(count)]
+        )
+        return rentals
+
+    def changelist(self, model, query=""):
+        url = reverse(f"admin:rental_{model._meta.model_name}_changelist") + query
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.context["cl"], queries
+
+    def test_query_count_does_not_depend_on_rows(self):
+        models = [TripTracking, Fine, CarReview, Transaction]
+        self.create_rows(3, "few")
+        few = {model: len(self.changelist(model)[1]) for model in models}
+        self.create_rows(12, "many")
+        for model in models:
+            cl, queries = self.changelist(model)
+            self.assertEqual(len(cl.result_list), 15)
+            self.assertEqual(len(queries), few[model], model)
+
+    def test_keyset_pages(self):
+        self.create_rows(5, "pages")
+        expected = list(Fine.objects.order_by("-id").values_list("pk", flat=True))
+        seen, query = [], ""
+        with mock.patch.object(admin.site._registry[Fine], "list_per_page", 2):
+            while True:
+                cl, _ = self.changelist(Fine, query)
+                seen += [fine.pk for fine in cl.result_list]
+                if cl.next_cursor is None:
+                    break
+                query = cl.next_page_url()
+        self.assertEqual(seen, expected)
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=0)
+    def test_estimated_count(self):
+        self.create_rows(3, "estimate")
+        cl, queries = self.changelist(Transaction)
+        self.assertTrue(cl.paginator.estimated)
+        self.assertFalse([q for q in queries if "COUNT(" in q["sql"] and "rental_transaction" in q["sql"]])
+
+    def test_bulk_action_single_update(self):
+        rentals = self.create_rows(4, "bulk")
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse("admin:rental_rental_changelist"), {
+                "action": "mark_paid", "index": 0, "_selected_action": [rental.pk for rental in rentals],
+            })
+        updates = [q for q in queries if q["sql"].startswith("UPDATE") and "rental_rental" in q["sql"]]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Rental.objects.filter(is_paid=True).count(), 4)
+
+
+class FleetRollupTests(TestCase):
+    START = date(2026, 3, 1)
+    END = date(2026, 3, 4)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserModel.objects.create_user(username="reports", password="x")
+        dealer = Dealer.objects.create(name="Центр", address="-", latitude=43.2, longitude=76.9)
+        cls.sedan, cls.suv = Car.objects.bulk_create([
+            Car(brand="Kia", model="K5", year=2022, price_per_hour=10, dealer=dealer, type=Car.CarType.SEDAN),
+            Car(brand="Toyota", model="RAV4", year=2023, price_per_hour=20, type=Car.CarType.SUV),
+        ])
+
+    def at(self, day, hour):
+        return datetime(2026, 3, day, hour, tzinfo=dt_timezone.utc)
+
+    def rent(self, car, start, end, price):
+        return Rental.objects.bulk_create([make_rental(self.user, car, start, end, total_price=price)])[0]
+
+    def assertMatchesSource(self):
+        for group_by in reports.GROUPS:
+            self.assertEqual(
+                reports.fleet_totals(self.START, self.END, group_by),
+                reports.adhoc_fleet_totals(self.START, self.END, group_by),
+                group_by,
+            )
+
+    def test_incremental_refresh(self):
+        overnight = self.rent(self.sedan, self.at(1, 20), self.at(2, 4), 80)
+        self.rent(self.suv, self.at(2, 10), self.at(2, 12), 40)
+        fine = Fine.objects.create(user=self.user, rental=overnight, amount=50, reason="-")
+        Fine.objects.filter(pk=fine.pk).update(issued_at=self.at(2, 9))
+        reports.refresh()
+
+        first, second = DailyFleetStats.objects.filter(car=self.sedan).order_by("day")
+        self.assertEqual((first.day, first.rentals, first.revenue, first.rented_seconds), (self.START, 1, 80, 4 * 3600))
+        self.assertEqual((second.rentals, second.rented_seconds, second.fines, second.fines_amount), (0, 4 * 3600, 1, 50))
+        self.assertMatchesSource()
+
+        # Перенос аренды на другую машину и удаление штрафа учитываются без полного пересчёта
+        Rental.objects.filter(pk=overnight.pk).update(car=self.suv, start_time=self.at(3, 8), end_time=self.at(3, 9))
+        Fine.objects.filter(pk=fine.pk).delete()
+        reports.refresh_fleet()
+        self.assertFalse(DailyFleetStats.objects.filter(car=self.sedan).exists())
+        self.assertMatchesSource()
+
+        before = sorted(DailyFleetStats.objects.values_list("day", "car_id", *reports.METRICS))
+        reports.rebuild()
+        self.assertEqual(sorted(DailyFleetStats.objects.values_list("day", "car_id", *reports.METRICS)), before)
+
+    def test_car_type_change(self):
+        self.rent(self.suv, self.at(1, 10), self.at(1, 12), 40)
+        reports.refresh()
+        Car.objects.filter(pk=self.suv.pk).update(type=Car.CarType.PICKUP)
+        self.assertEqual(set(reports.fleet_totals(self.START, self.END, "type")), {Car.CarType.PICKUP})
+        self.assertMatchesSource()
+
+    def test_ledger_watermark(self):
+        Transaction.objects.bulk_create(
+            [Transaction(user=self.user, transaction_type="TOP_UP", amount=100) for _ in range(3)]
+        )
+        later = timezone.now() + reports.LEDGER_LAG * 2
+        self.assertEqual(reports.refresh_ledger(later), 3)
+        self.assertEqual(reports.refresh_ledger(later), 0)
+        Transaction.objects.create(user=self.user, transaction_type="RENTAL", amount=30)
+        # Свежая операция ждёт LEDGER_LAG
+        self.assertEqual(reports.refresh_ledger(), 0)
+        self.assertEqual(reports.refresh_ledger(later), 1)
+        today = timezone.localdate()
+        self.assertEqual(
+            reports.ledger_report(today, today + timedelta(days=1)),
+            {"RENTAL": (30, 1), "TOP_UP": (300, 3)},
+        )
+
+    def test_dashboard_reads_rollups_only(self):
+        self.rent(self.sedan, self.at(1, 10), self.at(1, 12), 20)
+        reports.refresh()
+        self.client.force_login(UserModel.objects.create_superuser("boss", password="x"))
+        query = f"?start={self.START}&end={self.END}&group_by=car"
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("admin:rental_dailyfleetstats_changelist") + query)
+        self.assertContains(response, "Kia K5")
+        self.assertFalse([q for q in queries if "rental_rental" in q["sql"] or "rental_fine" in q["sql"]])
+
+        response = self.client.get(reverse("admin:rental_dailyfleetstats_export") + query)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        lines = response.content.decode().splitlines()
+        self.assertEqual(lines[0], ",".join(reports.EXPORT_HEADER))
+        self.assertTrue(lines[1].startswith(f"{self.START},Центр,Sedan,1,20.00,2.0,"))
+
+
+class StreamingExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserModel.objects.create_user(username="export", password="x")
+        car = Car.objects.create(brand="Kia", model="Rio", year=2021, price_per_hour=10)
+        start = datetime(2026, 2, 1, 10, tzinfo=dt_timezone.utc)
+        cls.rentals = Rental.objects.bulk_create([
+            make_rental(
+                cls.user, car, start + timedelta(days=i), start + timedelta(days=i, hours=2),
+                total_price=20, full_name="Иван", city="Алматы", card_number="4111111111111111", cvc="123",
+            )
+            for i in range(5)
+        ])
+        TripTracking.objects.bulk_create([
+            TripTracking(rental=rental, timestamp=rental.start_time + timedelta(minutes=m), latitude=43.25, longitude=76.9)
+            for rental in cls.rentals for m in range(3)
+        ])
+
+    def test_chunks_and_formats(self):
+        chunks = list(exports.stream(Rental.objects.order_by("pk"), "csv", chunk_size=2))
+        self.assertEqual(len(chunks), 3)
+        rows = list(csv.reader(io.StringIO(b"".join(chunks).decode())))
+        self.assertEqual(tuple(rows[0]), exports.DATASETS["rentals"][1])
+        self.assertEqual([int(row[0]) for row in rows[1:]], [rental.pk for rental in self.rentals])
+        self.assertNotIn("4111111111111111", b"".join(chunks).decode())
+
+        content = b"".join(exports.stream(TripTracking.objects.order_by("pk"), "ndjson", chunk_size=4)).decode()
+        points = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(points), 15)
+        self.assertEqual(points[0]["latitude"], "43.250000")
+        self.assertEqual(points[0]["timestamp"], "2026-02-01T10:00:00+00:00")
+
+    @skipUnless(exports.pyarrow, "pyarrow не установлен")
+    def test_parquet(self):
+        content = b"".join(exports.stream(Rental.objects.order_by("pk"), "parquet", chunk_size=2))
+        table = exports.pyarrow.parquet.read_table(io.BytesIO(content))
+        self.assertEqual(table.column("id").to_pylist(), [rental.pk for rental in self.rentals])
+        self.assertEqual(str(table.column("total_price")[0]), "20.00")
+
+    def test_admin_action_streams_filtered_list(self):
+        self.client.force_login(UserModel.objects.create_superuser("root", password="x"))
+        rental = self.rentals[0]
+        response = self.client.post(reverse("admin:rental_triptracking_changelist") + f"?q={rental.pk}", {
+            "action": "export_ndjson", "index": 0, "select_across": 1, "_selected_action": [0],
+        })
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual({json.loads(line)["rental_id"] for line in lines}, {rental.pk})
+        self.assertEqual(len(lines), 3)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/tracking.csv"
+            call_command(
+                "export_data", "tracking", "--output", path, "--rental", str(self.rentals[1].pk),
+                "--since", "2026-02-01", "--until", "2026-02-02", stdout=io.StringIO(),
+            )
+            with open(path) as file:
+                rows = list(csv.DictReader(file))
+        self.assertEqual([int(row["rental_id"]) for row in rows], [self.rentals[1].pk] * 3)
+
+
+class TelemetryIngestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = UserModel.objects.create_user(username="tracker", password="x")
+        cls.car = Car.objects.create(brand="Kia", model="Rio", year=2021, price_per_hour=10)
+        start = timezone.now() - timedelta(hours=1)
+        cls.rental = Rental.objects.bulk_create([make_rental(user, cls.car, start, start + timedelta(hours=2))])[0]
+
+    def point(self, minute, latitude=43.25, **extra):
+        return json.dumps({
+            "rental_id": self.rental.pk, "latitude": latitude, "longitude": 76.9,
+            "timestamp": f"2026-03-01T10:{minute:02d}:00+00:00", **extra,
+        })
+
+    def test_rejects_bad_points(self):
+        lines = [
+            self.point(0),
+            '{"rental_id": %d, "latitude": NaN, "longitude": 76.9}' % self.rental.pk,
+            self.point(1, latitude=91),
+            self.point(2, timestamp="2024-02-30T00:00:00"),
+            json.dumps({"rental_id": 0, "latitude": 1, "longitude": 1}),
+            "not json",
+        ]
+        self.assertEqual(ingest(lines), (1, 5))
+        self.assertEqual(TripTracking.objects.filter(rental=self.rental).count(), 1)
+
+    def test_location_keeps_newest_point(self):
+        ingest([self.point(5, latitude=43.5), self.point(3, latitude=43.3)])
+        location = CarLocation.objects.get(car=self.car)
+        self.assertEqual((location.latitude, location.updated_at.minute), (Decimal("43.500000"), 5))
+
+        # Запоздавшая пачка сохраняется в трек, но позицию не откатывает
+        self.assertEqual(ingest([self.point(4, latitude=43.4)]), (1, 0))
+        location.refresh_from_db()
+        self.assertEqual(location.latitude, Decimal("43.500000"))
+
+        ingest([self.point(6, latitude=43.6)])
+        location.refresh_from_db()
+        self.assertEqual(location.latitude, Decimal("43.600000"))
+
+
+class LedgerPaymentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserModel.objects.create_user(username="payer", password="x")
+        cls.car = Car.objects.create(brand="Kia", model="Rio", year=2021, price_per_hour=10)
+
+    def rental(self, start_hour, end_hour):
+        start = datetime(2026, 5, 1, start_hour, tzinfo=dt_timezone.utc)
+        end = datetime(2026, 5, 1, end_hour, tzinfo=dt_timezone.utc)
+        return make_rental(self.user, self.car, start, end)
+
+    def test_booking_posts_payment(self):
+        rental = book_car(self.rental(10, 12), pay=True)
+        rental.refresh_from_db()
+        self.assertTrue(rental.is_paid)
+        entries = list(Transaction.objects.filter(user=self.user).values_list("transaction_type", "amount"))
+        self.assertEqual(sorted(entries), [("RENTAL", rental.total_price), ("TOP_UP", rental.total_price)])
+        self.user.refresh_from_db()
+        self.assertEqual(ledger_balance(self.user.pk), self.user.balance)
+
+    def test_conflict_posts_nothing(self):
+        book_car(self.rental(10, 12), pay=True)
+        with self.assertRaises(BookingConflict):
+            book_car(self.rental(11, 13), pay=True)
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 2)
+
+    def test_negative_balance_does_not_block_payment(self):
+        # Списание из админки увело баланс в минус; оплата картой — пара на ноль
+        ledger.post(self.user.pk, "RENTAL", "50", allow_negative=True)
+        rental = book_car(self.rental(10, 12), pay=True)
+        self.assertTrue(rental.is_paid)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal("-50"))
+        self.assertEqual(ledger_balance(self.user.pk), self.user.balance)
+
+    def test_rent_view_reports_payment_failure(self):
+        self.client.force_login(self.user)
+        with mock.patch("rental.views.book_car", side_effect=ledger.InsufficientFunds):
+            response = self.client.post(reverse("car_rent", args=[self.car.pk]), {
+                "full_name": "Иван", "phone_number": "0", "address": "-", "city": "-",
+                "pickup_location": "-", "pickup_date": "2026-05-01", "pickup_time": "10:00",
+                "dropoff_location": "-", "dropoff_date": "2026-05-01", "dropoff_time": "12:00",
+                "payment_method": "PAYPAL",
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Не удалось провести оплату, попробуйте позже", [str(m) for m in response.context["messages"]])
+        self.assertFalse(Rental.objects.exists())
+
+    def test_admin_mark_paid_posts_to_ledger(self):
+        unpaid, paid = book_car(self.rental(10, 12)), book_car(self.rental(13, 15), pay=True)
+        self.client.force_login(UserModel.objects.create_superuser("cashier", password="x"))
+        self.client.post(reverse("admin:rental_rental_changelist"), {
+            "action": "mark_paid", "index": 0, "_selected_action": [unpaid.pk, paid.pk],
+        })
+        unpaid.refresh_from_db()
+        self.assertTrue(unpaid.is_paid)
+        # Уже оплаченная аренда второй раз не проводится
+        self.assertEqual(Transaction.objects.filter(user=self.user, transaction_type="RENTAL").count(), 2)
+        self.assertEqual(ledger_balance(self.user.pk), UserModel.objects.get(pk=self.user.pk).balance)
+
+    def test_admin_rejects_non_positive_amount(self):
+        self.client.force_login(UserModel.objects.create_superuser("cashier", password="x"))
+        response = self.client.post(reverse("admin:rental_transaction_add"), {
+            "user": self.user.pk, "transaction_type": "TOP_UP", "amount": "0",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Сумма должна быть положительной")
+        self.assertFalse(Transaction.objects.exists())
+
+
+class BookingOverlapTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserModel.objects.create_user(username="booker", password="x")
+        cls.car = Car.objects.create(brand="Kia", model="Rio", year=2021, price_per_hour=10)
+        cls.other_car = Car.objects.create(brand="Kia", model="Ceed", year=2022, price_per_hour=12)
+
+    def rental(self, start_hour, end_hour, car=None):
+        start = datetime(2026, 6, 1, start_hour, tzinfo=dt_timezone.utc)
+        end = datetime(2026, 6, 1, end_hour, tzinfo=dt_timezone.utc)
+        return make_rental(self.user, car or self.car, start, end)
+
+    def test_constraint_rejects_overlap(self):
+        self.rental(10, 12).save()
+        with self.assertRaisesMessage(IntegrityError, "rental_no_overlap"), transaction.atomic():
+            self.rental(11, 13).save()
+        # Полуинтервалы: стык не пересечение; другая машина не мешает
+        self.rental(12, 14).save()
+        self.rental(10, 12, car=self.other_car).save()
+        self.assertEqual(Rental.objects.count(), 3)
+
+    def test_book_car_rejects_overlap(self):
+        book_car(self.rental(10, 12))
+        with self.assertRaises(BookingConflict):
+            book_car(self.rental(9, 11))
+        book_car(self.rental(12, 14))
+        self.assertEqual(Rental.objects.filter(car=self.car).count(), 2)
+
+    def test_book_car_race_hits_constraint(self):
+        book_car(self.rental(10, 12))
+        # Конкурентная бронь, которую предварительная проверка не увидела
+        with mock.patch("rental.booking.overlapping_rentals", return_value=Rental.objects.none()):
+            with self.assertRaises(BookingConflict):
+                book_car(self.rental(11, 13))
+        self.assertEqual(Rental.objects.count(), 1)
+
+    def test_book_car_allows_own_period(self):
+        rental = book_car(self.rental(10, 12))
+        rental.end_time = datetime(2026, 6, 1, 13, tzinfo=dt_timezone.utc)
+        book_car(rental)
+        rental.refresh_from_db()
+        self.assertEqual(rental.end_time.hour, 13)
+
+    def test_admin_rejects_reversed_period(self):
+        self.client.force_login(UserModel.objects.create_superuser("manager", password="x"))
+        response = self.client.post(reverse("admin:rental_rental_add"), {
+            "user": self.user.pk, "car": self.car.pk,
+            "start_time": "2026-06-01T12:00", "end_time": "2026-06-01T10:00",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Окончание аренды должно быть позже начала")
+        self.assertFalse(Rental.objects.exists())
+
+    def test_admin_creates_rental(self):
+        self.client.force_login(UserModel.objects.create_superuser("manager", password="x"))
+        response = self.client.post(reverse("admin:rental_rental_add"), {
+            "user": self.user.pk, "car": self.car.pk,
+            "start_time": "2026-06-01T10:00", "end_time": "2026-06-01T12:00",
+        })
+        self.assertEqual(response.status_code, 302)
+        rental = Rental.objects.get()
+        self.assertEqual(rental.end_time - rental.start_time, timedelta(hours=2))
+        response = self.client.get(reverse("admin:rental_rental_change", args=[rental.pk]))
+        self.assertContains(response, 'type="datetime-local"')
+
+class AvailabilityIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserModel.objects.create_user(username="renter", password="x")
+        cls.car = Car.objects.create(brand="Kia", model="Rio", year=2021, price_per_hour=10)
+
+    def setUp(self):
+        availability_index.invalidate()
+        self.start = timezone.now() + timedelta(days=1)
+        self.end = self.start + timedelta(hours=3)
+
+    def rent(self):
+        rental = make_rental(self.user, self.car, self.start, self.end)
+        rental.save()
+        return rental
+
+    def test_follows_rental_save_and_delete(self):
+        self.assertIn(self.car.pk, get_available_car_ids(self.start, self.end))
+        with self.captureOnCommitCallbacks(execute=True):
+            rental = self.rent()
+        self.assertNotIn(self.car.pk, get_available_car_ids(self.start, self.end))
+        with self.captureOnCommitCallbacks(execute=True):
+            rental.delete()
+        self.assertIn(self.car.pk, get_available_car_ids(self.start, self.end))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rental = self.rent()
+        with self.captureOnCommitCallbacks(execute=True):
+            rental.start_time, rental.end_time = self.end, self.end + timedelta(hours=1)
+            rental.save()
+        self.assertIn(self.car.pk, get_available_car_ids(self.start, self.end))
+
+    def test_changes_during_rebuild_are_replayed(self):
+        index = AvailabilityIndex(ttl=0)
+        load = AvailabilityIndex.load
+
+        def load_then_book(fresh, cars, rentals):
+            load(fresh, cars, rentals)
+            # Бронь закоммитилась, пока новый индекс загружался
+            index.update_rental(10**9, self.car.pk, self.start, self.end)
+
+        with mock.patch.object(AvailabilityIndex, "load", load_then_book):
+            index.build()
+        self.assertNotIn(self.car.pk, index.search(self.start, self.end))
+
+    def test_stale_index_answers_during_rebuild(self):
+        index = AvailabilityIndex(ttl=0)
+        index.build()
+        # Перестройку ведёт другой поток: поиск не ждёт и отвечает по старому индексу
+        with mock.patch.object(index, "is_stale", return_value=True), \
+                mock.patch.object(index, "build") as build, index._build_lock:
+            index.ensure_built()
+        build.assert_not_called()
+        self.assertEqual(index.search(self.start, self.end), [self.car.pk])
+
+    def test_rebuilds_on_change_in_other_process(self):
+        self.assertIn(self.car.pk, get_available_car_ids(self.start, self.end))
+        # Бронь из другого процесса: сигналы этого индекса не видели, но версия в кеше сдвинулась
+        self.rent()
+        bump_availability()
+        self.assertNotIn(self.car.pk, get_available_car_ids(self.start, self.end))
+
+
+@mock.patch.object(CarListView, "paginate_by", 2)
+class CarListPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserModel.objects.create_user(username="renter", password="x")
+        cls.cars = Car.objects.bulk_create(
+            [Car(brand="Kia", model=f"Rio {i}", year=2021, price_per_hour=10 + i) for i in range(5)]
+        )
+
+    def setUp(self):
+        availability_index.invalidate()
+
+    def listed(self, **params):
+        response = self.client.get(reverse("car_list"), params)
+        self.assertEqual(response.status_code, 200)
+        return [car.pk for car in response.context["cars"]]
+
+    def test_pages_by_id(self):
+        ids = [car.pk for car in self.cars]
+        self.assertEqual(self.listed(), ids[:2])
+        self.assertEqual(self.listed(page=3), ids[4:])
+
+    def test_only_page_cars_are_loaded(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.listed(page=2)
+        car_queries = [q["sql"] for q in queries if 'FROM "rental_car" WHERE' in q["sql"]]
+        self.assertEqual(car_queries, [mock.ANY])
+        self.assertIn(f"IN ({self.cars[2].pk}, {self.cars[3].pk})", car_queries[0])
+
+    def test_ordering_spans_pages_and_skips_booked(self):
+        start = timezone.now() - timedelta(hours=1)
+        end = start + timedelta(hours=3)
+        expensive = self.cars[-1]
+        with self.captureOnCommitCallbacks(execute=True):
+            make_rental(self.user, expensive, start, end).save()
+        ids = [car.pk for car in reversed(self.cars[:-1])]
+        self.assertEqual(self.listed(ordering="-price_per_hour"), ids[:2])
+        self.assertEqual(self.listed(ordering="-price_per_hour", page=2), ids[2:])
+
+
+class PricingEngineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.dealer = Dealer.objects.create(name="Центр", address="-", latitude=43.2, longitude=76.9)
+        cls.sedan = Car.objects.create(brand="Kia", model="Rio", year=2021, price_per_hour=10)
+        cls.suv = Car.objects.create(
+            brand="Toyota", model="RAV4", year=2022, price_per_hour=10, type="SUV", dealer=cls.dealer,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.engine = PricingEngine()
+
+    def quote(self, car, start, hours):
+        return self.engine.quote_cars([car], start, start + timedelta(hours=hours))[car.pk]
+
+    def test_season_applies_per_day(self):
+        PricingRule.objects.create(
+            name="Праздник", season_start=date(2026, 7, 1), season_end=date(2026, 7, 1), multiplier=2,
+        )
+        # 23:00–01:00: час до полуночи по базовой цене, час после — по сезонной
+        quote = self.quote(self.sedan, datetime(2026, 6, 30, 23, tzinfo=dt_timezone.utc), 2)
+        self.assertEqual((quote["total"], quote["rules"]), (Decimal("30.00"), ["Праздник"]))
+        # 22:00–02:00: сезон включает season_end, но не следующий день
+        quote = self.quote(self.sedan, datetime(2026, 7, 1, 22, tzinfo=dt_timezone.utc), 4)
+        self.assertEqual(quote["total"], Decimal("60.00"))
+        quote = self.quote(self.sedan, datetime(2026, 7, 2, 1, tzinfo=dt_timezone.utc), 1)
+        self.assertEqual((quote["total"], quote["rules"]), (Decimal("10.00"), []))
+
+    def test_scope_and_min_hours(self):
+        PricingRule.objects.create(name="Неделя", car_type="SUV", dealer=self.dealer, min_hours=24, multiplier="0.9")
+        start = datetime(2026, 3, 2, tzinfo=dt_timezone.utc)
+        self.assertEqual(self.quote(self.suv, start, 23)["total"], Decimal("230.00"))
+        self.assertEqual(self.quote(self.suv, start, 24)["total"], Decimal("216.00"))
+        self.assertEqual(self.quote(self.sedan, start, 24)["total"], Decimal("240.00"))
+
+    def test_rule_change_rebuilds_table(self):
+        start = datetime(2026, 3, 2, tzinfo=dt_timezone.utc)
+        self.assertEqual(self.quote(self.sedan, start, 2)["total"], Decimal("20.00"))
+        with self.captureOnCommitCallbacks(execute=True):
+            PricingRule.objects.create(name="Наценка", multiplier="1.5")
+        self.assertEqual(self.quote(self.sedan, start, 2)["total"], Decimal("30.00"))
+
+    def test_stale_table_does_not_leak_into_rebuilt(self):
+        stale = self.engine.ensure_current()
+        PricingRule.objects.create(name="Наценка", multiplier="1.5")
+        self.engine.rebuild(stale.version)
+        # Поток, взявший таблицу до rebuild(), дозаполняет только её
+        self.assertEqual(stale.candidates("Sedan", None), ())
+        self.assertEqual([rule[0] for rule in self.engine.candidates("Sedan", None)], ["Наценка"])
+
+
+class TrackArchiveTests(TestCase):
+    month = datetime(2020, 3, 1, tzinfo=dt_timezone.utc)
+
+    @classmethod
+    def setUpTestData(cls):
+        user = UserModel.objects.create_user(username="driver", password="x")
+        car = Car.objects.create(brand="Kia", model="Rio", year=2021, price_per_hour=10)
+        cls.rentals = []
+        for day in (2, 9):
+            start = cls.month.replace(day=day)
+            end = start + timedelta(hours=2)
+            rental = make_rental(user, car, start, end)
+            rental.save()
+            cls.rentals.append(rental)
+
+    def points(self, rental, count=50):
+        start = rental.start_time
+        return [
+            (start + timedelta(seconds=7 * i, microseconds=i), Decimal("55.751244") + Decimal(i).scaleb(-6),
+             Decimal("-37.617300") - Decimal(i).scaleb(-6))
+            for i in range(count)
+        ]
+
+    def test_file_roundtrip(self):
+        tracks = {rental.pk: self.points(rental) for rental in self.rentals}
+        rows = [(rental_id, *point) for rental_id in sorted(tracks) for point in tracks[rental_id]]
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/part.trk"
+            total, first, last = write_archive(path, rows)
+            self.assertEqual((total, first, last), (len(rows), min(tracks), max(tracks)))
+            for rental_id, points in tracks.items():
+                self.assertEqual(read_archive(path, rental_id), points)
+            self.assertEqual(read_archive(path, max(tracks) + 1), [])
+
+    def test_archive_partition_roundtrip(self):
+        if not is_partitioned():
+            self.skipTest("rental_triptracking не секционирована")
+        name = create_partition(self.month)
+        tracks = {rental.pk: self.points(rental) for rental in self.rentals}
+        TripTracking.objects.bulk_create(
+            TripTracking(rental_id=rental_id, timestamp=timestamp, latitude=latitude, longitude=longitude)
+            for rental_id, points in tracks.items()
+            for timestamp, latitude, longitude in points
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            archive = archive_partition(name, self.month, directory=directory)
+            self.assertEqual(
+                (archive.rows, archive.min_rental_id, archive.max_rental_id),
+                (100, min(tracks), max(tracks)),
+            )
+            self.assertEqual(archive.period_end, datetime(2020, 4, 1, tzinfo=dt_timezone.utc))
+            self.assertFalse(TripTracking.objects.exists())
+            for rental_id, points in tracks.items():
+                self.assertEqual(archived_points(rental_id), points)
+                self.assertEqual(list(iter_track(rental_id)), points)
+        self.assertEqual(TrackArchive.objects.get().partition, name)
+
+    def test_late_point_after_archive_is_kept(self):
+        if not is_partitioned():
+            self.skipTest("rental_triptracking не секционирована")
+        name = create_partition(self.month)
+        rental = self.rentals[0]
+        points = self.points(rental, count=3)
+        TripTracking.objects.bulk_create(
+            TripTracking(rental=rental, timestamp=timestamp, latitude=latitude, longitude=longitude)
+            for timestamp, latitude, longitude in points
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            archive_partition(name, self.month, directory=directory)
+            # Секции месяца больше нет — точка уходит в секцию по умолчанию
+            late = points[-1][0] + timedelta(minutes=1), Decimal("55.800000"), Decimal("37.600000")
+            TripTracking.objects.create(rental=rental, timestamp=late[0], latitude=late[1], longitude=late[2])
+            self.assertEqual(list(iter_track(rental.pk)), [*points, late])
+
+    def test_failed_archive_reattaches_partition(self):
+        if not is_partitioned():
+            self.skipTest("rental_triptracking не секционирована")
+        name = create_partition(self.month)
+        rental = self.rentals[0]
+        TripTracking.objects.bulk_create(
+            TripTracking(rental=rental, timestamp=timestamp, latitude=latitude, longitude=longitude)
+            for timestamp, latitude, longitude in self.points(rental, count=3)
+        )
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch("rental.tracking.write_archive", side_effect=OSError("диск заполнен")):
+            with self.assertRaises(OSError):
+                archive_partition(name, self.month, directory=directory)
+        self.assertIn(name, [partition for partition, _ in list_partitions()])
+        self.assertEqual(TripTracking.objects.filter(rental=rental).count(), 3)
+        self.assertFalse(TrackArchive.objects.exists())
@@ -0,0 +1,319 @@
+"""
+Секции и архив истории трекинга.
+
+rental_triptracking секционирована по месяцам (миграция 0006):
+rental_triptracking_pYYYYMM плюс секция _default для точек вне
+подготовленных диапазонов. ensure_partitions заранее создаёт секции
+на будущие месяцы, archive_partition упаковывает старую секцию в файл
+и удаляет её из базы.
+
+Формат архива (little-endian):
+    b"TRK1"
+    блоки — по одному на аренду, каждый сжат zlib и хранит столбцы подряд:
+        время, мкс от epoch (int64; первое значение абсолютное, дальше разности),
+        широта и долгота в миллионных долях градуса (int32, без потерь для Decimal(9, 6))
+    оглавление — записи (rental_id, offset, length, count), отсортированные по rental_id
+    хвост — (смещение оглавления, число записей, b"TRK1")
+Чтение трека одной аренды — бинарный поиск по оглавлению и распаковка одного блока.
+"""
+import os
+import re
+import struct
+import sys
+import zlib
+from array import array
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import TrackArchive, TripTracking
+
+TABLE = TripTracking._meta.db_table
+DEFAULT_PARTITION = f"{TABLE}_default"
+PARTITION_RE = re.compile(rf"^{TABLE}_p(\d{{4}})(\d{{2}})$")
+
+MAGIC = b"TRK1"
+FOOTER_ENTRY = struct.Struct("<qQII")
+TRAILER = struct.Struct("<QI4s")
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+COORD_SCALE = 1_000_000
+
+
+def month_start(value):
+    return value.astimezone(dt_timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def partition_name(month):
+    return f"{TABLE}_p{month:%Y%m}"
+
+
+def is_partitioned():
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))", [TABLE]
+        )
+        return cursor.fetchone()[0]
+
+
+def list_partitions():
+    """[(имя, начало месяца), ...] по возрастанию, без секции по умолчанию"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+            """,
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = []
+    for name in names:
+        match = PARTITION_RE.match(name)
+        if match:
+            partitions.append((name, datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc)))
+    return sorted(partitions, key=lambda item: item[1])
+
+
+def create_partition(month):
+    """
+    Создаёт секцию за месяц. Точки этого месяца, успевшие попасть в секцию
+    по умолчанию, переносятся в новую секцию в той же транзакции.
+    """
+    name = partition_name(month)
+    upper = add_months(month, 1)
+    quote = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {quote(name)} (LIKE {quote(TABLE)} INCLUDING DEFAULTS)")
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {quote(DEFAULT_PARTITION)}
+                WHERE "timestamp" >= %s AND "timestamp" < %s
+                RETURNING *
+            )
+            INSERT INTO {quote(name)} SELECT * FROM moved
+            """,
+            [month, upper],
+        )
+        cursor.execute(
+            f"ALTER TABLE {quote(TABLE)} ATTACH PARTITION {quote(name)} FOR VALUES FROM (%s) TO (%s)",
+            [month, upper],
+        )
+    return name
+
+
+def ensure_partitions(months_ahead=3, now=None):
+    """Создаёт недостающие секции от текущего месяца на months_ahead вперёд"""
+    existing = {name for name, _ in list_partitions()}
+    month = month_start(now or timezone.now())
+    created = []
+    for _ in range(months_ahead + 1):
+        if partition_name(month) not in existing:
+            created.append(create_partition(month))
+        month = add_months(month, 1)
+    return created
+
+
+def partitions_to_archive(older_than_months, now=None):
+    """Секции, целиком закончившиеся раньше older_than_months месяцев назад"""
+    border = add_months(month_start(now or timezone.now()), -older_than_months)
+    return [(name, month) for name, month in list_partitions() if add_months(month, 1) <= border]
+
+
+def _to_le(values):
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_le(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def encode_block(points):
+    """points — [(timestamp, latitude, longitude), ...] по возрастанию времени"""
+    times = array("q")
+    previous = 0
+    for timestamp, _, _ in points:
+        micros = (timestamp - EPOCH) // MICROSECOND
+        times.append(micros - previous)
+        previous = micros
+    latitudes = array("i", (int(latitude * COORD_SCALE) for _, latitude, _ in points))
+    longitudes = array("i", (int(longitude * COORD_SCALE) for _, _, longitude in points))
+    return zlib.compress(_to_le(times) + _to_le(latitudes) + _to_le(longitudes), 6)
+
+
+def decode_block(data, count):
+    raw = zlib.decompress(data)
+    times = _from_le("q", raw[:count * 8])
+    latitudes = _from_le("i", raw[count * 8:count * 12])
+    longitudes = _from_le("i", raw[count * 12:count * 16])
+    points = []
+    micros = 0
+    for delta, latitude, longitude in zip(times, latitudes, longitudes):
+        micros += delta
+        points.append((
+            EPOCH + timedelta(microseconds=micros),
+            Decimal(latitude).scaleb(-6),
+            Decimal(longitude).scaleb(-6),
+        ))
+    return points
+
+
+def write_archive(path, rows):
+    """
+    rows — (rental_id, timestamp, latitude, longitude), упорядоченные по
+    (rental_id, timestamp). Возвращает (число точек, мин. rental_id, макс. rental_id).
+    """
+    entries = []
+    total = 0
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+
+        def flush(rental_id, points):
+            block = encode_block(points)
+            entries.append((rental_id, f.tell(), len(block), len(points)))
+            f.write(block)
+
+        current, points = None, []
+        for rental_id, timestamp, latitude, longitude in rows:
+            if rental_id != current and points:
+                flush(current, points)
+                points = []
+            current = rental_id
+            points.append((timestamp, latitude, longitude))
+            total += 1
+        if points:
+            flush(current, points)
+
+        footer_offset = f.tell()
+        for entry in entries:
+            f.write(FOOTER_ENTRY.pack(*entry))
+        f.write(TRAILER.pack(footer_offset, len(entries), MAGIC))
+    if not entries:
+        return total, None, None
+    return total, entries[0][0], entries[-1][0]
+
+
+def read_archive(path, rental_id):
+    """Точки одной аренды из файла архива: [(timestamp, latitude, longitude), ...]"""
+    with open(path, "rb") as f:
+        f.seek(-TRAILER.size, os.SEEK_END)
+        footer_offset, count, magic = TRAILER.unpack(f.read(TRAILER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path}: не архив трекинга")
+        f.seek(footer_offset)
+        footer = f.read(count * FOOTER_ENTRY.size)
+
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if FOOTER_ENTRY.unpack_from(footer, mid * FOOTER_ENTRY.size)[0] < rental_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == count:
+            return []
+        found_id, offset, length, points = FOOTER_ENTRY.unpack_from(footer, lo * FOOTER_ENTRY.size)
+        if found_id != rental_id:
+            return []
+        f.seek(offset)
+        return decode_block(f.read(length), points)
+
+
+def archive_partition(name, month, directory=None):
+    """
+    Упаковывает секцию в файл, регистрирует TrackArchive и удаляет секцию из базы.
+
+    Секция сначала отсоединяется: поздние точки этого месяца дальше попадают
+    в секцию по умолчанию, а не в таблицу, которая уже читается в архив.
+    Если файл записать не удалось, секция присоединяется обратно.
+    """
+    directory = Path(directory or settings.TRIP_ARCHIVE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{name}.trk"
+    tmp_path = path.with_suffix(".trk.tmp")
+    quote = connection.ops.quote_name
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Точки, вставленные в этой же транзакции, ждут отложенной проверки
+        # внешнего ключа, а с такими событиями таблицу нельзя менять и удалять
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(f"ALTER TABLE {quote(TABLE)} DETACH PARTITION {quote(name)}")
+
+    try:
+        with transaction.atomic():
+            # Серверный курсор: секция не загружается в память целиком
+            cursor = connection.chunked_cursor()
+            cursor.execute(
+                f'SELECT rental_id, "timestamp", latitude, longitude FROM {quote(name)} ORDER BY rental_id, "timestamp"'
+            )
+
+            def rows():
+                while batch := cursor.fetchmany(10_000):
+                    yield from batch
+
+            total, min_rental_id, max_rental_id = write_archive(tmp_path, rows())
+            cursor.close()
+        os.replace(tmp_path, path)
+    except Exception:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"ALTER TABLE {quote(TABLE)} ATTACH PARTITION {quote(name)} FOR VALUES FROM (%s) TO (%s)",
+                [month, add_months(month, 1)],
+            )
+        raise
+
+    with transaction.atomic():
+        archive = TrackArchive.objects.create(
+            partition=name,
+            period_start=month,
+            period_end=add_months(month, 1),
+            path=str(path),
+            rows=total,
+            size_bytes=path.stat().st_size,
+            min_rental_id=min_rental_id,
+            max_rental_id=max_rental_id,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {quote(name)}")
+    return archive
+
+
+def archived_points(rental_id):
+    """Точки аренды из всех архивов, по времени"""
+    points = []
+    archives = TrackArchive.objects.filter(
+        min_rental_id__lte=rental_id, max_rental_id__gte=rental_id,
+    ).order_by("period_start")
+    for archive in archives:
+        points.extend(read_archive(archive.path, rental_id))
+    return points
+
+
+def iter_track(rental_id):
+    """Весь трек аренды по времени: архивные точки плюс точки из базы"""
+    points = archived_points(rental_id)
+    live = TripTracking.objects.filter(rental_id=rental_id).order_by("timestamp")
+    if not points:
+        yield from live.values_list("timestamp", "latitude", "longitude").iterator(chunk_size=10_000)
+        return
+    points.extend(live.values_list("timestamp", "latitude", "longitude"))
+    points.sort(key=lambda point: point[0])
+    yield from points
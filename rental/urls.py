@@ -1,9 +1,27 @@
+from django.conf import settings
 from django.urls import path
+
+from .api import AvailabilityApiView, CarApiView, CarLocationApiView, DealerApiView
 from .views import (
     HomePageView, CarTypeListView, CarDetailView,
-    AboutUsView, ContactUsView, RentalHistoryView, TransactionHistoryView, ActiveRentalsView, CarListView, RentCarView
+    AboutUsView, ContactUsView, RentalHistoryView, TransactionHistoryView, ActiveRentalsView, CarListView, RentCarView,
+    CarSearchView, TelemetryIngestView, NearestCarsView, NearestDealersView,
+    RentalTrackView, RentalRouteView, QuoteView,
 )
 
+if settings.ASYNC_VIEWS:
+    # Под ASGI читающие страницы работают на асинхронном ORM
+    from .async_views import (  # noqa: F811
+        AsyncHomePageView as HomePageView,
+        AsyncCarListView as CarListView,
+        AsyncCarTypeListView as CarTypeListView,
+        AsyncCarSearchView as CarSearchView,
+        AsyncCarDetailView as CarDetailView,
+        AsyncRentalHistoryView as RentalHistoryView,
+        AsyncTransactionHistoryView as TransactionHistoryView,
+        AsyncActiveRentalsView as ActiveRentalsView,
+    )
+
 urlpatterns = [
     path("", HomePageView.as_view(), name="home"),
     path("cars/type/<str:type>/", CarTypeListView.as_view(), name="car_type_list"),
@@ -15,4 +33,16 @@ urlpatterns = [
     path('payment-history/', TransactionHistoryView.as_view(), name='payment_history'),
     path('my-rentals/', ActiveRentalsView.as_view(), name='active_rentals'),
     path('cars/', CarListView.as_view(), name='car_list'),
+    path('cars/search/', CarSearchView.as_view(), name='car_search'),
+    path('cars/quote/', QuoteView.as_view(), name='car_quote'),
+    path('rentals/<int:pk>/track/', RentalTrackView.as_view(), name='rental_track'),
+    path('rentals/<int:pk>/route/', RentalRouteView.as_view(), name='rental_route'),
+    path('nearby/cars/', NearestCarsView.as_view(), name='nearest_cars'),
+    path('nearby/dealers/', NearestDealersView.as_view(), name='nearest_dealers'),
+    path('telemetry/ingest/', TelemetryIngestView.as_view(), name='telemetry_ingest'),
+
+    path('api/cars/', CarApiView.as_view(), name='api_cars'),
+    path('api/dealers/', DealerApiView.as_view(), name='api_dealers'),
+    path('api/locations/', CarLocationApiView.as_view(), name='api_locations'),
+    path('api/availability/', AvailabilityApiView.as_view(), name='api_availability'),
 ]
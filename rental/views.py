@@ -1,63 +1,236 @@
+import json
+
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.conf import settings
+from django.http import Http404, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django.urls import reverse_lazy
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import TemplateView, DetailView, ListView, CreateView
 from django.contrib import messages
-
-from .admin import RentalForm
-from .models import Car, CarReview, Rental, Transaction
+from django.utils.timezone import now
+
+from .availability import get_available_car_ids
+from .booking import BookingConflict, book_car
+from .catalog_cache import (
+    get_availability_version, get_car_versions, get_catalog_version, make_etag, version_to_timestamp,
+)
+from .forms import CarSearchForm, NearbyForm, QuoteForm, RentalForm, RouteForm
+from .geo import nearest
+from .ledger import InsufficientFunds
+from .models import Car, CarLocation, Dealer, Rental, Transaction
+from .pagination import KeysetPaginationMixin
+from .pricing import get_rules_version, pricing_engine
+from .routes import get_simplified_route
+from .stats import get_home_stats
+from .telemetry import ingest
+from .tracking import iter_track
 
 
 class HomePageView(TemplateView):
     template_name = "home.html"
 
+    def get_stats(self):
+        return get_home_stats()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(self.get_stats())
+        context["search_form"] = CarSearchForm()
+        return context
+
+
+class ConditionalGetMixin:
+    """
+    ETag/Last-Modified по версиям из кеша (rental/catalog_cache.py).
+    Валидаторы считаются до рендеринга, поэтому на совпадение отвечаем 304
+    без запросов к базе и без шаблона.
+    """
+
+    def get_validators(self):
+        """-> (etag, last_modified в секундах epoch или None)"""
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        return self.add_validators(response, etag, last_modified)
+
+    def add_validators(self, response, etag, last_modified):
+        response.headers.setdefault("ETag", etag)
+        if last_modified is not None:
+            response.headers.setdefault("Last-Modified", http_date(last_modified))
+        # Браузер хранит страницу, но перепроверяет её каждый раз
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
+class AvailableCarsMixin(ConditionalGetMixin):
+    """
+    Список машин, свободных на выбранные даты (через индекс занятости).
+
+    Постранично, как AvailabilityApiView: object_list — упорядоченный
+    список id, Paginator режет его на страницы, и из базы загружаются
+    только машины текущей страницы. Фильтры и сортировку формы выполняет
+    база, но без списка свободных id в запросе: она возвращает id в нужном
+    порядке, а занятые отсекаются по индексу.
+    """
+    search_form_class = CarSearchForm
+    paginate_by = 24
+
+    def get_search_form(self):
+        if not hasattr(self, "_search_form"):
+            self._search_form = self.search_form_class(self.request.GET or None)
+        return self._search_form
+
+    def has_dates(self):
+        form = self.get_search_form()
+        return form.is_bound and form.is_valid() and bool(form.cleaned_data.get("pickup_date"))
+
+    def get_search_params(self):
+        form = self.get_search_form()
+        if form.is_bound and form.is_valid():
+            return form.get_search_params()
+        current = now()
+        return {"start": current, "end": current, "car_type": None, "dealer_id": None}
+
+    def get_available_ids(self):
+        if not hasattr(self, "_available_ids"):
+            self._available_ids = get_available_car_ids(**self.get_search_params())
+        return self._available_ids
+
+    def get_validators(self):
+        catalog_version = get_catalog_version()
+        rules_version = get_rules_version()
+        etag = make_etag(
+            self.request.path, sorted(self.request.GET.lists()),
+            catalog_version, rules_version, self.get_available_ids(),
+        )
+        # Без дат список зависит от текущего момента, и дату изменения назвать нельзя
+        last_modified = None
+        if self.has_dates():
+            last_modified = version_to_timestamp(max(catalog_version, rules_version, get_availability_version()))
+        return etag, last_modified
+
+    def get_queryset(self):
+        """Id свободных машин в порядке показа"""
+        ids = self.get_available_ids()
+        form = self.get_search_form()
+        if not (form.is_bound and form.is_valid() and form.has_queryset_filters()):
+            return ids
+        params = self.get_search_params()
+        queryset = Car.objects.filter(is_available=True).order_by("pk")
+        if params["car_type"]:
+            queryset = queryset.filter(type=params["car_type"])
+        if params["dealer_id"]:
+            queryset = queryset.filter(dealer_id=params["dealer_id"])
+        available = set(ids)
+        matching = form.filter_queryset(queryset).values_list("pk", flat=True)
+        return [pk for pk in matching.iterator(chunk_size=10000) if pk in available]
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator, page, ids, is_paginated = super().paginate_queryset(queryset, page_size)
+        # Машина могла быть удалена после поиска — её просто не показываем
+        cars = Car.objects.in_bulk(ids)
+        page.object_list = [cars[pk] for pk in ids if pk in cars]
+        return paginator, page, page.object_list, is_paginated
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["cars"] = Car.objects.filter(is_available=True)[:5]
-        context["total_cars"] = Car.objects.count()
-        context["total_brands"] = Car.objects.values("brand").distinct().count()
-        context["total_reviews"] = CarReview.objects.count()
+        context["search_form"] = self.get_search_form()
+        context["fragment_timeout"] = settings.CATALOG_FRAGMENT_TIMEOUT
+        cars = list(context["object_list"])
+        # Версии машин — ключи кеша карточек, одним get_many
+        versions = get_car_versions([car.pk for car in cars])
+        for car in cars:
+            car.cache_version = versions[car.pk]
+        if self.has_dates():
+            # Цены на выбранные даты для всей страницы одним расчётом
+            params = self.get_search_params()
+            quotes = pricing_engine.quote_cars(cars, params["start"], params["end"])
+            for car in cars:
+                car.quote = quotes[car.pk]["total"]
+        context["object_list"] = cars
+        context[self.get_context_object_name(cars)] = cars
         return context
 
 
-class CarListView(ListView):
+class CarListView(AvailableCarsMixin, ListView):
     model = Car
     template_name = 'car_list.html'
     context_object_name = 'cars'
 
-    def get_queryset(self):
+    def get_search_params(self):
         """Фильтруем машины по типу, если параметр передан"""
+        params = super().get_search_params()
         car_type = self.kwargs.get('type')  # Получаем тип из URL
         if car_type:
-            return Car.objects.filter(type=car_type, is_available=True)
-        return Car.objects.filter(is_available=True)  # По умолчанию все доступные машины
+            params["car_type"] = car_type
+        return params
 
 
-class CarTypeListView(ListView):
-    model = Car
-    template_name = "car_list.html"
-    context_object_name = "cars"
+class CarTypeListView(CarListView):
+    """Машины одного типа (тип берётся из URL)"""
 
-    def get_queryset(self):
-        car_type = self.kwargs.get("type")
-        return Car.objects.filter(type=car_type, is_available=True)
+
+class CarSearchView(CarListView):
+    """Поиск по датам, типу и дилеру из формы на главной"""
 
 
-class CarDetailView(DetailView):
+class CarDetailView(ConditionalGetMixin, DetailView):
     model = Car
+    queryset = Car.objects.select_related("dealer")
     template_name = "car_detail.html"
     context_object_name = "car"
 
+    def get_car_version(self):
+        if not hasattr(self, "_car_version"):
+            pk = self.kwargs["pk"]
+            # Версия есть только у существующих машин (удаление её стирает);
+            # без версии машину проверяем, чтобы не выдать ETag несуществующей
+            version = get_car_versions([pk], create=False).get(pk)
+            if version is None:
+                if not Car.objects.filter(pk=pk).exists():
+                    raise Http404("Машина не найдена")
+                version = get_car_versions([pk])[pk]
+            self._car_version = version
+        return self._car_version
+
+    def get_validators(self):
+        version = self.get_car_version()
+        return make_etag("car", self.kwargs["pk"], version), version_to_timestamp(version)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["car_version"] = self.get_car_version()
+        context["fragment_timeout"] = settings.CATALOG_FRAGMENT_TIMEOUT
+        # Ленивый queryset: при попадании в кеш фрагмента запроса не будет
+        context["reviews"] = self.object.reviews.select_related("user").order_by("-created_at")[:10]
+        return context
+
 
 
 class RentCarView(LoginRequiredMixin, CreateView):
     model = Rental
     form_class = RentalForm
-    template_name = "rental/rent_car.html"
-    success_url = reverse_lazy("rental_success")  # редирект после успешной аренды
+    template_name = "car_rental.html"
+    success_url = reverse_lazy("rental_history")  # редирект после успешной аренды
+
+    def dispatch(self, request, *args, **kwargs):
+        self.car = get_object_or_404(Car, pk=kwargs["pk"])
+        return super().dispatch(request, *args, **kwargs)
 
     def form_valid(self, form):
         rental = form.save(commit=False)
         rental.user = self.request.user
+        rental.car = self.car
 
         # Проверка заполнения данных карты, если выбрана оплата картой
         if rental.payment_method == "CARD":
@@ -65,9 +238,18 @@ class RentCarView(LoginRequiredMixin, CreateView):
                 messages.error(self.request, "Заполните данные карты!")
                 return self.form_invalid(form)
 
-        rental.save()
+        try:
+            book_car(rental, pay=True)
+        except BookingConflict:
+            messages.error(self.request, "Машина уже забронирована на эти даты")
+            return self.form_invalid(form)
+        except InsufficientFunds:
+            messages.error(self.request, "Не удалось провести оплату, попробуйте позже")
+            return self.form_invalid(form)
+
+        self.object = rental
         messages.success(self.request, "Аренда успешно оформлена!")
-        return super().form_valid(form)
+        return HttpResponseRedirect(self.get_success_url())
 
 
 class ContactUsView(TemplateView):
@@ -78,29 +260,185 @@ class AboutUsView(TemplateView):
     template_name = "about.html"
 
 
-class RentalHistoryView(ListView):
+class RentalHistoryView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Rental
     template_name = 'rental_history.html'
     context_object_name = 'rentals'
+    keyset_field = 'start_time'
+
+    def get_rentals(self):
+        return Rental.objects.filter(user=self.request.user)
 
     def get_queryset(self):
-        return Rental.objects.filter(user=self.request.user).order_by('-end_date')
+        return self.keyset_page(
+            self.get_rentals()
+            .select_related('car')
+            .only('start_time', 'end_time', 'total_price', 'car__brand', 'car__model')
+        )
 
 
-class TransactionHistoryView(ListView):
+class TransactionHistoryView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Transaction
     template_name = 'payment_history.html'
     context_object_name = 'payments'
+    keyset_field = 'timestamp'
 
     def get_queryset(self):
-        return Transaction.objects.filter(user=self.request.user).order_by('-date')
+        return self.keyset_page(
+            Transaction.objects.filter(user=self.request.user).only('timestamp', 'transaction_type', 'amount')
+        )
 
 
-class ActiveRentalsView(ListView):
-    model = Rental
-    template_name = 'cars/active_rentals.html'
-    context_object_name = 'rentals'
+class ActiveRentalsView(RentalHistoryView):
+    """Аренды, период которых включает текущий момент"""
+    template_name = 'active_rentals.html'
+
+    def get_rentals(self):
+        current = now()
+        return super().get_rentals().filter(start_time__lte=current, end_time__gt=current)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class TelemetryIngestView(View):
+    """
+    Приём GPS-точек пачкой: тело NDJSON (application/x-ndjson) или CSV (text/csv).
+    Трекеры авторизуются заголовком X-Telemetry-Token.
+    """
+
+    def post(self, request):
+        token = settings.TELEMETRY_INGEST_TOKEN
+        if not token or not constant_time_compare(request.headers.get("X-Telemetry-Token", ""), token):
+            return JsonResponse({"error": "forbidden"}, status=403)
+
+        fmt = "csv" if request.content_type == "text/csv" else "ndjson"
+        accepted, rejected = ingest(request, fmt=fmt, batch_size=settings.TELEMETRY_BATCH_SIZE)
+        return JsonResponse({"accepted": accepted, "rejected": rejected})
+
+
+class NearestView(View):
+    """Ближайшие объекты к точке ?lat=&lon=[&k=10][&radius=50] в JSON"""
 
     def get_queryset(self):
-        return Rental.objects.filter(user=self.request.user, is_active=True)
+        raise NotImplementedError
+
+    def get_predicate(self):
+        return None
+
+    def serialize(self, obj, distance):
+        raise NotImplementedError
+
+    def get(self, request):
+        form = NearbyForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({"errors": form.errors}, status=400)
+        found = nearest(
+            self.get_queryset(), form.cleaned_data["lat"], form.cleaned_data["lon"],
+            k=form.cleaned_data["k"], max_radius_km=form.cleaned_data["radius"],
+            predicate=self.get_predicate(),
+        )
+        return JsonResponse({"results": [self.serialize(obj, distance) for distance, obj in found]})
 
+
+class NearestCarsView(NearestView):
+    """Ближайшие машины, свободные прямо сейчас"""
+
+    def get_queryset(self):
+        return CarLocation.objects.filter(car__is_available=True).select_related("car")
+
+    def get_predicate(self):
+        current = now()
+        free = set(get_available_car_ids(current, current))
+        return lambda location: location.car_id in free
+
+    def serialize(self, location, distance):
+        return {
+            "id": location.car_id,
+            "brand": location.car.brand,
+            "model": location.car.model,
+            "type": location.car.type,
+            "price_per_hour": str(location.car.price_per_hour),
+            "latitude": float(location.latitude),
+            "longitude": float(location.longitude),
+            "distance_km": round(distance, 3),
+        }
+
+
+class NearestDealersView(NearestView):
+    def get_queryset(self):
+        return Dealer.objects.all()
+
+    def serialize(self, dealer, distance):
+        return {
+            "id": dealer.pk,
+            "name": dealer.name,
+            "address": dealer.address,
+            "latitude": float(dealer.latitude),
+            "longitude": float(dealer.longitude),
+            "distance_km": round(distance, 3),
+        }
+
+
+class QuoteView(View):
+    """Цены для набора машин на период: ?cars=1,2,3&start=...&end=... — вся страница поиска за один запрос"""
+
+    def get(self, request):
+        form = QuoteForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({"errors": form.errors}, status=400)
+        start, end = form.cleaned_data["start"], form.cleaned_data["end"]
+        quotes = pricing_engine.quote_car_ids(form.cleaned_data["cars"], start, end)
+        return JsonResponse({
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "quotes": {
+                car_id: {"hours": quote["hours"], "base": str(quote["base"]), "total": str(quote["total"]),
+                         "rules": quote["rules"]}
+                for car_id, quote in quotes.items()
+            },
+        })
+
+
+class RentalTrackMixin(LoginRequiredMixin):
+    """Трек доступен владельцу аренды и персоналу"""
+
+    def get_rental(self):
+        rentals = Rental.objects.all()
+        if not self.request.user.is_staff:
+            rentals = rentals.filter(user=self.request.user)
+        return get_object_or_404(rentals, pk=self.kwargs["pk"])
+
+
+class RentalTrackView(RentalTrackMixin, View):
+    """Сырые точки трека потоком NDJSON, без загрузки всей выборки в память"""
+    chunk_size = 1000
+
+    def get(self, request, pk):
+        rental = self.get_rental()
+        return StreamingHttpResponse(self.stream(rental), content_type="application/x-ndjson")
+
+    def stream(self, rental):
+        lines = []
+        for timestamp, latitude, longitude in iter_track(rental.pk):
+            lines.append(json.dumps({"t": timestamp.isoformat(), "lat": float(latitude), "lon": float(longitude)}))
+            if len(lines) >= self.chunk_size:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
+
+
+class RentalRouteView(RentalTrackMixin, View):
+    """Упрощённый маршрут: ?tolerance=<метры>&algorithm=dp|vw"""
+
+    def get(self, request, pk):
+        form = RouteForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({"errors": form.errors}, status=400)
+        rental = self.get_rental()
+        route = get_simplified_route(rental, form.cleaned_data["tolerance"], form.cleaned_data["algorithm"])
+        return JsonResponse({
+            "rental": rental.pk,
+            "algorithm": form.cleaned_data["algorithm"],
+            "tolerance": form.cleaned_data["tolerance"],
+            **route,
+        })
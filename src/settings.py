@@ -34,19 +34,26 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rental',
     'accounts',
 
     'guardian',
+    'django_prometheus',
 ]
 
+AUTH_USER_MODEL = 'accounts.UserModel'
+
 AUTHENTICATION_BACKENDS = (
     'django.contrib.auth.backends.ModelBackend', # this is default
     'guardian.backends.ObjectPermissionBackend',
 )
 
 MIDDLEWARE = [
+    'django_prometheus.middleware.PrometheusBeforeMiddleware',
+    # Запросы к базе, рендеринг и кеш по представлениям (rental/metrics.py)
+    'rental.metrics.ViewMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,6 +61,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'django_prometheus.middleware.PrometheusAfterMiddleware',
 ]
 
 ROOT_URLCONF = 'src.urls'
@@ -86,7 +94,8 @@ WSGI_APPLICATION = 'src.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # Обёртка django_prometheus: счётчики запросов и ошибок базы
+        'ENGINE': 'django_prometheus.db.backends.postgresql',
         'NAME': os.environ.get("DATABASE_NAME", "piko"),
         'USER': os.environ.get("DATABASE_USER", "postgres"),
         'PASSWORD': os.environ.get("DATABASE_PASSWORD", "password"),
@@ -95,6 +104,32 @@ DATABASES = {
     }
 }
 
+# Cache
+# Локальная память по умолчанию работает без внешних сервисов; для общего
+# кеша между процессами можно указать rental.metrics.FileBasedCache и каталог
+# в CACHE_LOCATION. Бэкенды rental.metrics считают попадания по представлениям.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get("CACHE_BACKEND", 'rental.metrics.LocMemCache'),
+        'LOCATION': os.environ.get("CACHE_LOCATION", 'ersultanchik'),
+    }
+}
+
+# Сколько живут счётчики главной (rental/stats.py), если их не сбросили сигналы
+HOME_STATS_TIMEOUT = int(os.environ.get("HOME_STATS_TIMEOUT", "300"))
+
+# Сколько права django-guardian на объекты живут в кеше (rental/permissions.py);
+# assign_perm/remove_perm сбрасывают их сразу
+OBJECT_PERMS_CACHE_TIMEOUT = int(os.environ.get("OBJECT_PERMS_CACHE_TIMEOUT", "60"))
+
+# С какого числа строк списки больших таблиц в админке показывают оценку
+# планировщика вместо COUNT(*) (rental/pagination.py)
+ADMIN_EXACT_COUNT_LIMIT = int(os.environ.get("ADMIN_EXACT_COUNT_LIMIT", "100000"))
+
+# Строк в порции серверного курсора при выгрузке данных (rental/exports.py)
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", "5000"))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -131,7 +166,71 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Загруженные файлы: фото машин, аватары и их копии (rental/images.py)
+MEDIA_URL = os.environ.get("MEDIA_URL", '/media/')
+MEDIA_ROOT = os.environ.get("MEDIA_ROOT", str(BASE_DIR / "media"))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Индекс занятости машин (rental/availability.py): как часто перестраивать
+# его из базы, чтобы подхватить брони, сделанные другими процессами
+AVAILABILITY_INDEX_TTL = int(os.environ.get("AVAILABILITY_INDEX_TTL", "300"))
+
+# Приём телеметрии (rental/telemetry.py): токен трекеров и размер пачки.
+# Пустой токен отключает HTTP-приём.
+TELEMETRY_INGEST_TOKEN = os.environ.get("TELEMETRY_INGEST_TOKEN", "")
+TELEMETRY_BATCH_SIZE = int(os.environ.get("TELEMETRY_BATCH_SIZE", "5000"))
+
+# Архив старых секций трекинга (rental/tracking.py, команда roll_tracking_partitions)
+TRIP_ARCHIVE_DIR = os.environ.get("TRIP_ARCHIVE_DIR", str(BASE_DIR / "archive" / "tracking"))
+TRIP_ARCHIVE_AFTER_MONTHS = int(os.environ.get("TRIP_ARCHIVE_AFTER_MONTHS", "6"))
+
+# Сколько хранить в кеше упрощённый маршрут закончившейся аренды (rental/routes.py)
+ROUTE_CACHE_TIMEOUT = int(os.environ.get("ROUTE_CACHE_TIMEOUT", str(24 * 60 * 60)))
+
+# Аналитика поездок и автоматические штрафы (rental/analytics.py, команда issue_trip_fines)
+TRIP_SPEED_LIMIT_KMH = float(os.environ.get("TRIP_SPEED_LIMIT_KMH", "110"))
+TRIP_SPEEDING_MIN_SECONDS = float(os.environ.get("TRIP_SPEEDING_MIN_SECONDS", "30"))
+TRIP_IDLE_SPEED_KMH = float(os.environ.get("TRIP_IDLE_SPEED_KMH", "3"))
+# Разрыв связи дольше этого не считается ни ездой, ни простоем
+TRIP_MAX_GAP_SECONDS = float(os.environ.get("TRIP_MAX_GAP_SECONDS", "300"))
+# Скорость выше — скачок GPS, отрезок отбрасывается
+TRIP_MAX_PLAUSIBLE_SPEED_KMH = float(os.environ.get("TRIP_MAX_PLAUSIBLE_SPEED_KMH", "300"))
+TRIP_GEOFENCE_RADIUS_KM = float(os.environ.get("TRIP_GEOFENCE_RADIUS_KM", "150"))
+# Центр геозоны для машин без дилера
+TRIP_GEOFENCE_CENTER = tuple(
+    float(value) for value in os.environ.get("TRIP_GEOFENCE_CENTER", "43.238949,76.889709").split(",")
+)
+TRIP_SPEEDING_FINE = os.environ.get("TRIP_SPEEDING_FINE", "5000")
+TRIP_GEOFENCE_FINE = os.environ.get("TRIP_GEOFENCE_FINE", "20000")
+
+# Сколько хранить фрагменты карточек и страниц машин; устаревшие вытесняются
+# сменой версии в ключе (rental/catalog_cache.py)
+CATALOG_FRAGMENT_TIMEOUT = int(os.environ.get("CATALOG_FRAGMENT_TIMEOUT", str(24 * 60 * 60)))
+
+# Асинхронные версии читающих страниц (rental/async_views.py). src/asgi.py
+# включает их по умолчанию, под WSGI остаются синхронные.
+ASYNC_VIEWS = os.environ.get("ASYNC_VIEWS", "False") == "True"
+# Потоков (и соединений с базой) для параллельных запросов async-страниц (rental/aio.py)
+ASYNC_DB_WORKERS = int(os.environ.get("ASYNC_DB_WORKERS", "4"))
+
+# Копии изображений (rental/images.py): потоков обработки; синхронно — сразу после коммита, без пула
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "2"))
+IMAGE_PROCESSING_SYNC = os.environ.get("IMAGE_PROCESSING_SYNC", "False") == "True"
+
+# Запросы дольше этого пишутся в лог rental.slow_requests вместе с SQL (rental/metrics.py); 0 — выключено
+SLOW_REQUEST_SECONDS = float(os.environ.get("SLOW_REQUEST_SECONDS", "1.0"))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'rental.slow_requests': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
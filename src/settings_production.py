@@ -0,0 +1,38 @@
+"""
+Профиль production: DJANGO_SETTINGS_MODULE=src.settings_production.
+
+Запускается под gunicorn с несколькими процессами (gunicorn.conf.py).
+Отличия от src/settings.py:
+- DEBUG выключен, ALLOWED_HOSTS из окружения;
+- запрос не платит за подключение к PostgreSQL (TCP, аутентификация,
+  старт backend-процесса): под WSGI соединения постоянные, под ASGI
+  (режим Docker-образа) их переиспользует pgbouncer между Django и базой;
+- общий для процессов кеш: версии каталога, счётчики главной и правила
+  цен сдвигаются сигналами в одном процессе, а читаются во всех.
+Статику из STATIC_ROOT (manage.py collectstatic) отдаёт фронтовой прокси.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import ASYNC_VIEWS, BASE_DIR, CACHES, DATABASES, os
+
+DEBUG = os.environ.get("DEBUG", "False") == "True"
+ALLOWED_HOSTS = [host for host in os.environ.get("DJANGO_ALLOWED_HOSTS", "localhost,127.0.0.1").split(",") if host]
+
+# Под WSGI каждый поток воркера держит одно соединение и переиспользует его.
+# Под ASGI поток запроса живёт один запрос, постоянное соединение там
+# только утекало бы, поэтому 0 (см. документацию Django о CONN_MAX_AGE), а
+# DATABASE_HOST указывает на pgbouncer в сессионном режиме
+# (docker-compose.yml): подключение к нему локальное и дешёвое, а
+# соединения с PostgreSQL остаются открытыми в его пуле. Транзакционный
+# режим не подходит — серверные курсоры QuerySet.iterator() живут дольше
+# транзакции.
+DATABASES["default"]["CONN_MAX_AGE"] = 0 if ASYNC_VIEWS else int(os.environ.get("DATABASE_CONN_MAX_AGE", "600"))
+# Соединение проверяется в начале запроса: после рестарта базы или
+# разрыва воркер переподключается вместо ошибки в первом запросе
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+
+CACHES["default"] = {
+    "BACKEND": os.environ.get("CACHE_BACKEND", "rental.metrics.FileBasedCache"),
+    "LOCATION": os.environ.get("CACHE_LOCATION", "/tmp/ersultanchik-cache"),
+}
+
+STATIC_ROOT = os.environ.get("STATIC_ROOT", str(BASE_DIR / "staticfiles"))